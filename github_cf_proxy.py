@@ -3,283 +3,6540 @@
 GitHub Cloudflare 全自动加速配置工具
 License: MIT
 Repository: WaZixwx/github-proxy.git
-Dependencies: Python 3.6+ (仅使用Python标准库，无第三方依赖)
+Dependencies: Python 3.7+ (仅使用Python标准库，无第三方依赖)
 """
 
+from __future__ import annotations
+
 import os
 import sys
 import json
-import subprocess
 import shutil
 import platform
-import socket
-import urllib.request
-import threading
+import re
+import math
+import struct
+import importlib
+import contextlib
+from datetime import datetime, timezone
 import time
-import ctypes
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
+
+
+class _LazyModule:
+    """按需导入的模块代理：首次访问属性时才真正导入，并把全局名替换为真实模块
+
+    开机静默应用、status 等命令不涉及网络/子进程/线程，延迟导入可省去大部分启动耗时。
+    包（如 http、urllib）保留代理，访问子模块属性时再导入对应子模块。
+    """
+
+    def __init__(self, name: str, package: bool = False):
+        self._name = name
+        self._package = package
+
+    def __getattr__(self, attr: str):
+        module = importlib.import_module(self._name)
+        if self._package:
+            if not hasattr(module, attr):
+                importlib.import_module(f"{self._name}.{attr}")
+        else:
+            globals()[self._name.rpartition(".")[2]] = module
+        return getattr(module, attr)
+
+
+subprocess = _LazyModule("subprocess")
+socket = _LazyModule("socket")
+asyncio = _LazyModule("asyncio")
+ssl = _LazyModule("ssl")
+random = _LazyModule("random")
+ipaddress = _LazyModule("ipaddress")
+tempfile = _LazyModule("tempfile")
+socketserver = _LazyModule("socketserver")
+signal = _LazyModule("signal")
+statistics = _LazyModule("statistics")
+argparse = _LazyModule("argparse")
+mmap = _LazyModule("mmap")
+hashlib = _LazyModule("hashlib")
+gzip = _LazyModule("gzip")
+threading = _LazyModule("threading")
+ctypes = _LazyModule("ctypes")
+futures = _LazyModule("concurrent.futures")
+urllib = _LazyModule("urllib", package=True)
+http = _LazyModule("http", package=True)
+
+# ========== 全局常量 ==========
+CONFIG_FILE = Path.home() / ".github_cf_proxy_config.json"
+SCRIPT_PATH = Path(__file__).resolve()
+OS_TYPE = platform.system().lower()
+# 测速配置：走加速代理的GitHub小文件（仅10KB以内，无流量负担）
+SPEED_TEST_URL = "/raw/octocat/Hello-World/master/README"
+# 状态栏刷新间隔（秒）
+STATUS_REFRESH_INTERVAL = 2
+# 测速超时时间（秒）
+TEST_TIMEOUT = 5
+# 测量数据时序库（定长记录环形文件，开机静默模式直接读取排名，无需先测速）
+METRICS_FILE = Path.home() / ".github_cf_proxy_metrics.bin"
+# 时序库容量（条），每条10字节，约6MB；全部序列共用这一个环：只有单个序列按2秒采样时约可保留两周，
+# 守护进程每轮为每个节点写入多项分阶段指标，节点越多实际保留时长越短（report 窗口超出保留范围时会提示）
+METRICS_CAPACITY = 600000
+# 时序库最多序列数（节点 × 指标）
+METRICS_MAX_SERIES = 256
+# 节点评分平滑系数（EWMA，越大越看重最近一次测速）
+RANK_EWMA_ALPHA = 0.3
+# 节点评分取最近多少个样本做EWMA，以及样本的最大时间窗口（秒）
+RANK_EWMA_SAMPLES = 50
+RANK_WINDOW = 7 * 24 * 3600
+# 节点评分参考传输量：评分 = 延迟 + 传输该字节数的预估耗时（秒）
+RANK_REF_BYTES = 1024 * 1024
+# 连续失败达到该次数的节点不参与选优
+RANK_MAX_FAILS = 3
+# 全局Git配置备份文件后缀（本工具首次写入前备份，用于回滚）
+GIT_CONFIG_BACKUP_SUFFIX = ".cfproxy.bak"
+# Cloudflare 公布的 IPv4 段（优选IP扫描的默认候选）
+CF_DEFAULT_CANDIDATES = [
+    "173.245.48.0/20", "103.21.244.0/22", "103.22.200.0/22", "103.31.4.0/22",
+    "141.101.64.0/18", "108.162.192.0/18", "190.93.240.0/20", "188.114.96.0/20",
+    "197.234.240.0/22", "198.41.128.0/17", "162.158.0.0/15", "104.16.0.0/13",
+    "104.24.0.0/14", "172.64.0.0/13", "131.0.72.0/22",
+]
+# 每个网段随机抽样的IP数量
+EDGE_SAMPLE_PER_CIDR = 4
+# 优选IP扫描并发数
+EDGE_SCAN_WORKERS = 32
+# 保留的优选IP数量
+EDGE_TOP_N = 5
+# 优选IP定期重扫间隔（秒）
+EDGE_RESCAN_INTERVAL = 1800
+# 固定IP健康检查间隔（秒）
+EDGE_CHECK_INTERVAL = 30
+# 固定IP的握手耗时超过固定时基线的倍数即视为劣化
+EDGE_DEGRADE_RATIO = 2.0
+# 分阶段测速路由：(路由名, 代理路径)，覆盖 github.com / raw / gist 三条链路
+PROBE_ROUTES = [
+    ("github.com", "/octocat/Hello-World/info/refs?service=git-upload-pack"),
+    ("raw", SPEED_TEST_URL),
+    ("gist", "/gist/octocat/6cad326836d38bd3a7ae/raw"),
+]
+# 默认主机路由表：上游主机 → Worker路径前缀 / 节点选择 / 逐主机测速路径
+# endpoint 取值：proxy（当前最优节点）、auto（逐主机测速，代理更快才走代理）、direct（直连）、或指定Worker域名
+DEFAULT_ROUTES = {
+    "github.com": {"prefix": "/", "endpoint": "proxy",
+                   "probe": "/octocat/Hello-World/info/refs?service=git-upload-pack"},
+    "raw.githubusercontent.com": {"prefix": "/raw/", "endpoint": "proxy",
+                                  "probe": "/octocat/Hello-World/master/README"},
+    "gist.githubusercontent.com": {"prefix": "/gist/", "endpoint": "proxy",
+                                   "probe": "/octocat/6cad326836d38bd3a7ae/raw"},
+    "gist.github.com": {"prefix": "/gist-web/", "endpoint": "proxy", "probe": "/octocat"},
+    "codeload.github.com": {"prefix": "/codeload/", "endpoint": "auto",
+                            "probe": "/octocat/Hello-World/tar.gz/refs/heads/master"},
+    "objects.githubusercontent.com": {"prefix": "/objects/", "endpoint": "auto", "probe": "/"},
+    "release-assets.githubusercontent.com": {"prefix": "/release-assets/", "endpoint": "auto", "probe": "/"},
+    "api.github.com": {"prefix": "/api/", "endpoint": "auto", "probe": "/rate_limit"},
+    "media.githubusercontent.com": {"prefix": "/media/", "endpoint": "auto", "probe": "/"},
+    "github-cloud.githubusercontent.com": {"prefix": "/lfs-cloud/", "endpoint": "auto", "probe": "/"},
+    "github-cloud.s3.amazonaws.com": {"prefix": "/lfs-s3/", "endpoint": "auto", "probe": "/"},
+}
+# 逐主机测速：直连需比代理快出该倍数才改为直连（抑制测速抖动）
+ROUTE_PROXY_BIAS = 1.2
+# Worker 脚本中路由表的起止标记（用于按配置生成路由表）
+WORKER_ROUTES_BEGIN = "// ========== 路由表 BEGIN"
+WORKER_ROUTES_END = "// ========== 路由表 END"
+# 直连对照节点标识
+DIRECT_ENDPOINT = "direct"
+# 分阶段测速最大并发数
+PROBE_CONCURRENCY = 16
+# 分阶段测速单次下载上限（字节）
+PROBE_RANGE_BYTES = 10240
+# 带宽测速文件（需支持 Range，体积足够大）
+BANDWIDTH_TEST_PATH = "/raw/torvalds/linux/master/MAINTAINERS"
+# 带宽测速单轮字节预算（默认值，可在配置文件 bandwidth_budget 中调整）
+BANDWIDTH_BUDGET = 4 * 1024 * 1024
+# 带宽测速起始分片大小，每轮翻倍直到传输阶段占主导
+BANDWIDTH_START_BYTES = 64 * 1024
+# 传输阶段耗时占单次请求耗时的比例达到该值即视为“传输占主导”
+BANDWIDTH_TRANSFER_DOMINANCE = 0.8
+# 传输占主导后至少采集的样本数
+BANDWIDTH_MIN_SAMPLES = 3
+# 带宽测速的分片返回 5xx 时最多连续重试的次数（偶发失败的节点仍能测出带宽）
+BANDWIDTH_MAX_RETRIES = 5
+# 单次请求传输阶段计时误差（秒，调度与计时器分辨率），带宽置信区间至少包含它带来的误差
+BANDWIDTH_TIMING_ERROR = 0.001
+# 双侧95%置信区间的 t 分位数（自由度 1..10），更大自由度按 Cornish-Fisher 展开近似
+T_QUANTILE_95 = (12.71, 4.30, 3.18, 2.78, 2.57, 2.45, 2.36, 2.31, 2.26, 2.23)
+# 状态栏后台带宽测速间隔（秒），延迟测速仍按 STATUS_REFRESH_INTERVAL 刷新
+BANDWIDTH_PROBE_INTERVAL = 300
+# Git trace2 事件输出目录（每个git进程一个文件）与 Unix socket 路径
+TRACE2_DIR = Path.home() / ".github_cf_proxy_trace2"
+TRACE2_SOCKET = Path.home() / ".github_cf_proxy_trace2.sock"
+# 未结束的trace2文件超过该时长（秒）视为残留并清理
+TRACE2_STALE_SECONDS = 3600
+# trace2 目录收集间隔（秒）
+TRACE2_COLLECT_INTERVAL = 30
+# trace2 目录中事件文件数上限：超出时 apply 走完整流程收集，仍超出则删除最旧的文件（没有守护进程/状态栏收集时防止无限增长）
+TRACE2_MAX_FILES = 2000
+# Git真实传输记录文件（JSON Lines）及保留条数
+TELEMETRY_FILE = Path.home() / ".github_cf_proxy_telemetry.jsonl"
+TELEMETRY_MAX_RECORDS = 5000
+# 记录文件超过该大小（字节）时才裁剪到 TELEMETRY_MAX_RECORDS 条，避免每次追加都重读整个文件
+TELEMETRY_TRIM_BYTES = 2 * 1024 * 1024
+# 统计的Git操作
+TELEMETRY_OPS = ("clone", "fetch", "pull", "push")
+# 状态栏/报告统计的时间窗口（秒）
+TELEMETRY_WINDOW = 24 * 3600
+# 守护进程默认 /metrics 监听地址、测速周期（秒）与 auto 主机路由复测间隔（秒）
+DAEMON_LISTEN = "127.0.0.1:9477"
+DAEMON_INTERVAL = 60
+DAEMON_ROUTE_CHECK_INTERVAL = 1800
+# 守护进程对全部节点做带宽测速的间隔（秒），比状态栏更长以控制常驻流量
+DAEMON_BANDWIDTH_INTERVAL = 3600
+# 熔断器：连续异常N次断开（摘除规则），断开后冷却（秒，半开失败时翻倍至上限），半开连续健康N次恢复
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RECOVERY_THRESHOLD = 5
+BREAKER_COOLDOWN = 120
+BREAKER_MAX_COOLDOWN = 1800
+# 代理耗时超过直连该倍数视为劣化；恢复时需回到 ROUTE_PROXY_BIAS 以内（两个阈值构成滞回区间）
+BREAKER_DEGRADE_RATIO = 2.0
+# 存在异常节点时守护进程的加快测速周期（秒）
+BREAKER_PROBE_INTERVAL = 10
+# 新节点评分需优于当前节点该倍数才切换，避免评分接近的节点来回切换
+ENDPOINT_SWITCH_RATIO = 1.25
+# 熔断/切换事件日志（JSON Lines）、保留条数，以及触发裁剪的文件大小（字节，约为保留条数的两倍以上，避免每次追加都重写）
+FAILOVER_LOG_FILE = Path.home() / ".github_cf_proxy_failover.jsonl"
+FAILOVER_MAX_RECORDS = 2000
+FAILOVER_TRIM_BYTES = 1024 * 1024
+# A/B 基准测试默认工作负载：仓库、分支、raw 文件、重复次数、单次操作超时（秒）
+BENCHMARK_REPO = "octocat/Hello-World"
+BENCHMARK_REF = "master"
+BENCHMARK_FILE = "README"
+BENCHMARK_REPEAT = 3
+BENCHMARK_TIMEOUT = 600
+# Git传输性能方案：名称 → 说明与写入全局配置的选项（切换/关闭时恢复写入前的原值）
+PERF_PROFILES = {
+    "large-monorepo": {
+        "description": "大仓库：协议v2按需协商引用、HTTP/2、大推送缓冲，多线程打包",
+        "settings": {
+            "protocol.version": "2",
+            "http.version": "HTTP/2",
+            "http.postBuffer": "524288000",
+            "http.maxRequests": "8",
+            "core.compression": "1",
+            "pack.threads": "0",
+            "fetch.parallel": "4",
+            "submodule.fetchJobs": "4",
+        },
+    },
+    "many-small-repos": {
+        "description": "大量小仓库/子模块：协议v2、HTTP/2，提高并发请求与并行拉取数",
+        "settings": {
+            "protocol.version": "2",
+            "http.version": "HTTP/2",
+            "http.maxRequests": "16",
+            "pack.threads": "0",
+            "fetch.parallel": "8",
+            "submodule.fetchJobs": "8",
+        },
+    },
+    "slow-link": {
+        "description": "慢速/高丢包链路：最高压缩减少推送流量，降低并发，低速超时改为更宽松的判定",
+        "settings": {
+            "protocol.version": "2",
+            "http.version": "HTTP/1.1",
+            "http.postBuffer": "157286400",
+            "http.maxRequests": "2",
+            "core.compression": "9",
+            "pack.threads": "0",
+            "fetch.parallel": "1",
+            "submodule.fetchJobs": "1",
+            "http.lowSpeedLimit": "1000",
+            "http.lowSpeedTime": "60",
+        },
+    },
+}
+# 性能方案前后对比测量的操作
+PERF_MEASURE_OPS = ["ls-remote", "shallow-clone", "clone"]
+# 自建中转（Python 版 workers.js）：默认监听地址、并发请求上限、每个上游主机的空闲长连接数、超时（秒）、转发块大小
+RELAY_LISTEN = "127.0.0.1:8787"
+RELAY_CONCURRENCY = 64
+RELAY_POOL_SIZE = 8
+RELAY_TIMEOUT = 30
+RELAY_IDLE_TIMEOUT = 60
+RELAY_CHUNK_SIZE = 64 * 1024
+# 本地内容缓存（raw/gist/codeload）：目录、默认总大小上限（字节）、默认监听地址、索引保存间隔（秒）、可缓存的上游主机
+CACHE_DIR = Path.home() / ".github_cf_proxy_cache"
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+CACHE_LISTEN = "127.0.0.1:8788"
+CACHE_SAVE_INTERVAL = 1.0
+CACHE_HOSTS = ("raw.githubusercontent.com", "gist.githubusercontent.com", "codeload.github.com")
+# 分段并行下载：默认连接数、最小分段大小、单段重试次数、超时（秒）、断点状态保存间隔（秒）、状态文件后缀
+DOWNLOAD_CONNECTIONS = 8
+DOWNLOAD_MIN_SEGMENT = 1024 * 1024
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_STATE_INTERVAL = 1.0
+DOWNLOAD_STATE_SUFFIX = ".cfdl.json"
+# 多仓库同步：默认最大并发、出错重试次数、退避基数（秒，逐次翻倍并加随机抖动）、单个git命令超时（秒）
+SYNC_JOBS = 8
+SYNC_RETRIES = 3
+SYNC_BACKOFF = 2.0
+SYNC_TIMEOUT = 3600
+# 同步期间复测节点健康的间隔（秒）；并发上限两次减半之间的最短间隔（秒），避免同一波错误连续减半
+SYNC_PROBE_INTERVAL = 15
+SYNC_DECREASE_HOLD = 5
+# 各仓库上次同步后的对象库大小（用于大仓库优先排序）
+SYNC_HISTORY_FILE = Path.home() / ".github_cf_proxy_sync.json"
+# 本地裸镜像缓存：目录、默认总大小上限（字节，超出按最近使用淘汰）、后台增量刷新间隔（秒）
+MIRROR_DIR = Path.home() / ".github_cf_proxy_mirrors"
+MIRROR_MAX_BYTES = 20 * 1024 ** 3
+MIRROR_REFRESH_INTERVAL = 600
+# Git LFS 批量接口路径后缀（中转/Worker 把其中的对象下载地址改写为经节点的地址）
+LFS_BATCH_SUFFIX = "/info/lfs/objects/batch"
+# LFS 并发传输数调优：候选并发档位、每条连接下载的字节数、取聚合吞吐达到最优值该比例的最小档位、提升不足该倍数即停止加档
+LFS_TRANSFER_LEVELS = (2, 4, 8, 16, 32)
+LFS_TUNE_BYTES = 512 * 1024
+LFS_TUNE_RATIO = 0.9
+LFS_TUNE_MIN_GAIN = 1.1
+# 经节点传输时放宽的 LFS 选项（连接空闲超时秒数、单对象重试次数）
+LFS_SETTINGS = {"lfs.activitytimeout": "60", "lfs.transfer.maxretries": "10"}
+# github.com 上按地址设置、需同步映射到代理地址的 LFS 选项
+LFS_URL_OPTIONS = ("access", "locksverify")
+# github.com 的 SSH 形式地址前缀（开启 SSH 改写后与 https://github.com/ 一同经节点以 HTTPS 拉取）
+GITHUB_SSH_PREFIXES = ("git@github.com:", "ssh://git@github.com/")
+# clone 策略优化：各策略的 git clone 参数（sparse 克隆后再按指定目录执行 sparse-checkout set）
+CLONE_STRATEGIES = {
+    "full": [],
+    "shallow": ["--depth", "1"],
+    "blobless": ["--filter=blob:none"],
+    "treeless": ["--filter=tree:0"],
+    "sparse": ["--filter=blob:none", "--sparse"],
+}
+# 各用途按偏好排列的候选策略（越靠前本地对象越完整，之后按需拉取越少）
+CLONE_INTENTS = {
+    "build": ("full", "blobless", "shallow"),
+    "browse": ("full", "blobless", "treeless"),
+    "ci": ("shallow",),
+}
+# 无历史记录时各策略接收数据量相对仓库大小（GitHub API size）的先验比例
+CLONE_PRIOR_RATIOS = {"full": 1.0, "shallow": 0.1, "blobless": 0.45, "treeless": 0.25, "sparse": 0.3}
+# 预计耗时（秒）不超过该值的最靠前候选即被选用，否则选预计耗时最短的候选
+CLONE_TIME_BUDGET = 60
+# 未测得吞吐时按该值估算（B/s）
+CLONE_DEFAULT_BPS = 2 * 1024 * 1024
+# 某策略至少有该数量的历史样本才用历史比例代替先验比例；吞吐取同一节点最近若干次 clone 的中位数
+CLONE_MIN_HISTORY = 3
+CLONE_THROUGHPUT_SAMPLES = 10
+# clone 历史（JSON Lines）及保留条数
+CLONE_HISTORY_FILE = Path.home() / ".github_cf_proxy_clone.jsonl"
+CLONE_MAX_RECORDS = 2000
+# 上次成功同步规则时各输入文件的指纹，未变化时 apply/status/--silent 直接返回
+APPLY_STATE_FILE = Path.home() / ".github_cf_proxy_applied.json"
+# 命令行空操作（规则已是最新时的 apply/status）启动耗时目标（毫秒，不含解释器自身启动）
+STARTUP_BUDGET_MS = 100
+# 启动耗时基准每项测量次数
+STARTUP_BENCH_REPEAT = 20
+# 模拟链路：虚拟文件大小与写出分块（字节）
+SIM_FILE_SIZE = 64 * 1024 * 1024
+SIM_CHUNK = 8 * 1024
+# 模拟链路基准默认每项测量轮数与随机种子
+SIM_ROUNDS = 3
+SIM_SEED = 1
+# 回归门限：干净链路的带宽中位相对误差、首字节耗时中位误差（ms）、带宽95%置信区间的最低覆盖率
+SIM_MAX_BANDWIDTH_ERROR = 0.15
+SIM_MAX_TTFB_ERROR_MS = 15
+SIM_MIN_CI_COVERAGE = 0.9
+# 模拟链路限速允许补回的排程落后（秒），需小于各场景请求间的最短空闲（首字节延迟下限 20 ms）
+SIM_PACE_SLACK = 0.01
+# 调用剖析开关（环境变量，效果同 --profile[=trace.json] / --cprofile=目录）：1 输出汇总表，*.json 另写 Chrome trace 文件
+PROFILE_ENV = "GITHUB_CF_PROXY_PROFILE"
+CPROFILE_ENV = "GITHUB_CF_PROXY_CPROFILE"
+# 调用剖析保留的最多事件数（trace 文件用，汇总统计不受限）及每个调用点用于计算分位数的最多样本数
+PROFILE_MAX_EVENTS = 200000
+PROFILE_MAX_SAMPLES = 10000
+# git 输出中表示 Worker/上游 5xx 的特征，以及可重试的瞬时网络错误
+SYNC_SERVER_ERROR = re.compile(r"(?:HTTP|returned error:?) 5\d\d")
+SYNC_TRANSIENT_ERROR = re.compile(r"early EOF|unexpected disconnect|RPC failed|Connection reset|timed out|"
+                                  r"Failed to connect|Could not resolve host|transfer closed|Empty reply|"
+                                  r"SSL|TLS|gnutls", re.I)
+# 每用户共享测速代理：状态文件、主控锁文件
+BROKER_STATE_FILE = Path.home() / ".github_cf_proxy_broker.json"
+BROKER_LOCK_FILE = Path.home() / ".github_cf_proxy_broker.lock"
+# 自适应测速间隔（秒）：失败后回到最小值，结果稳定时逐次翻倍至最大值，无活跃会话时使用空闲间隔
+BROKER_MIN_INTERVAL = STATUS_REFRESH_INTERVAL
+BROKER_MAX_INTERVAL = 60
+BROKER_IDLE_INTERVAL = 300
+# 延迟变化不超过该比例视为稳定
+BROKER_STABLE_RATIO = 0.2
+# 会话心跳超时（秒），超时视为会话已退出
+BROKER_SESSION_TTL = 30
+# 每日经 Worker 发出的测速请求预算（Cloudflare 免费版每日 10 万次请求，需给真实 Git 流量留足余量）
+BROKER_DAILY_BUDGET = 20000
+
+
+def _format_speed(speed_bps: float) -> str:
+    """格式化速率单位"""
+    if speed_bps < 1024:
+        return f"{speed_bps:.2f} B/s"
+    elif speed_bps < 1024 * 1024:
+        return f"{speed_bps/1024:.2f} KB/s"
+    return f"{speed_bps/(1024*1024):.2f} MB/s"
+
+
+def _percentile(sorted_values: List[float], p: float) -> float:
+    """已排序序列的分位数（最近秩法）"""
+    rank = min(len(sorted_values), max(1, math.ceil(p / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def _t_quantile_95(df: int) -> float:
+    """自由度为 df 的 t 分布双侧95%分位数"""
+    if df <= len(T_QUANTILE_95):
+        return T_QUANTILE_95[max(df, 1) - 1]
+    return 1.96 + 2.37 / df
+
+
+def _normalize_domain(domain: str) -> str:
+    """规范化Worker域名：补全https://前缀，去掉末尾斜杠"""
+    domain = domain.strip()
+    if not domain:
+        return ""
+    if not domain.startswith("http"):
+        domain = "https://" + domain
+    return domain.rstrip("/")
+
+
+def _domain_host(domain: str) -> str:
+    """从Worker域名中提取主机名"""
+    return domain.replace("https://", "").replace("http://", "").split("/")[0]
+
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 无 fcntl，多进程并发写入时不加锁
+    fcntl = None
+
+
+class MetricStore:
+    """定长记录环形时序库（mmap）：按 节点+指标 分序列，O(1) 追加，窗口分位数 / EWMA 查询
+
+    文件布局：64字节文件头 | 序列名表（METRICS_MAX_SERIES × 128字节）| 环形记录区。
+    记录为 <时间戳uint32, 序列号uint16, 值float32>，共10字节，按追加顺序（即时间顺序）存放。
+    """
+
+    MAGIC = b"GCPMTS01"
+    HEADER = struct.Struct("<8sIIII")
+    RECORD = struct.Struct("<IHf")
+    NAME_SIZE = 128
+    HEADER_SIZE = 64
+
+    def __init__(self, path: Path = METRICS_FILE, capacity: int = METRICS_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        self._records_offset = self.HEADER_SIZE + METRICS_MAX_SERIES * self.NAME_SIZE
+        self._series: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._file = None
+        self._mm = None
+        self._open()
+
+    def _open(self):
+        size = self._records_offset + self.capacity * self.RECORD.size
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "a+b")
+        # 检查与重建在文件锁内进行：否则两个进程同时打开新文件时，
+        # 后检查的一方可能把另一方刚初始化（甚至已追加记录）的文件截断
+        with self._locked():
+            self._file.seek(0)
+            magic, _, capacity, _, _ = self.HEADER.unpack(
+                self._file.read(self.HEADER.size).ljust(self.HEADER.size, b"\0"))
+            if magic != self.MAGIC or capacity != self.capacity or os.path.getsize(self.path) != size:
+                # 新文件或格式/容量不一致：重建
+                self._file.truncate(0)
+                self._file.truncate(size)
+                self._file.flush()
+            self._mm = mmap.mmap(self._file.fileno(), size)
+            if self._mm[:8] != self.MAGIC:
+                self.HEADER.pack_into(self._mm, 0, self.MAGIC, 0, self.capacity, 0, 0)
+        self._load_series()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+            self._mm = self._file = None
+
+    def _locked(self):
+        """跨进程写锁（文件锁）+ 进程内锁"""
+        store = self
+
+        class _Guard:
+            def __enter__(self):
+                store._lock.acquire()
+                if fcntl is not None:
+                    fcntl.flock(store._file.fileno(), fcntl.LOCK_EX)
+
+            def __exit__(self, *exc):
+                if fcntl is not None:
+                    fcntl.flock(store._file.fileno(), fcntl.LOCK_UN)
+                store._lock.release()
+
+        return _Guard()
+
+    def _header(self) -> Tuple[int, int, int]:
+        """读取 (head, count, 序列数)，每次查询都重新读取以看到其他进程的追加"""
+        _, nseries, _, head, count = self.HEADER.unpack_from(self._mm, 0)
+        return head, count, nseries
+
+    def _load_series(self):
+        _, _, nseries = self._header()
+        for sid in range(len(self._series), nseries):
+            raw = self._mm[self.HEADER_SIZE + sid * self.NAME_SIZE:self.HEADER_SIZE + (sid + 1) * self.NAME_SIZE]
+            self._series[raw.rstrip(b"\0").decode("utf-8", "replace")] = sid
+
+    def _series_id(self, endpoint: str, metric: str, create: bool) -> Optional[int]:
+        name = f"{endpoint}|{metric}"
+        if name not in self._series:
+            self._load_series()
+        if name in self._series or not create:
+            return self._series.get(name)
+        encoded = name.encode("utf-8")[:self.NAME_SIZE]
+        with self._locked():
+            self._load_series()
+            if name in self._series:
+                return self._series[name]
+            head, count, nseries = self._header()
+            if nseries >= METRICS_MAX_SERIES:
+                return None
+            offset = self.HEADER_SIZE + nseries * self.NAME_SIZE
+            self._mm[offset:offset + self.NAME_SIZE] = encoded.ljust(self.NAME_SIZE, b"\0")
+            self.HEADER.pack_into(self._mm, 0, self.MAGIC, nseries + 1, self.capacity, head, count)
+            self._series[name] = nseries
+            return nseries
+
+    def append(self, endpoint: str, metric: str, value: float, ts: Optional[float] = None):
+        """追加一个样本（环满后覆盖最旧的记录）"""
+        sid = self._series_id(endpoint, metric, create=True)
+        if sid is None:
+            return
+        with self._locked():
+            head, count, nseries = self._header()
+            self.RECORD.pack_into(self._mm, self._records_offset + head * self.RECORD.size,
+                                  int(ts if ts is not None else time.time()), sid, float(value))
+            self.HEADER.pack_into(self._mm, 0, self.MAGIC, nseries, self.capacity,
+                                  (head + 1) % self.capacity, min(count + 1, self.capacity))
+
+    def _ts_at(self, head: int, count: int, logical: int) -> int:
+        physical = (head - count + logical) % self.capacity
+        return struct.unpack_from("<I", self._mm, self._records_offset + physical * self.RECORD.size)[0]
+
+    def _iter_range(self, head: int, count: int, start: int, end: int):
+        """按时间顺序遍历逻辑区间 [start, end) 的记录（环回处拆成两段连续读取）"""
+        first = (head - count + start) % self.capacity
+        length = end - start
+        segments = [(first, min(length, self.capacity - first))]
+        if segments[0][1] < length:
+            segments.append((0, length - segments[0][1]))
+        for physical, n in segments:
+            offset = self._records_offset + physical * self.RECORD.size
+            yield from self.RECORD.iter_unpack(self._mm[offset:offset + n * self.RECORD.size])
+
+    def window(self, endpoint: str, metric: str, seconds: float) -> List[Tuple[int, float]]:
+        """时间窗口内某序列的全部样本 [(ts, value)]，二分定位窗口起点"""
+        sid = self._series_id(endpoint, metric, create=False)
+        if sid is None:
+            return []
+        head, count, _ = self._header()
+        since = time.time() - seconds
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts_at(head, count, mid) < since:
+                lo = mid + 1
+            else:
+                hi = mid
+        return [(ts, value) for ts, rec_sid, value in self._iter_range(head, count, lo, count) if rec_sid == sid]
+
+    def last(self, endpoint: str, metric: str, n: int, seconds: float = RANK_WINDOW,
+             max_scan: int = 20000) -> List[Tuple[int, float]]:
+        """某序列最近 n 个样本（按时间顺序），从环尾向前分块扫描，最多扫描 max_scan 条"""
+        sid = self._series_id(endpoint, metric, create=False)
+        if sid is None:
+            return []
+        head, count, _ = self._header()
+        since = time.time() - seconds
+        found: List[Tuple[int, float]] = []
+        end, block = count, 512
+        while end > 0 and len(found) < n and count - end < max_scan:
+            start = max(end - block, 0)
+            chunk = [(ts, v) for ts, rec_sid, v in self._iter_range(head, count, start, end) if rec_sid == sid]
+            found = chunk + found
+            if chunk and chunk[0][0] < since:
+                break
+            end = start
+        return [item for item in found if item[0] >= since][-n:]
+
+    def percentiles(self, endpoint: str, metric: str, seconds: float,
+                    ps: Tuple[int, ...] = (50, 95, 99)) -> Dict[int, float]:
+        """窗口内分位数（最近秩法）"""
+        values = sorted(v for _, v in self.window(endpoint, metric, seconds))
+        if not values:
+            return {}
+        return {p: _percentile(values, p) for p in ps}
+
+    def ewma(self, endpoint: str, metric: str, alpha: float = RANK_EWMA_ALPHA,
+             n: int = RANK_EWMA_SAMPLES, seconds: float = RANK_WINDOW) -> Optional[float]:
+        """最近 n 个样本的指数加权移动平均"""
+        value = None
+        for _, sample in self.last(endpoint, metric, n, seconds):
+            value = sample if value is None else alpha * sample + (1 - alpha) * value
+        return value
+
+    def oldest(self) -> Optional[int]:
+        """环已写满时最旧记录的时间戳（更早的数据已被覆盖）；未写满时为 None"""
+        head, count, _ = self._header()
+        return self._ts_at(head, count, 0) if count >= self.capacity else None
+
+    def keys(self) -> List[Tuple[str, str]]:
+        """全部序列 [(节点, 指标)]"""
+        self._load_series()
+        return [tuple(name.rsplit("|", 1)) for name in self._series]
+
+
+class EndpointPool:
+    """多Worker节点池：测速结果写入时序库，按EWMA平滑后的延迟/带宽评分排名"""
+
+    def __init__(self, endpoints: List[str], store: MetricStore):
+        # 与调用方共享同一列表，增删节点无需同步
+        self.endpoints = endpoints
+        self.store = store
+
+    def update(self, endpoint: str, delay: int, speed_bps: float):
+        """写入一次测速结果（延迟<0表示失败，速率为0表示本轮未测带宽）"""
+        self.store.append(endpoint, "fail", 1.0 if delay < 0 else 0.0)
+        if delay >= 0:
+            self.store.append(endpoint, "delay", delay)
+        if speed_bps > 0:
+            self.store.append(endpoint, "bandwidth", speed_bps)
+
+    def stat(self, endpoint: str) -> dict:
+        """节点平滑统计：delay(ms) / ttfb(ms) / speed(B/s) / fails（最近连续失败次数）/ error_rate（带宽测速请求失败率）"""
+        fails = 0
+        for _, failed in reversed(self.store.last(endpoint, "fail", RANK_MAX_FAILS)):
+            if not failed:
+                break
+            fails += 1
+        return {"delay": self.store.ewma(endpoint, "delay"), "ttfb": self.store.ewma(endpoint, "ttfb"),
+                "speed": self.store.ewma(endpoint, "bandwidth"), "fails": fails,
+                "error_rate": self.store.ewma(endpoint, "errors") or 0.0}
+
+    @property
+    def stats(self) -> Dict[str, dict]:
+        return {endpoint: self.stat(endpoint) for endpoint in self.endpoints}
+
+    def score(self, endpoint: str, st: Optional[dict] = None) -> float:
+        """节点评分（预估传输参考量所需秒数，失败按重试计入），越小越好，不可用返回inf"""
+        st = st or self.stat(endpoint)
+        error_rate = st.get("error_rate", 0.0)
+        if st.get("delay") is None or st.get("fails", 0) >= RANK_MAX_FAILS or error_rate >= 1:
+            return float("inf")
+        seconds = (st["delay"] + (st.get("ttfb") or 0)) / 1000
+        # 没有带宽数据的节点按超时时间惩罚，避免测速失败的节点排到前面
+        seconds += RANK_REF_BYTES / st["speed"] if st.get("speed") else TEST_TIMEOUT
+        # 请求失败率为 p 时平均需要 1/(1-p) 次请求才能成功
+        return seconds / (1 - error_rate) * (1 + st.get("fails", 0))
+
+    def ranking(self) -> List[str]:
+        """按评分从优到劣排序的节点列表"""
+        stats = self.stats
+        return sorted(self.endpoints, key=lambda ep: self.score(ep, stats[ep]))
+
+    def select(self, current: str, allows) -> str:
+        """从 allows(节点) 为真的节点中选出承载规则的节点；没有可用节点时保持当前节点，评分优势不足时也保持当前节点"""
+        candidates = [ep for ep in self.ranking() if allows(ep)]
+        if not candidates:
+            return current
+        best = candidates[0]
+        if current in candidates and best != current:
+            if self.score(best) * ENDPOINT_SWITCH_RATIO > self.score(current):
+                return current
+        return best
+
+    def best(self) -> str:
+        """当前最优节点；无任何可用统计时返回池中第一个节点"""
+        if not self.endpoints:
+            return ""
+        return self.ranking()[0]
+
+    def probe_all(self, probe) -> Dict[str, Tuple[int, float]]:
+        """一轮测速所有节点并写入时序库，probe(endpoints)返回 {节点: (延迟ms, 速率B/s)}"""
+        if not self.endpoints:
+            return {}
+        results = probe(list(self.endpoints))
+        for endpoint, (delay, speed_bps) in results.items():
+            self.update(endpoint, delay, speed_bps)
+        return results
+
+
+class EdgeIPScanner:
+    """Cloudflare 任播边缘IP扫描器：并发测量 TCP+TLS 握手耗时（SNI 为 Worker 域名），保留前N名"""
+
+    def __init__(self, host: str, candidates: List[str], port: int = 443, top_n: int = EDGE_TOP_N,
+                 timeout: float = TEST_TIMEOUT, verify: bool = True, rounds: int = 2):
+        self.host = host
+        self.candidates = candidates
+        self.port = port
+        self.top_n = top_n
+        self.timeout = timeout
+        self.rounds = rounds
+        self._ssl_context = ssl.create_default_context()
+        if not verify:
+            # 仅用于本地回环测试（自签证书）
+            self._ssl_context.check_hostname = False
+            self._ssl_context.verify_mode = ssl.CERT_NONE
+
+    @staticmethod
+    def expand(candidates: List[str], per_cidr: int = EDGE_SAMPLE_PER_CIDR) -> List[str]:
+        """展开候选列表：单IP原样保留，网段随机抽样 per_cidr 个主机地址"""
+        ips = []
+        for item in candidates:
+            try:
+                network = ipaddress.ip_network(item.strip(), strict=False)
+            except ValueError:
+                continue
+            if network.num_addresses <= 2:
+                ips.extend(str(ip) for ip in network)
+                continue
+            count = min(per_cidr, network.num_addresses - 2)
+            # 网段过大时不展开全部主机，按偏移随机抽样
+            for offset in random.sample(range(1, network.num_addresses - 1), count):
+                ips.append(str(network.network_address + offset))
+        return list(dict.fromkeys(ips))
+
+    def measure(self, ip: str) -> float:
+        """测量单个IP的 TCP+TLS 握手耗时（ms，多轮取均值），失败返回-1"""
+        costs = []
+        for _ in range(self.rounds):
+            try:
+                start_time = time.perf_counter()
+                with socket.create_connection((ip, self.port), timeout=self.timeout) as sock:
+                    with self._ssl_context.wrap_socket(sock, server_hostname=self.host):
+                        costs.append((time.perf_counter() - start_time) * 1000)
+            except Exception:
+                return -1
+        return sum(costs) / len(costs)
+
+    def scan(self, ips: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """并发扫描候选IP，返回按握手耗时排序的前N名 [(ip, ms)]"""
+        ips = ips if ips is not None else self.expand(self.candidates)
+        if not ips:
+            return []
+        with futures.ThreadPoolExecutor(max_workers=min(EDGE_SCAN_WORKERS, len(ips))) as executor:
+            results = list(zip(ips, executor.map(self.measure, ips)))
+        ok = sorted((item for item in results if item[1] >= 0), key=lambda item: item[1])
+        return ok[:self.top_n]
+
+
+class CircuitBreaker:
+    """节点熔断器：closed 正常 → 连续异常 open（摘除规则）→ 冷却后 half-open（试探）→ 连续健康 closed（恢复规则）"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_threshold: int = BREAKER_RECOVERY_THRESHOLD,
+                 cooldown: float = BREAKER_COOLDOWN, max_cooldown: float = BREAKER_MAX_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.recovery_threshold = recovery_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = self.CLOSED
+        self.cooldown = cooldown
+        self.failures = 0
+        self.successes = 0
+        self.opened_at = 0.0
+        self.degraded_since = 0.0
+        self.degraded_seconds = 0.0
+        self.trips = 0
+        self.reason = ""
+
+    @property
+    def allows(self) -> bool:
+        """只有 closed 状态的节点允许承载Git规则"""
+        return self.state == self.CLOSED
+
+    def degraded_total(self, now: Optional[float] = None) -> float:
+        """累计降级时长（秒，含当前未恢复的这一段）"""
+        now = now or time.time()
+        return self.degraded_seconds + (now - self.degraded_since if self.degraded_since else 0)
+
+    def _open(self, now: float, reason: str) -> str:
+        if self.state == self.CLOSED:
+            self.degraded_since = now
+            self.trips += 1
+        self.state = self.OPEN
+        self.opened_at = now
+        self.failures = self.successes = 0
+        self.reason = reason
+        return self.state
+
+    def record(self, healthy: bool, reason: str = "", now: Optional[float] = None) -> Optional[str]:
+        """记录一次探测结论，状态发生变化时返回新状态"""
+        now = now or time.time()
+        if self.state == self.CLOSED:
+            if healthy:
+                self.failures = 0
+                return None
+            self.failures += 1
+            return self._open(now, reason) if self.failures >= self.failure_threshold else None
+
+        transition = None
+        if self.state == self.OPEN:
+            if now - self.opened_at < self.cooldown:
+                return None
+            self.state = transition = self.HALF_OPEN
+            self.successes = 0
+        if not healthy:
+            # 试探失败：重新断开并加倍冷却
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            return self._open(now, reason)
+        self.successes += 1
+        if self.successes >= self.recovery_threshold:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.cooldown = self.base_cooldown
+            self.degraded_seconds += now - self.degraded_since
+            self.degraded_since = 0.0
+            self.reason = ""
+            return self.state
+        return transition
+
+
+class ProbeResult:
+    """单次分阶段测速结果，各阶段耗时单位为 ms"""
+
+    PHASES = ("dns", "connect", "tls", "ttfb", "transfer")
+
+    def __init__(self, endpoint: str, route: str, url: str):
+        self.endpoint = endpoint
+        self.route = route
+        self.url = url
+        self.status = 0
+        self.bytes = 0
+        self.error = ""
+        self.dns = self.connect = self.tls = self.ttfb = self.transfer = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.error and 200 <= self.status < 400
+
+    @property
+    def total(self) -> float:
+        return sum(getattr(self, phase) for phase in self.PHASES)
+
+    @property
+    def speed_bps(self) -> float:
+        """整次请求的平均速率（含建连耗时）"""
+        return self.bytes / (self.total / 1000) if self.total > 0 else 0
+
+    def to_dict(self) -> dict:
+        data = {"endpoint": self.endpoint, "route": self.route, "url": self.url,
+                "status": self.status, "bytes": self.bytes, "error": self.error}
+        data.update({phase: round(getattr(self, phase), 2) for phase in self.PHASES})
+        return data
+
+
+def assess_endpoint(probes: List[ProbeResult], direct: Dict[str, ProbeResult],
+                    closed: bool) -> Optional[Tuple[bool, str]]:
+    """按一轮分阶段测速判断节点是否健康（熔断器输入），返回 (是否健康, 原因)
+
+    probes 为该节点各路由结果，direct 为同一轮直连结果（路由 → 结果）；closed 表示熔断器当前闭合。
+    直连同样全部失败时多半是本机断网，返回 None 不作判断。
+    """
+    failed = [r for r in probes if r.error or r.status >= 500]
+    pairs = [(r, direct[r.route]) for r in probes if r.ok and r.route in direct and direct[r.route].ok]
+    if failed and direct and not any(r.ok for r in direct.values()):
+        return None
+    proxied_ms = sum(p.total for p, _ in pairs)
+    direct_ms = sum(d.total for _, d in pairs)
+    if failed:
+        return False, f"{failed[0].route}: {failed[0].error or failed[0].status}"
+    reason = f"代理 {proxied_ms:.0f} ms / 直连 {direct_ms:.0f} ms"
+    if pairs and closed:
+        return proxied_ms <= direct_ms * BREAKER_DEGRADE_RATIO, reason
+    # 恢复要求回到与路由决策相同的阈值内，比断开阈值更严格
+    return not pairs or proxied_ms <= direct_ms * ROUTE_PROXY_BIAS, reason
+
+
+def _route_url(endpoint: str, path: str, host_routes: Optional[Dict[str, dict]] = None) -> str:
+    """拼接测速URL；直连对照时按路由表把代理路径还原为GitHub原始地址（最长前缀优先）"""
+    if endpoint != DIRECT_ENDPOINT:
+        return f"{endpoint}{path}"
+    host_routes = host_routes or DEFAULT_ROUTES
+    for host, route in sorted(host_routes.items(), key=lambda item: -len(item[1]["prefix"])):
+        if path.startswith(route["prefix"]):
+            return f"https://{host}/" + path[len(route["prefix"]):]
+    return "https://github.com" + path
+
+
+def generate_worker_routes(host_routes: Dict[str, dict]) -> str:
+    """按路由表生成 workers.js 中的 ROUTES 常量（最长前缀优先）"""
+    lines = [f"{WORKER_ROUTES_BEGIN}（由 github_cf_proxy.py 按配置生成） ==========", "const ROUTES = ["]
+    for host, route in sorted(host_routes.items(), key=lambda item: -len(item[1]["prefix"])):
+        lines.append(f"  ['{route['prefix']}', '{host}'],")
+    lines += ["]", f"{WORKER_ROUTES_END} =========="]
+    return "\n".join(lines)
+
+
+class AsyncProbeEngine:
+    """asyncio 并发测速引擎：按 DNS / TCP / TLS / 首字节 / 传输 分阶段计时"""
+
+    def __init__(self, routes: Optional[List[Tuple[str, str]]] = None, timeout: float = TEST_TIMEOUT,
+                 concurrency: int = PROBE_CONCURRENCY, range_bytes: int = PROBE_RANGE_BYTES,
+                 resolve: Optional[Dict[str, str]] = None, verify: bool = True,
+                 host_routes: Optional[Dict[str, dict]] = None):
+        self.routes = routes or PROBE_ROUTES
+        self.host_routes = host_routes
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.range_bytes = range_bytes
+        # 固定解析（与 http.curloptResolve 一致），命中时跳过DNS
+        self.resolve = resolve or {}
+        self._ssl_context = ssl.create_default_context()
+        if not verify:
+            self._ssl_context.check_hostname = False
+            self._ssl_context.verify_mode = ssl.CERT_NONE
+
+    async def _probe(self, result: ProbeResult):
+        loop = asyncio.get_event_loop()
+        parsed = urllib.parse.urlparse(result.url)
+        https = parsed.scheme == "https"
+        host, port = parsed.hostname, parsed.port or (443 if https else 80)
+
+        start = time.perf_counter()
+        if host in self.resolve:
+            family, address = socket.AF_INET6 if ":" in self.resolve[host] else socket.AF_INET, (self.resolve[host], port)
+        else:
+            infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+            family, address = infos[0][0], infos[0][4]
+        mark = time.perf_counter()
+        result.dns = (mark - start) * 1000
+
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, address)
+        except Exception:
+            sock.close()
+            raise
+        now = time.perf_counter()
+        result.connect, mark = (now - mark) * 1000, now
+
+        reader, writer = await asyncio.open_connection(
+            sock=sock, ssl=self._ssl_context if https else None, server_hostname=host if https else None)
+        try:
+            now = time.perf_counter()
+            if https:
+                result.tls = (now - mark) * 1000
+            mark = now
+
+            target = parsed.path + (f"?{parsed.query}" if parsed.query else "")
+            request = (f"GET {target or '/'} HTTP/1.1\r\nHost: {host}\r\n"
+                       f"Range: bytes=0-{self.range_bytes - 1}\r\nUser-Agent: git/2.0 github-cf-proxy\r\n"
+                       f"Accept-Encoding: identity\r\nConnection: close\r\n\r\n")
+            writer.write(request.encode())
+            await writer.drain()
+            first = await reader.read(1)
+            now = time.perf_counter()
+            result.ttfb, mark = (now - mark) * 1000, now
+            if not first:
+                raise ConnectionError("连接被关闭，无响应")
+
+            header = first + await reader.readuntil(b"\r\n\r\n")
+            result.status = int(header.split(b" ", 2)[1])
+            while True:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                result.bytes += len(chunk)
+            result.transfer = (time.perf_counter() - mark) * 1000
+        finally:
+            writer.close()
+
+    async def probe(self, endpoint: str, route: str, path: str) -> ProbeResult:
+        """单次分阶段测速，异常/超时记录在 result.error 中"""
+        result = ProbeResult(endpoint, route, _route_url(endpoint, path, self.host_routes))
+        start, profiler = time.perf_counter(), CallProfiler.active
+        try:
+            await asyncio.wait_for(self._probe(result), self.timeout)
+        except asyncio.TimeoutError:
+            result.error = "超时"
+        except Exception as e:
+            result.error = str(e) or e.__class__.__name__
+        if profiler:
+            # 测速自行管理套接字，不经过被替换的连接入口，按整次请求记录
+            profiler.record("http", f"GET {_domain_host(result.url)}", profiler.call_site(), start,
+                            result.status if not result.error else result.error)
+        return result
+
+    async def probe_many(self, endpoints: List[str]) -> List[ProbeResult]:
+        """所有节点 × 所有路由并发测速"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(endpoint, route, path):
+            async with semaphore:
+                return await self.probe(endpoint, route, path)
+
+        tasks = [limited(ep, route, path) for ep in endpoints for route, path in self.routes]
+        return list(await asyncio.gather(*tasks))
+
+    def run(self, endpoints: List[str]) -> List[ProbeResult]:
+        """同步入口：在独立事件循环中执行一轮测速（可在任意线程调用）"""
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self.probe_many(endpoints))
+        finally:
+            loop.close()
+
+
+class BandwidthResult:
+    """带宽测速结果：均值及95%置信区间（B/s）"""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.bps = 0.0
+        self.low = 0.0
+        self.high = 0.0
+        self.samples: List[float] = []
+        # 热连接上每个分片的 (字节数, 传输阶段耗时s)，用于拟合带宽与单次请求的固定开销
+        self.points: List[Tuple[int, float]] = []
+        self.bytes_used = 0
+        self.requests = 0
+        # 返回 5xx 后重试的分片请求数
+        self.failures = 0
+        self.dominated = False
+        self.error = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.bps > 0
+
+    def __str__(self) -> str:
+        if not self.ok:
+            return "-- MB/s"
+        if self.high <= self.low:
+            return _format_speed(self.bps)
+        if math.isinf(self.high):
+            return f"≥{_format_speed(self.low)}"
+        return f"{_format_speed(self.bps)} ±{(self.high - self.low) / 2 / self.bps * 100:.0f}%"
+
+
+class BandwidthProbe:
+    """自适应分片带宽测速：复用长连接，分片逐轮翻倍直到传输阶段占主导，单轮不超过字节预算"""
+
+    def __init__(self, endpoint: str, path: str = BANDWIDTH_TEST_PATH, budget: int = BANDWIDTH_BUDGET,
+                 timeout: float = TEST_TIMEOUT, verify: bool = True):
+        self.endpoint = endpoint
+        self.path = path
+        self.budget = budget
+        self.timeout = timeout
+        self._ssl_context = ssl.create_default_context()
+        if not verify:
+            self._ssl_context.check_hostname = False
+            self._ssl_context.verify_mode = ssl.CERT_NONE
+
+    def _connect(self) -> http.client.HTTPConnection:
+        parsed = urllib.parse.urlparse(self.endpoint)
+        if parsed.scheme == "https":
+            return http.client.HTTPSConnection(parsed.hostname, parsed.port or 443,
+                                               timeout=self.timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=self.timeout)
+
+    def _fetch(self, conn: http.client.HTTPConnection, start: int, size: int,
+               result: BandwidthResult) -> Tuple[int, float, float, int]:
+        """请求一个分片并计入 result 的请求数，返回 (字节数, 传输耗时s, 总耗时s, 文件总大小)
+
+        节点返回 5xx 时读完响应体，在同一连接上重试并计入失败数，连续重试 BANDWIDTH_MAX_RETRIES 次仍失败则抛出。
+        """
+        for _ in range(BANDWIDTH_MAX_RETRIES + 1):
+            begin = time.perf_counter()
+            result.requests += 1
+            conn.request("GET", self.path, headers={"Range": f"bytes={start}-{start + size - 1}",
+                                                    "Accept-Encoding": "identity", "User-Agent": "github-cf-proxy"})
+            resp = conn.getresponse()
+            if resp.status < 500:
+                break
+            resp.read()
+            result.failures += 1
+        else:
+            raise ConnectionError(f"节点连续返回 HTTP {resp.status}")
+        if resp.status != 206:
+            resp.close()
+            raise ConnectionError(f"服务器不支持Range（HTTP {resp.status}）")
+        first = resp.read(1)
+        first_byte = time.perf_counter()
+        received = len(first) + len(resp.read(size))
+        end = time.perf_counter()
+        total_size = int((resp.getheader("Content-Range") or "/0").rsplit("/", 1)[-1] or 0)
+        return received, end - first_byte, end - begin, total_size
+
+    def run(self) -> BandwidthResult:
+        result = BandwidthResult(self.endpoint)
+        conn = self._connect()
+        try:
+            # 预热：建立 TCP+TLS 并获取文件大小，之后的分片都在热连接上测量
+            received, _, _, file_size = self._fetch(conn, 0, 1, result)
+            result.bytes_used += received
+            size, offset = BANDWIDTH_START_BYTES, 0
+            if file_size:
+                size = min(size, file_size)
+            # 最近一个未占主导分片的 (字节数, 传输耗时s)
+            largest = (0, 0.0)
+            while result.bytes_used + size <= self.budget:
+                if file_size and offset + size > file_size:
+                    offset = 0
+                received, transfer, total, _ = self._fetch(conn, offset, size, result)
+                result.bytes_used += received
+                result.points.append((received, transfer))
+                offset += received
+                dominated = total > 0 and transfer / total >= BANDWIDTH_TRANSFER_DOMINANCE
+                if dominated and transfer > 0:
+                    result.dominated = True
+                    result.samples.append(received / transfer)
+                elif file_size and size >= file_size:
+                    # 分片已达文件大小仍未占主导：按整次请求耗时估算（偏保守）
+                    result.samples.append(received / total)
+                else:
+                    largest = (received, transfer)
+                    size = min(size * 2, file_size) if file_size else size * 2
+                    continue
+                if len(result.samples) >= BANDWIDTH_MIN_SAMPLES:
+                    break
+            if not result.samples and largest[1] > 0:
+                # 预算用尽仍未占主导（高带宽且首字节延迟较高的链路）：按最大分片传输阶段的速率估算
+                result.samples.append(largest[0] / largest[1])
+        except Exception as e:
+            result.error = str(e) or e.__class__.__name__
+        finally:
+            conn.close()
+
+        if result.samples:
+            result.bps = statistics.mean(result.samples)
+            result.low = result.high = result.bps
+            if not self._fit(result) and len(result.samples) >= 2:
+                n = len(result.samples)
+                margin = _t_quantile_95(n - 1) * statistics.stdev(result.samples) / n ** 0.5
+                result.low, result.high = max(result.bps - margin, 0), result.bps + margin
+        return result
+
+    @staticmethod
+    def _fit(result: BandwidthResult) -> bool:
+        """按 传输耗时 = 固定开销 + 字节数/带宽 拟合各分片：斜率取两两分片斜率的中位数（Theil-Sen），
+        95%置信区间取 Kendall 秩检验对应的两两斜率次序统计量（Sen 区间）
+
+        首字节等待期间已在途的数据（TCP 窗口、套接字缓冲）会让传输阶段显得更快，分片越小偏差越大，
+        拟合的截距吸收这部分单次请求的固定开销；偶发的单次停顿（如延迟确认）只影响少数两两斜率。
+        区间半宽不小于计时误差 BANDWIDTH_TIMING_ERROR 所致的斜率误差。首个分片受拥塞窗口增长影响，不参与拟合；
+        分片大小不足三种或斜率不为正时返回 False，由调用方按样本均值的 t 区间估计。
+        """
+        points = result.points[1:]
+        if len({size for size, _ in points}) < 3:
+            return False
+        slopes = sorted((s2 - s1) / (b2 - b1) for i, (b1, s1) in enumerate(points)
+                        for b2, s2 in points[i + 1:] if b2 != b1)
+        slope = statistics.median(slopes)
+        if slope <= 0:
+            return False
+        n, pairs = len(points), len(slopes)
+        spread = 1.96 * math.sqrt(n * (n - 1) * (2 * n + 5) / 18)
+        # 首末分片各有 BANDWIDTH_TIMING_ERROR 计时误差时斜率的误差，作为区间半宽的下限
+        floor = 1.96 * math.sqrt(2) * BANDWIDTH_TIMING_ERROR / (max(points)[0] - min(points)[0])
+        lower = min(slopes[max(math.floor((pairs - spread) / 2) - 1, 0)], slope - floor)
+        upper = max(slopes[min(math.ceil((pairs + spread) / 2), pairs - 1)], slope + floor)
+        result.bps = 1 / slope
+        result.low = 1 / upper
+        result.high = 1 / lower if lower > 0 else math.inf
+        return True
+
+    def parallel(self, streams: int, size: int) -> Tuple[float, int]:
+        """streams 条热连接同时各下载 size 字节，返回 (聚合吞吐B/s, 请求数)；按最早开始到最晚结束计时，失败的连接不计字节"""
+        barrier = threading.Barrier(streams)
+
+        def fetch(index):
+            conn = None
+            counter = BandwidthResult(self.endpoint)
+            try:
+                conn = self._connect()
+                _, _, _, file_size = self._fetch(conn, 0, 1, counter)
+                offset = index * size % max(file_size - size, 1) if file_size > size else 0
+                barrier.wait(self.timeout)
+                begin = time.perf_counter()
+                received = self._fetch(conn, offset, min(size, file_size) if file_size else size, counter)[0]
+                return received, begin, time.perf_counter(), counter.requests
+            except Exception:
+                barrier.abort()
+                return 0, 0.0, 0.0, max(counter.requests, 1)
+            finally:
+                if conn:
+                    conn.close()
+
+        with futures.ThreadPoolExecutor(max_workers=streams) as executor:
+            runs = list(executor.map(fetch, range(streams)))
+        done = [r for r in runs if r[0]]
+        requests = sum(r[3] for r in runs)
+        if not done:
+            return 0.0, requests
+        wall = max(r[2] for r in done) - min(r[1] for r in done)
+        return sum(r[0] for r in done) / wall if wall > 0 else 0.0, requests
+
+
+class ProbeBroker:
+    """每用户共享的测速代理：持有主控锁的进程（守护进程或某个终端会话）负责测速并发布结果，
+    其余会话只读取共享状态文件；测速间隔自适应，经 Worker 的请求计入每日预算"""
+
+    def __init__(self, state_file: Path = BROKER_STATE_FILE, lock_file: Path = BROKER_LOCK_FILE,
+                 budget: int = BROKER_DAILY_BUDGET):
+        self.state_file = state_file
+        self.lock_file = lock_file
+        self.budget = budget
+        self.pid = os.getpid()
+        self._lock_fd: Optional[int] = None
+        self._next_probe = 0.0
+
+    @property
+    def leader(self) -> bool:
+        return self._lock_fd is not None or fcntl is None
+
+    def try_lead(self) -> bool:
+        """尝试成为主控（非阻塞）；不支持文件锁的平台各进程独立测速，但仍共享预算"""
+        if self.leader:
+            return True
+        fd = os.open(str(self.lock_file), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        self._next_probe = 0.0
+        return True
+
+    def release(self):
+        if self._lock_fd is not None:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _update(self, modify=None) -> dict:
+        """加锁读取（并可选修改后写回）共享状态；跨天时重置请求计数"""
+        try:
+            f = open(self.state_file, "a+", encoding="utf-8")
+        except OSError:
+            return {}
+        with f:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if modify else fcntl.LOCK_SH)
+            f.seek(0)
+            try:
+                state = json.loads(f.read() or "{}")
+            except ValueError:
+                state = {}
+            today = datetime.now().strftime("%Y-%m-%d")
+            if state.get("day") != today:
+                state.update(day=today, requests=0)
+            state.setdefault("sessions", {})
+            state.setdefault("results", {})
+            state.setdefault("interval", BROKER_MIN_INTERVAL)
+            if modify:
+                modify(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state, ensure_ascii=False))
+                f.flush()
+        return state
+
+    def read(self) -> dict:
+        return self._update()
+
+    def heartbeat(self):
+        """登记本会话为活跃订阅者，并清理超时会话"""
+        def modify(state):
+            now = time.time()
+            state["sessions"] = {pid: ts for pid, ts in state["sessions"].items() if now - ts < BROKER_SESSION_TTL}
+            state["sessions"][str(self.pid)] = now
+        self._update(modify)
+
+    def leave(self):
+        self._update(lambda state: state["sessions"].pop(str(self.pid), None))
+
+    @staticmethod
+    def active_sessions(state: dict) -> int:
+        now = time.time()
+        return sum(1 for ts in state.get("sessions", {}).values() if now - ts < BROKER_SESSION_TTL)
+
+    def remaining(self, state: Optional[dict] = None) -> int:
+        state = state if state is not None else self.read()
+        return self.budget - state.get("requests", 0)
+
+    def charge(self, requests: int):
+        """记入经 Worker 发出的请求数"""
+        if requests > 0:
+            self._update(lambda state: state.update(requests=state.get("requests", 0) + requests))
+
+    def due(self) -> bool:
+        """主控是否到了下一次测速时间（预算用尽时不再测速）"""
+        return self.leader and time.time() >= self._next_probe and self.remaining() > 0
+
+    def publish(self, results: Dict[str, Tuple[int, Optional[str]]]) -> float:
+        """发布一轮结果 {节点: (延迟ms, 速率文本或None)} 并按结果调整下一次测速间隔，返回该间隔"""
+        def modify(state):
+            now = time.time()
+            failed = any(delay < 0 for delay, _ in results.values())
+            stable = not failed
+            for endpoint, (delay, speed) in results.items():
+                prev = state["results"].get(endpoint, {})
+                prev_delay = prev.get("delay", -1)
+                if prev_delay < 0 or abs(delay - prev_delay) > prev_delay * BROKER_STABLE_RATIO:
+                    stable = False
+                state["results"][endpoint] = {"delay": delay, "speed": speed or prev.get("speed"), "ts": now}
+            if failed:
+                interval = BROKER_MIN_INTERVAL
+            elif not self.active_sessions(state):
+                interval = BROKER_IDLE_INTERVAL
+            elif stable:
+                interval = min(state["interval"] * 2, BROKER_MAX_INTERVAL)
+            else:
+                interval = state["interval"]
+            state["interval"] = interval
+            state["leader"] = self.pid
+        state = self._update(modify)
+        self._next_probe = time.time() + state["interval"]
+        return state["interval"]
+
+
+class ABBenchmark:
+    """直连 vs 代理 A/B 基准测试：同一工作负载交替走代理与直连，统计耗时中位数/p95与吞吐
+
+    两种模式共用一份去掉了本工具 insteadOf 规则的全局配置副本（GIT_CONFIG_GLOBAL，需 Git 2.32+），
+    代理模式再用 -c 临时加上指向指定节点的规则，不修改真实的 ~/.gitconfig。
+    """
+
+    OPS = ("ls-remote", "shallow-clone", "clone", "raw", "archive")
+    MODES = ("proxy", "direct")
+
+    def __init__(self, endpoint: str, host_routes: Dict[str, dict], repo: str = BENCHMARK_REPO,
+                 ref: str = BENCHMARK_REF, raw_file: str = BENCHMARK_FILE, repeat: int = BENCHMARK_REPEAT,
+                 ops: Optional[List[str]] = None, timeout: float = BENCHMARK_TIMEOUT):
+        self.endpoint = endpoint
+        self.host_routes = host_routes
+        self.repo = repo.strip("/")
+        self.ref = ref
+        self.raw_file = raw_file.lstrip("/")
+        self.repeat = max(1, repeat)
+        self.ops = [op for op in (ops or self.OPS) if op in self.OPS]
+        self.timeout = timeout
+
+    def _url(self, mode: str, host: str, path: str) -> str:
+        if mode == "direct" or host not in self.host_routes:
+            return f"https://{host}/{path}"
+        return f"{self.endpoint}{self.host_routes[host]['prefix']}{path}"
+
+    def _git(self, mode: str, args: List[str], env: dict, cwd: Path) -> Tuple[float, int, str]:
+        """执行一次git命令，返回 (耗时秒, 标准输出字节数, 错误信息)"""
+        overrides = []
+        if mode == "proxy":
+            for host in self.host_routes:
+                overrides += ["-c", f"url.{self._url('proxy', host, '')}.insteadOf=https://{host}/"]
+        start = time.perf_counter()
+        try:
+            result = subprocess.run(["git"] + overrides + args, capture_output=True, env=env, cwd=str(cwd),
+                                    timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            return time.perf_counter() - start, 0, "超时"
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            lines = result.stderr.decode("utf-8", "replace").strip().splitlines()
+            return elapsed, 0, lines[-1] if lines else f"exit {result.returncode}"
+        return elapsed, len(result.stdout), ""
+
+    def _fetch(self, url: str) -> Tuple[float, int, str]:
+        """HTTP下载（跟随重定向），返回 (耗时秒, 字节数, 错误信息)"""
+        request = urllib.request.Request(url, headers={"User-Agent": "github-cf-proxy-benchmark"})
+        start = time.perf_counter()
+        total = 0
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                while True:
+                    chunk = response.read(65536)
+                    if not chunk:
+                        break
+                    total += len(chunk)
+        except Exception as e:
+            return time.perf_counter() - start, total, str(e)
+        return time.perf_counter() - start, total, ""
+
+    @staticmethod
+    def _dir_size(path: Path) -> int:
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+    def run_op(self, op: str, mode: str, workdir: Path, env: dict) -> dict:
+        """执行单个操作一次"""
+        repo_url = f"https://github.com/{self.repo}.git"
+        target = workdir / f"{op}-{mode}"
+        if target.exists():
+            shutil.rmtree(str(target), ignore_errors=True)
+        if op == "ls-remote":
+            seconds, size, error = self._git(mode, ["ls-remote", repo_url], env, workdir)
+        elif op in ("shallow-clone", "clone"):
+            args = ["clone", "--quiet", "--no-checkout"] + (["--depth", "1"] if op == "shallow-clone" else [])
+            seconds, _, error = self._git(mode, args + [repo_url, str(target)], env, workdir)
+            size = self._dir_size(target / ".git" / "objects") if not error else 0
+            shutil.rmtree(str(target), ignore_errors=True)
+        elif op == "raw":
+            seconds, size, error = self._fetch(self._url(mode, "raw.githubusercontent.com",
+                                                         f"{self.repo}/{self.ref}/{self.raw_file}"))
+        else:
+            seconds, size, error = self._fetch(self._url(mode, "codeload.github.com",
+                                                         f"{self.repo}/tar.gz/{self.ref}"))
+        return {"op": op, "mode": mode, "seconds": seconds, "bytes": size, "error": error}
+
+    def run(self, modes: Optional[List[str]] = None, progress=None) -> List[dict]:
+        """按 重复轮次 × 操作 交替执行各模式（每轮交换先后顺序，抵消缓存与时段影响），返回全部样本"""
+        modes = [m for m in (modes or self.MODES) if m in self.MODES]
+        samples = []
+        with tempfile.TemporaryDirectory(prefix="cfproxy-bench-") as tmp:
+            workdir = Path(tmp)
+            env = dict(os.environ, GIT_CONFIG_GLOBAL=str(_isolated_gitconfig(workdir, self.host_routes)),
+                       GIT_TERMINAL_PROMPT="0")
+            for round_no in range(self.repeat):
+                for op in self.ops:
+                    for mode in (modes if round_no % 2 == 0 else list(reversed(modes))):
+                        sample = self.run_op(op, mode, workdir, env)
+                        sample["round"] = round_no + 1
+                        samples.append(sample)
+                        if progress:
+                            progress(sample)
+        return samples
+
+    @classmethod
+    def summarize(cls, samples: List[dict]) -> List[dict]:
+        """按 操作×模式 汇总：成功次数、耗时中位数/p95、中位吞吐，以及代理相对直连的加速比"""
+        rows = []
+        for op in cls.OPS:
+            by_mode = {}
+            for mode in cls.MODES:
+                runs = [s for s in samples if s["op"] == op and s["mode"] == mode]
+                if not runs:
+                    continue
+                ok = [s for s in runs if not s["error"]]
+                times = sorted(s["seconds"] for s in ok)
+                row = {"op": op, "mode": mode, "runs": len(runs), "ok": len(ok),
+                       "median_s": statistics.median(times) if times else None,
+                       "p95_s": _percentile(times, 95) if times else None,
+                       "median_bps": statistics.median(s["bytes"] / s["seconds"] for s in ok if s["seconds"] > 0)
+                       if ok else None,
+                       "errors": sorted({s["error"] for s in runs if s["error"]})}
+                by_mode[mode] = row
+                rows.append(row)
+            proxy, direct = by_mode.get("proxy"), by_mode.get("direct")
+            if proxy and direct and proxy["median_s"] and direct["median_s"]:
+                proxy["speedup"] = direct["median_s"] / proxy["median_s"]
+        return rows
+
+
+class StartupBenchmark:
+    """命令行启动耗时基准：以子进程多次运行空操作命令（规则已是最新时的 apply、status），统计墙钟耗时
+
+    耗时扣除空解释器（python -c pass）的启动耗时后与 STARTUP_BUDGET_MS 比较。module 模式（python -m，
+    读取已编译的字节码）对应开机自启与 shell 提示符的实际开销；script 模式直接运行脚本，每次都要重新编译，仅作对照。
+    """
+
+    MODES = ("module", "script")
+
+    def __init__(self, commands: List[str], repeat: int = STARTUP_BENCH_REPEAT, budget_ms: float = STARTUP_BUDGET_MS):
+        self.commands = commands
+        self.repeat = max(1, repeat)
+        self.budget_ms = budget_ms
+
+    @staticmethod
+    def _argv(mode: str, command: str) -> List[str]:
+        if mode == "module":
+            return [sys.executable, "-m", SCRIPT_PATH.stem] + command.split()
+        if mode == "script":
+            return [sys.executable, str(SCRIPT_PATH)] + command.split()
+        return [sys.executable, "-c", "pass"]
+
+    def _measure(self, argv: List[str]) -> List[float]:
+        """运行 repeat 次，返回排好序的耗时（毫秒）"""
+        times = []
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            subprocess.run(argv, cwd=str(SCRIPT_PATH.parent), stdin=subprocess.DEVNULL,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            times.append((time.perf_counter() - start) * 1000)
+        return sorted(times)
+
+    def run(self) -> dict:
+        # 预先编译字节码，module 模式在设置了 PYTHONDONTWRITEBYTECODE 时同样读取缓存
+        import py_compile
+        try:
+            py_compile.compile(str(SCRIPT_PATH), doraise=True)
+        except (py_compile.PyCompileError, OSError):
+            pass
+        baseline = self._measure(self._argv("baseline", ""))
+        baseline_ms = statistics.median(baseline)
+        rows = []
+        for mode in self.MODES:
+            for command in self.commands:
+                times = self._measure(self._argv(mode, command))
+                median = statistics.median(times)
+                rows.append({"mode": mode, "command": command, "median_ms": median, "p95_ms": _percentile(times, 95),
+                             "overhead_ms": median - baseline_ms,
+                             "within_budget": median - baseline_ms <= self.budget_ms if mode == "module" else None})
+        return {"python": sys.version.split()[0], "repeat": self.repeat, "budget_ms": self.budget_ms,
+                "baseline_ms": baseline_ms, "baseline_p95_ms": _percentile(baseline, 95), "results": rows}
+
+
+class LinkProfile:
+    """模拟链路参数：首字节延迟与抖动（ms，抖动为均匀分布 ±jitter）、带宽上限（B/s，0 不限）、
+    卡顿概率与时长（响应中途暂停，模拟丢包重传）、5xx 概率"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, bandwidth: float = 0.0,
+                 stall_rate: float = 0.0, stall_ms: float = 0.0, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.bandwidth = bandwidth
+        self.stall_rate = stall_rate
+        self.stall_ms = stall_ms
+        self.error_rate = error_rate
+
+    def ideal_seconds(self, size: int = RANK_REF_BYTES) -> float:
+        """按设定参数传输 size 字节的期望耗时（失败按重试计入），作为排名的理想评分"""
+        if self.error_rate >= 1:
+            return float("inf")
+        seconds = self.latency_ms / 1000 + (size / self.bandwidth if self.bandwidth else 0)
+        seconds += self.stall_rate * self.stall_ms / 1000
+        return seconds / (1 - self.error_rate)
+
+    def to_dict(self) -> dict:
+        return dict(self.__dict__)
+
+
+class SimulatedLink:
+    """本机回环上的模拟节点/上游：任意路径返回确定性内容（支持 Range），按 LinkProfile 注入延迟、抖动、限速、卡顿与 5xx
+
+    回环上的 TCP 握手无法在用户态加延迟（需要 root 与 tc netem），模拟延迟作用在每个请求的首字节之前，
+    即分阶段测速的 ttfb 阶段。带宽上限由同一链路的所有连接共享；profile 可在运行中替换，模拟节点劣化与恢复。
+    """
+
+    PATTERN = bytes(range(256)) * (SIM_CHUNK // 256)
+
+    def __init__(self, profile: LinkProfile, seed: int = SIM_SEED):
+        self.profile = profile
+        self.requests = 0
+        self.errors = 0
+        self.stalls = 0
+        # 分阶段测速请求（Range 与 AsyncProbeEngine 一致）实际被施加的首字节延迟（ms），作为测量误差的真值
+        self.probe_delays: List[float] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_send = 0.0
+        link = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                try:
+                    link._serve(self)
+                except OSError:
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            daemon_threads = True
+
+        self.server = _Server(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> SimulatedLink:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _sample(self) -> Tuple[float, bool, float]:
+        """为一个请求抽样 (首字节延迟s, 是否返回5xx, 卡顿s)"""
+        with self._lock:
+            p = self.profile
+            delay = max(0.0, p.latency_ms + self._random.uniform(-p.jitter_ms, p.jitter_ms)) / 1000
+            error = self._random.random() < p.error_rate
+            stall = p.stall_ms / 1000 if self._random.random() < p.stall_rate else 0.0
+            self.requests += 1
+            self.errors += error
+            self.stalls += bool(stall)
+        return delay, error, stall
+
+    def _pace(self, size: int):
+        """按链路带宽为 size 字节预留发送时段，等到时段结束再写出（模拟串行化时延）"""
+        bandwidth = self.profile.bandwidth
+        if bandwidth <= 0:
+            return
+        with self._lock:
+            now = time.perf_counter()
+            # 落后排程不超过 SIM_PACE_SLACK 视为 sleep 超时或线程调度误差，沿用排程补回；更久说明链路空闲过，从当前时刻重新排程
+            if now - self._next_send > SIM_PACE_SLACK:
+                self._next_send = now
+            self._next_send += size / bandwidth
+            wait = self._next_send - now
+        if wait > 0:
+            time.sleep(wait)
+
+    def _serve(self, handler):
+        delay, error, stall = self._sample()
+        if handler.headers.get("Range") == f"bytes=0-{PROBE_RANGE_BYTES - 1}":
+            self.probe_delays.append(delay * 1000)
+        time.sleep(delay)
+        if error:
+            body = b"simulated upstream error\n"
+            handler.send_response(503)
+            handler.send_header("Content-Length", str(len(body)))
+            handler.end_headers()
+            handler.wfile.write(body)
+            return
+        start, end, status = 0, SIM_FILE_SIZE - 1, 200
+        match = re.match(r"bytes=(\d+)-(\d*)", handler.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else end, end)
+            status = 206
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/octet-stream")
+        handler.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            handler.send_header("Content-Range", f"bytes {start}-{end}/{SIM_FILE_SIZE}")
+        handler.end_headers()
+        remaining = end - start + 1
+        stall_at = remaining // 2
+        while remaining > 0:
+            size = min(SIM_CHUNK, remaining)
+            if stall and remaining <= stall_at:
+                time.sleep(stall)
+                stall = 0.0
+            self._pace(size)
+            handler.wfile.write(self.PATTERN[:size])
+            remaining -= size
+
+
+class ProbeHarness:
+    """测速精度与决策质量基准：在本机回环模拟链路上运行真实的分阶段测速、带宽测速、节点池排名与熔断逻辑
+
+    accuracy：每种链路多次测速，对比测得的首字节耗时与带宽和设定值，统计误差与带宽95%置信区间的覆盖率；
+    ranking：多个带宽/错误率不同的模拟节点按节点池评分排名，与按设定参数算出的理想排名比较；
+    failover：按守护进程的流程逐轮测速（时钟按 DAEMON_INTERVAL 虚拟推进），首选节点开始返回 5xx 或变慢后，
+    统计熔断器断开与规则切换所需的轮数，以及恢复后重新启用所需的轮数。
+    """
+
+    SCENARIOS = ("accuracy", "ranking", "failover")
+    MB = 1024 * 1024
+    # 精度场景的链路；lossy 的卡顿使实际吞吐低于带宽上限，只作参考不参与门限判定
+    ACCURACY_LINKS = {
+        "clean-fast": LinkProfile(latency_ms=20, bandwidth=16 * MB),
+        "clean-slow": LinkProfile(latency_ms=80, bandwidth=4 * MB),
+        "jittery": LinkProfile(latency_ms=60, jitter_ms=40, bandwidth=8 * MB),
+        "lossy": LinkProfile(latency_ms=40, bandwidth=8 * MB, stall_rate=0.2, stall_ms=200),
+    }
+    GATED_LINKS = ("clean-fast", "clean-slow", "jittery")
+    RANKING_LINKS = {
+        "16M": LinkProfile(latency_ms=40, bandwidth=16 * MB),
+        "8M": LinkProfile(latency_ms=40, bandwidth=8 * MB),
+        "4M": LinkProfile(latency_ms=40, bandwidth=4 * MB),
+        "32M-flaky": LinkProfile(latency_ms=40, bandwidth=32 * MB, error_rate=0.5),
+    }
+    # 熔断场景：首选节点的劣化方式
+    DEGRADATIONS = {
+        "5xx": {"error_rate": 1.0},
+        "slow": {"latency_ms": 400},
+    }
+
+    def __init__(self, rounds: int = SIM_ROUNDS, seed: int = SIM_SEED, progress=None):
+        self.rounds = max(1, rounds)
+        self.seed = seed
+        self.progress = progress or (lambda message: None)
+
+    def accuracy(self) -> List[dict]:
+        rows = []
+        for index, (name, profile) in enumerate(self.ACCURACY_LINKS.items()):
+            self.progress(f"accuracy: {name}")
+            ttfbs, bandwidths, seconds, used = [], [], [], []
+            with SimulatedLink(profile, self.seed + index) as link:
+                engine = AsyncProbeEngine()
+                for _ in range(self.rounds):
+                    ttfbs += [r.ttfb for r in engine.run([link.url]) if r.ok]
+                    start = time.perf_counter()
+                    result = BandwidthProbe(link.url).run()
+                    seconds.append(time.perf_counter() - start)
+                    used.append(result.bytes_used)
+                    if result.ok:
+                        bandwidths.append(result)
+            deviations = sorted(abs(t - profile.latency_ms) for t in ttfbs)
+            applied = statistics.median(link.probe_delays) if link.probe_delays else profile.latency_ms
+            row = {"link": name, "profile": profile.to_dict(), "gated": name in self.GATED_LINKS,
+                   "ttfb_median_ms": statistics.median(ttfbs) if ttfbs else None,
+                   "ttfb_applied_ms": applied,
+                   "ttfb_error_ms": statistics.median(ttfbs) - applied if ttfbs else None,
+                   "ttfb_p95_deviation_ms": _percentile(deviations, 95) if deviations else None,
+                   "bandwidth_bps": statistics.median(r.bps for r in bandwidths) if bandwidths else None,
+                   "bandwidth_error": None, "ci_coverage": None,
+                   "probe_seconds": statistics.median(seconds), "probe_bytes": statistics.median(used)}
+            if bandwidths:
+                row["bandwidth_error"] = row["bandwidth_bps"] / profile.bandwidth - 1
+                row["ci_coverage"] = sum(r.low <= profile.bandwidth <= r.high for r in bandwidths) / len(bandwidths)
+            row["passed"] = not row["gated"] or (
+                row["ttfb_error_ms"] is not None and abs(row["ttfb_error_ms"]) <= SIM_MAX_TTFB_ERROR_MS
+                and row["bandwidth_error"] is not None and abs(row["bandwidth_error"]) <= SIM_MAX_BANDWIDTH_ERROR
+                and row["ci_coverage"] >= SIM_MIN_CI_COVERAGE)
+            rows.append(row)
+        return rows
+
+    @staticmethod
+    def _probe_round(engine: AsyncProbeEngine, store: MetricStore, urls: List[str], bandwidth: bool,
+                     direct_url: str = "") -> Tuple[Dict[str, Tuple[int, float]], List[ProbeResult]]:
+        """与 GitHubCFProxy._probe_endpoints 相同的一轮测速：延迟取各路由最小 TCP 耗时，首字节耗时与带宽测速
+        请求失败率写入 store，可选带宽测速；direct_url 的结果标记为直连对照"""
+        results = engine.run(urls + ([direct_url] if direct_url else []))
+        for r in results:
+            if r.endpoint == direct_url:
+                r.endpoint = DIRECT_ENDPOINT
+        summary = {}
+        for url in urls:
+            ok = [r for r in results if r.endpoint == url and r.ok]
+            if not ok:
+                summary[url] = (-1, 0)
+                continue
+            store.append(url, "ttfb", min(r.ttfb for r in ok))
+            bw = BandwidthProbe(url).run() if bandwidth else None
+            if bw and bw.requests:
+                store.append(url, "errors", bw.failures / bw.requests)
+            summary[url] = (int(min(r.connect for r in ok)), bw.bps if bw else 0)
+        return summary, results
+
+    def ranking(self, workdir: Path) -> dict:
+        self.progress("ranking")
+        links = [SimulatedLink(profile, self.seed + index) for index, profile in enumerate(self.RANKING_LINKS.values())]
+        names = dict(zip((link.url for link in links), self.RANKING_LINKS))
+        with contextlib.ExitStack() as stack:
+            for link in links:
+                stack.enter_context(link)
+            store = MetricStore(workdir / "ranking.bin", capacity=10000)
+            pool = EndpointPool([link.url for link in links], store)
+            engine = AsyncProbeEngine()
+            for _ in range(self.rounds):
+                pool.probe_all(lambda eps: self._probe_round(engine, store, eps, True)[0])
+            measured = [names[url] for url in pool.ranking()]
+            scores = {names[url]: pool.score(url) for url in pool.endpoints}
+            store.close()
+        ideal = sorted(self.RANKING_LINKS, key=lambda name: self.RANKING_LINKS[name].ideal_seconds())
+        pairs = [(a, b) for i, a in enumerate(ideal) for b in ideal[i + 1:]]
+        agreement = sum(measured.index(a) < measured.index(b) for a, b in pairs) / len(pairs)
+        return {"ideal": ideal, "measured": measured, "top1_correct": measured[0] == ideal[0],
+                "pairwise_agreement": agreement,
+                "ideal_seconds": {name: profile.ideal_seconds() for name, profile in self.RANKING_LINKS.items()},
+                "scores": {name: (None if math.isinf(score) else score) for name, score in scores.items()},
+                "passed": measured[0] == ideal[0]}
+
+    def failover(self, workdir: Path, mode: str, healthy_cycles: int = 3) -> dict:
+        """一个劣化方式的熔断场景；轮数上限按冷却时间与恢复阈值推算"""
+        self.progress(f"failover: {mode}")
+        base = LinkProfile(latency_ms=20, bandwidth=8 * self.MB)
+        primary = SimulatedLink(LinkProfile(**base.to_dict()), self.seed)
+        backup = SimulatedLink(LinkProfile(latency_ms=20, bandwidth=4 * self.MB), self.seed + 1)
+        direct = SimulatedLink(LinkProfile(**base.to_dict()), self.seed + 2)
+        max_cycles = BREAKER_FAILURE_THRESHOLD * 3
+        recover_cycles = math.ceil(BREAKER_MAX_COOLDOWN / DAEMON_INTERVAL) + BREAKER_RECOVERY_THRESHOLD + 2
+        timeline = []
+        detected = switched = recovered = None
+        with primary, backup, direct:
+            store = MetricStore(workdir / f"failover-{mode}.bin", capacity=10000)
+            urls = [primary.url, backup.url]
+            pool = EndpointPool(urls, store)
+            engine = AsyncProbeEngine()
+            breakers = {url: CircuitBreaker() for url in urls}
+            pool.probe_all(lambda eps: self._probe_round(engine, store, eps, True)[0])
+            current = pool.best()
+            now = time.time()
+            degrade_at, restore_at = healthy_cycles, None
+            for cycle in range(healthy_cycles + max_cycles + recover_cycles):
+                now += DAEMON_INTERVAL
+                if cycle == degrade_at:
+                    primary.profile = LinkProfile(**dict(base.to_dict(), **self.DEGRADATIONS[mode]))
+                summary, results = self._probe_round(engine, store, urls, False, direct.url)
+                for url, (delay, bps) in summary.items():
+                    pool.update(url, delay, bps)
+                direct_results = {r.route: r for r in results if r.endpoint == DIRECT_ENDPOINT}
+                for url in urls:
+                    verdict = assess_endpoint([r for r in results if r.endpoint == url], direct_results,
+                                              breakers[url].allows)
+                    if verdict:
+                        breakers[url].record(verdict[0], verdict[1], now=now)
+                current = pool.select(current, lambda ep: breakers[ep].allows)
+                state = breakers[primary.url].state
+                timeline.append({"cycle": cycle, "primary": state,
+                                 "selected": "primary" if current == primary.url else "backup"})
+                if cycle >= degrade_at and restore_at is None:
+                    if detected is None and state != CircuitBreaker.CLOSED:
+                        detected = cycle - degrade_at + 1
+                    if switched is None and current != primary.url:
+                        switched = cycle - degrade_at + 1
+                    if detected is not None and switched is not None or cycle - degrade_at + 1 >= max_cycles:
+                        restore_at = cycle + 1
+                        primary.profile = LinkProfile(**base.to_dict())
+                elif restore_at is not None and cycle >= restore_at:
+                    if state == CircuitBreaker.CLOSED and current == primary.url:
+                        recovered = cycle - restore_at + 1
+                        break
+            store.close()
+        return {"mode": mode, "degradation": self.DEGRADATIONS[mode],
+                "detect_cycles": detected, "switch_cycles": switched, "recover_cycles": recovered,
+                "detect_seconds": detected * DAEMON_INTERVAL if detected else None,
+                "recover_seconds": recovered * DAEMON_INTERVAL if recovered else None,
+                "timeline": timeline,
+                "passed": detected is not None and detected <= BREAKER_FAILURE_THRESHOLD
+                and switched is not None and switched <= detected and recovered is not None}
+
+    def run(self, scenarios: Optional[List[str]] = None) -> dict:
+        scenarios = [s for s in (scenarios or self.SCENARIOS) if s in self.SCENARIOS]
+        report = {"rounds": self.rounds, "seed": self.seed}
+        with tempfile.TemporaryDirectory(prefix="cfproxy-sim-") as tmp:
+            if "accuracy" in scenarios:
+                report["accuracy"] = self.accuracy()
+            if "ranking" in scenarios:
+                report["ranking"] = self.ranking(Path(tmp))
+            if "failover" in scenarios:
+                report["failover"] = [self.failover(Path(tmp), mode) for mode in self.DEGRADATIONS]
+        rows = report.get("accuracy", []) + report.get("failover", [])
+        if "ranking" in report:
+            rows.append(report["ranking"])
+        report["passed"] = all(row["passed"] for row in rows)
+        return report
+
+
+class AdaptiveLimiter:
+    """自适应并发上限（AIMD）：每完成一个任务上限缓慢增加，出现服务端错误或节点劣化时减半"""
+
+    def __init__(self, maximum: int, initial: Optional[int] = None, minimum: int = 1):
+        self.maximum = max(minimum, maximum)
+        self.minimum = minimum
+        self.limit = float(min(self.maximum, initial or self.maximum))
+        self.initial = int(self.limit)
+        self.active = 0
+        self.peak = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def allowed(self) -> int:
+        return max(self.minimum, int(self.limit))
+
+    def acquire(self):
+        with self._cond:
+            while self.active >= self.allowed:
+                self._cond.wait()
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def release(self, ok: bool = True):
+        with self._cond:
+            self.active -= 1
+            if ok:
+                # 加法增长：约每完成“当前上限”个任务加一
+                self.limit = min(float(self.maximum), self.limit + 1 / max(self.limit, 1.0))
+            self._cond.notify_all()
+
+    def decrease(self) -> bool:
+        """乘法减半；同一波并发错误只减半一次"""
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease < SYNC_DECREASE_HOLD or self.limit <= self.minimum:
+                return False
+            self._last_decrease = now
+            self.limit = max(float(self.minimum), self.limit / 2)
+            self.decreases += 1
+            return True
+
+
+class RepoSync:
+    """按清单并发 clone/fetch 多个仓库
+
+    大仓库先开始（尾部只剩小仓库，缩短整体耗时）；并发受 AdaptiveLimiter 约束；
+    Worker 5xx 与瞬时网络错误按指数退避重试，重试时轮换到下一个可用节点。
+    与 A/B 基准测试一样使用剥离了加速规则的全局配置副本，再用 -c 指定本次尝试的节点，
+    仓库的 origin 始终保持 https://github.com/ 原始地址。
+    """
+
+    def __init__(self, entries: List[dict], host_routes: Dict[str, dict], endpoints, limiter: AdaptiveLimiter,
+                 retries: int = SYNC_RETRIES, timeout: float = SYNC_TIMEOUT, progress=None,
+                 strip_hosts: Optional[List[str]] = None, references=None):
+        self.entries = entries
+        # 经节点代理的主机（主机 → 路由），以及需要从全局配置副本中剥离规则的主机（默认同前者）
+        self.host_routes = host_routes
+        self.strip_hosts = list(host_routes) if strip_hosts is None else strip_hosts
+        # 返回本次可用节点列表（按优先级，空列表表示直连）的回调，节点健康变化时随之变化
+        self.endpoints = endpoints
+        self.limiter = limiter
+        self.retries = max(0, retries)
+        self.timeout = timeout
+        self.progress = progress
+        # 返回仓库本地镜像目录（无镜像时为 None）的回调，新克隆以 --reference 复用镜像中的对象
+        self.references = references
+
+    @staticmethod
+    def load_manifest(path: Path, root: Optional[Path] = None) -> List[dict]:
+        """读取JSON清单：{"root": 目录, "depth": 默认深度, "repos": ["owner/name" 或 {repo, ref, depth, path, size}]}
+
+        也可以直接是仓库数组。相对路径相对清单所在目录（或 root）。
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {"repos": data}
+        base = (root or path.resolve().parent / data.get("root", ".")).resolve()
+        entries, seen = [], set()
+        for item in data.get("repos", []):
+            if isinstance(item, str):
+                item = {"repo": item}
+            repo = str(item.get("repo", "")).strip()
+            if not repo:
+                raise ValueError(f"清单条目缺少 repo: {item}")
+            url = repo if "://" in repo else f"https://github.com/{repo.strip('/')}"
+            if repo.startswith(GITHUB_SSH_PREFIXES[0]):
+                url = "https://github.com/" + repo[len(GITHUB_SSH_PREFIXES[0]):]
+            if not url.endswith(".git"):
+                url += ".git"
+            name = url.rstrip("/").split("/")[-1][:-len(".git")]
+            target = (base / item.get("path", name)).resolve()
+            if target in seen:
+                raise ValueError(f"清单中有多个仓库检出到同一目录: {target}")
+            seen.add(target)
+            entries.append({"name": repo, "url": url, "ref": str(item.get("ref", "")),
+                            "depth": int(item.get("depth", data.get("depth", 0))), "path": target,
+                            "size": int(item.get("size", 0))})
+        return entries
+
+    @staticmethod
+    def _objects_size(path: Path) -> int:
+        objects = path / ".git" / "objects"
+        return sum(f.stat().st_size for f in objects.rglob("*") if f.is_file()) if objects.exists() else 0
+
+    def _git(self, endpoint: str, args: List[str], env: dict, cwd: Path) -> Tuple[int, str]:
+        """在指定节点（空字符串为直连）下执行git，返回 (退出码, 完整错误输出)"""
+        overrides = []
+        if endpoint:
+            for host, route in self.host_routes.items():
+                overrides += ["-c", f"url.{endpoint}{route['prefix']}.insteadOf=https://{host}/"]
+        try:
+            result = subprocess.run(["git"] + overrides + args, capture_output=True, env=env, cwd=str(cwd),
+                                    timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            return -1, "timed out"
+        if result.returncode != 0:
+            return result.returncode, result.stderr.decode("utf-8", "replace").strip() or f"exit {result.returncode}"
+        return 0, ""
+
+    def _attempt(self, entry: dict, endpoint: str, env: dict, existed: bool, reference: Optional[Path] = None) -> str:
+        """执行一次同步，返回git的错误输出（成功为空）；reference 为新克隆复用对象的本地镜像目录"""
+        path, ref, depth = entry["path"], entry["ref"], entry["depth"]
+        depth_args = ["--depth", str(depth)] if depth > 0 else []
+        if not existed:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if not re.fullmatch(r"[0-9a-f]{40}", ref):
+                reference_args = ["--reference-if-able", str(reference), "--dissociate"] if reference else []
+                args = ["clone", "--quiet"] + depth_args + reference_args + (["--branch", ref] if ref else []) + \
+                    [entry["url"], str(path)]
+                return self._git(endpoint, args, env, path.parent)[1]
+            # 提交号无法用 --branch 克隆：先初始化再按提交号拉取
+            for args in (["init", "--quiet", str(path)], ["-C", str(path), "remote", "add", "origin", entry["url"]]):
+                code, error = self._git("", args, env, path.parent)
+                if code:
+                    return error
+        code, error = self._git(endpoint, ["-C", str(path), "fetch", "--quiet"] + depth_args +
+                                ["origin", ref or "HEAD"], env, path.parent)
+        if code:
+            return error
+        return self._git("", ["-C", str(path), "checkout", "--quiet", "--detach", "FETCH_HEAD"], env, path.parent)[1]
+
+    def sync_one(self, entry: dict, env: dict) -> dict:
+        """同步单个仓库（含退避重试），返回结果记录"""
+        path = entry["path"]
+        existed = (path / ".git").exists()
+        before = self._objects_size(path) if existed else 0
+        reference = None
+        if not existed and self.references and not re.fullmatch(r"[0-9a-f]{40}", entry["ref"]):
+            reference = self.references(entry["url"])
+        # mirror：对象取自本地镜像，bytes 不代表网络接收量
+        result = {"name": entry["name"], "url": entry["url"], "path": str(path), "op": "fetch" if existed else "clone",
+                  "ok": False, "attempts": 0, "seconds": 0.0, "bytes": 0, "endpoint": "", "error": "",
+                  "mirror": bool(reference)}
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            candidates = self.endpoints()
+            endpoint = candidates[attempt % len(candidates)] if candidates else ""
+            result["attempts"] = attempt + 1
+            result["endpoint"] = endpoint or DIRECT_ENDPOINT
+            self.limiter.acquire()
+            error = "中断"
+            try:
+                error = self._attempt(entry, endpoint, env, existed, reference)
+            finally:
+                self.limiter.release(ok=not error)
+            if not error:
+                break
+            # 哑协议等场景下 5xx 出现在中间行，按完整输出判定，只记录最后一行
+            server_error = bool(SYNC_SERVER_ERROR.search(error))
+            if server_error:
+                self.limiter.decrease()
+            result["error"] = error.splitlines()[-1]
+            if attempt == self.retries or not (server_error or SYNC_TRANSIENT_ERROR.search(error)):
+                break
+            if not existed:
+                shutil.rmtree(str(path), ignore_errors=True)
+            # 退避期间不占并发名额
+            time.sleep(SYNC_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+        result["seconds"] = time.perf_counter() - start
+        if not error:
+            after = self._objects_size(path)
+            result.update(ok=True, error="", bytes=max(0, after - before), size=after)
+        if self.progress:
+            self.progress(result)
+        return result
+
+    def run(self) -> List[dict]:
+        """按大小降序提交全部仓库，返回各仓库结果（顺序同提交顺序）"""
+        ordered = sorted(self.entries, key=lambda e: e["size"], reverse=True)
+        with tempfile.TemporaryDirectory(prefix="cfproxy-sync-") as tmp:
+            env = dict(os.environ, GIT_CONFIG_GLOBAL=str(_isolated_gitconfig(Path(tmp), self.strip_hosts)),
+                       GIT_TERMINAL_PROMPT="0")
+            with futures.ThreadPoolExecutor(max_workers=max(1, self.limiter.maximum)) as executor:
+                return list(executor.map(lambda e: self.sync_one(e, env), ordered))
+
+    @staticmethod
+    def summarize(results: List[dict], wall: float) -> dict:
+        ok = [r for r in results if r["ok"]]
+        total = sum(r["bytes"] for r in ok)
+        return {"repos": len(results), "ok": len(ok), "failed": len(results) - len(ok), "bytes": total,
+                "seconds": wall, "bps": total / wall if wall > 0 else 0,
+                "retries": sum(r["attempts"] - 1 for r in results)}
+
+
+class ClonePlanner:
+    """clone 策略优化：探测仓库（ls-remote + 协议能力），按仓库大小、用途与实测吞吐估算各策略耗时并选择
+
+    预计接收量优先取同一仓库同一策略上次的实际接收量，其次取历史中该策略“接收量/仓库大小”的中位数，
+    都没有时用先验比例；吞吐优先取同一节点历史 clone 的中位数。每次 clone 的选择与实际耗时都写入历史。
+    """
+
+    def __init__(self, history_file: Path = CLONE_HISTORY_FILE):
+        self.history_file = history_file
+        self.history = self._load()
+
+    def _load(self) -> List[dict]:
+        records = []
+        try:
+            with open(self.history_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return records
+
+    def record(self, record: dict):
+        """追加一条 clone 记录，超过保留条数时裁剪最早的记录"""
+        self.history.append(record)
+        try:
+            with open(self.history_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if len(self.history) > CLONE_MAX_RECORDS:
+                # 写临时文件后原子替换，裁剪中途崩溃也不会丢失历史
+                self.history = self.history[-CLONE_MAX_RECORDS:]
+                tmp = self.history_file.with_name(self.history_file.name + ".tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in self.history)
+                os.replace(tmp, self.history_file)
+        except OSError:
+            pass
+
+    @staticmethod
+    def probe(url: str, timeout: float = TEST_TIMEOUT * 6) -> dict:
+        """经当前Git配置（含加速规则）执行 ls-remote，记录耗时、默认分支，并从报文跟踪中识别服务端能力"""
+        env = dict(os.environ, GIT_TRACE_PACKET="1", GIT_TERMINAL_PROMPT="0")
+        begin = time.perf_counter()
+        try:
+            proc = subprocess.run(["git", "-c", "protocol.version=2", "ls-remote", "--symref", url, "HEAD"],
+                                  capture_output=True, text=True, errors="replace", env=env, timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            return {"ok": False, "seconds": time.perf_counter() - begin, "error": str(e) or e.__class__.__name__}
+        seconds = time.perf_counter() - begin
+        if proc.returncode != 0:
+            errors = [line for line in proc.stderr.splitlines() if not line.lstrip().startswith(("packet:", "pkt-line"))]
+            return {"ok": False, "seconds": seconds, "error": (errors or ["ls-remote 失败"])[-1].strip()}
+        head = next((line.split()[1][len("refs/heads/"):] for line in proc.stdout.splitlines()
+                     if line.startswith("ref: ")), "")
+        # 服务端发来的报文（"git<" 或 "ls-remote<"）：协议 v2 的 fetch=... 能力行，或 v0 首条引用后附带的能力列表
+        caps = " ".join(m.group(1) for m in re.finditer(r"packet:\s+[\w-]+< (.*)", proc.stderr))
+        return {"ok": True, "seconds": seconds, "head": head, "filter": bool(re.search(r"\bfilter\b", caps)),
+                "shallow": bool(re.search(r"\bshallow\b", caps)), "v2": "version 2" in caps}
+
+    def throughput(self, endpoint: str) -> float:
+        """同一节点最近几次成功 clone 的吞吐中位数，没有记录时为0"""
+        samples = [r["bps"] for r in self.history
+                   if r.get("endpoint") == endpoint and not r.get("code") and r.get("bps") and not r.get("mirror")]
+        return statistics.median(samples[-CLONE_THROUGHPUT_SAMPLES:]) if samples else 0.0
+
+    def estimate_bytes(self, url: str, strategy: str, size: int) -> Tuple[float, str]:
+        """预计接收量与其来源"""
+        done = [r for r in self.history
+                if r.get("strategy") == strategy and not r.get("code") and r.get("bytes") and not r.get("mirror")]
+        same = [r for r in done if r.get("url") == url]
+        if same:
+            return same[-1]["bytes"], "上次"
+        ratios = [r["bytes"] / r["size"] for r in done if r.get("size")]
+        if len(ratios) >= CLONE_MIN_HISTORY:
+            return size * statistics.median(ratios), "历史"
+        return size * CLONE_PRIOR_RATIOS[strategy], "先验"
+
+    def plan(self, url: str, intent: str, size: int, bps: float, probe: dict, sparse: bool = False,
+             budget: float = CLONE_TIME_BUDGET) -> dict:
+        """选择策略，返回 {strategy, reason, estimates: {策略: {bytes, seconds, source}}}"""
+        candidates = ["sparse"] if sparse else list(CLONE_INTENTS[intent])
+        if not probe.get("filter"):
+            # 服务端不支持部分克隆时去掉 filter 类策略（sparse 仍可用，只是不省下载量）
+            candidates = [c for c in candidates if "filter" not in " ".join(CLONE_STRATEGIES[c])] or \
+                ["sparse" if sparse else "full"]
+        estimates = {}
+        for strategy in candidates:
+            nbytes, source = self.estimate_bytes(url, strategy, size)
+            if not probe.get("filter") and strategy == "sparse":
+                nbytes = size
+            estimates[strategy] = {"bytes": round(nbytes), "source": source,
+                                   "seconds": round(probe.get("seconds", 0) + nbytes / bps, 1) if nbytes else None}
+        if len(candidates) == 1:
+            reason = "指定了稀疏目录" if sparse else "只需当前提交" if intent == "ci" else "服务端不支持部分克隆"
+            return {"strategy": candidates[0], "reason": reason, "estimates": estimates}
+        if not size and all(e["source"] != "上次" for e in estimates.values()):
+            choice = next((c for c in candidates if c != "full"), candidates[0])
+            return {"strategy": choice, "reason": "仓库大小未知，避免完整克隆", "estimates": estimates}
+        for strategy in candidates:
+            if estimates[strategy]["seconds"] is not None and estimates[strategy]["seconds"] <= budget:
+                return {"strategy": strategy, "reason": f"预计 {estimates[strategy]['seconds']:.0f} 秒，不超过 {budget:.0f} 秒",
+                        "estimates": estimates}
+        # 无法预估耗时的候选（接收量未知）排在最后，不能当作 0 秒
+        strategy = min(candidates, key=lambda c: (estimates[c]["seconds"] is None, estimates[c]["seconds"] or 0))
+        return {"strategy": strategy, "reason": f"所有候选均超过 {budget:.0f} 秒，选预计最快的", "estimates": estimates}
+
+    @staticmethod
+    def clone(url: str, target: Path, strategy: str, ref: str = "", sparse_paths: Optional[List[str]] = None,
+              depth: int = 0, quiet: bool = False, reference: Optional[Path] = None) -> Tuple[int, float, int]:
+        """执行 clone（sparse 时随后设置稀疏目录），返回 (退出码, 耗时秒, 对象库大小)
+
+        reference 为本地镜像目录时复用其中的对象，只从远程补拉缺少的部分。
+        """
+        args = ["git", "clone"] + CLONE_STRATEGIES[strategy]
+        if depth and strategy != "shallow":
+            args += ["--depth", str(depth)]
+        if ref:
+            args += ["--branch", ref]
+        if reference:
+            args += ["--reference-if-able", str(reference), "--dissociate"]
+        output = subprocess.DEVNULL if quiet else None
+        begin = time.perf_counter()
+        code = subprocess.run(args + [url, str(target)], stdout=output, stderr=output).returncode
+        if code == 0 and strategy == "sparse" and sparse_paths:
+            code = subprocess.run(["git", "-C", str(target), "sparse-checkout", "set"] + sparse_paths,
+                                  stdout=output, stderr=output).returncode
+        seconds = time.perf_counter() - begin
+        return code, seconds, RepoSync._objects_size(target) if code == 0 else 0
+
+
+class Trace2Collector:
+    """Git trace2 事件流收集器：把 clone/fetch/pull/push 的事件汇总为单次操作记录
+
+    记录字段：ts、op、url、host、endpoint（实际连接的代理/直连地址）、wall_ms、
+    pack_size（本次写入的包文件大小）、bytes、bps、code、repo；
+    操作期间运行过 git-lfs 子进程（检出时的 filter-process、hook 中的 git lfs）时另有 lfs_ms、lfs_bytes、lfs_bps。
+    trace2 不直接给出传输字节数，收到的数据量按操作期间新写入的 pack 文件大小统计；
+    LFS 对象按新写入 lfs/objects 的文件统计，耗时取 git-lfs 子进程的运行时长（bps 按扣除该时长后的耗时计算）。
+    """
+
+    def __init__(self, store_file: Path = TELEMETRY_FILE, on_records=None):
+        self.store_file = store_file
+        # 新记录回调（写入时序库等）
+        self.on_records = on_records
+        self._roots: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def feed(self, line: str):
+        """写入一行trace2事件（JSON）"""
+        try:
+            event = json.loads(line)
+            sid = event["sid"]
+        except (ValueError, KeyError, TypeError):
+            return
+        root_sid = sid.split("/", 1)[0]
+        is_root = sid == root_sid
+        with self._lock:
+            root = self._roots.setdefault(root_sid, {"url": "", "op": "", "worktree": ""})
+            kind = event.get("event")
+            if kind == "start" and is_root:
+                root["argv"] = event.get("argv", [])
+                root["time"] = event.get("time", "")
+            elif kind == "cmd_name" and is_root:
+                root["op"] = event.get("name", "")
+            elif kind == "def_repo" and is_root:
+                root["worktree"] = event.get("worktree", "")
+            elif kind == "exit" and is_root:
+                root["t_abs"] = event.get("t_abs", 0)
+                root["code"] = event.get("code", 0)
+            elif kind == "child_start" and self._is_lfs(event.get("argv", [])):
+                root.setdefault("lfs_children", set()).add((sid, event.get("child_id")))
+            elif kind == "child_exit" and (sid, event.get("child_id")) in root.get("lfs_children", ()):
+                root["lfs_seconds"] = root.get("lfs_seconds", 0) + event.get("t_rel", 0)
+            if kind in ("start", "child_start"):
+                argv = event.get("argv", [])
+                urls = [arg for arg in argv if isinstance(arg, str) and arg.startswith(("https://", "http://"))]
+                # 根进程参数中的地址（改写前的原始地址）优先，各进程的事件文件读取顺序不定
+                if urls and (not root["url"] or (kind == "start" and is_root)):
+                    root["url"] = urls[0]
+                # 远程助手的参数是 insteadOf 改写后实际连接的地址，用于确定节点
+                if urls and self._is_remote_helper(argv):
+                    root["remote"] = urls[-1]
+
+    @staticmethod
+    def _is_remote_helper(argv: list) -> bool:
+        """进程是否为 git-remote-http(s)（以 git remote-https 或 git-remote-https 形式出现）"""
+        return any(isinstance(arg, str) and arg.rsplit("/", 1)[-1] in
+                   ("remote-https", "remote-http", "git-remote-https", "git-remote-http") for arg in argv[:2])
+
+    @staticmethod
+    def _is_lfs(argv: list) -> bool:
+        """子进程是否为 git-lfs（filter-process 以 shell 命令字符串形式出现在 argv 中）"""
+        return bool(argv) and isinstance(argv[0], str) and argv[0].split(" ", 1)[0].endswith("git-lfs")
+
+    @staticmethod
+    def _lfs_size(worktree: str, start_ts: float, end_ts: float) -> int:
+        """统计操作期间在仓库内新写入的LFS对象总大小"""
+        total = 0
+        for lfs_dir in (Path(worktree) / ".git" / "lfs" / "objects", Path(worktree) / "lfs" / "objects"):
+            if not lfs_dir.is_dir():
+                continue
+            for path in lfs_dir.rglob("*"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                if path.is_file() and start_ts - 1 <= stat.st_mtime <= end_ts + 1:
+                    total += stat.st_size
+            break
+        return total
+
+    @staticmethod
+    def _pack_size(worktree: str, start_ts: float, end_ts: float) -> int:
+        """统计操作期间在仓库内新写入的pack文件总大小"""
+        total = 0
+        for pack_dir in (Path(worktree) / ".git" / "objects" / "pack", Path(worktree) / "objects" / "pack"):
+            if not pack_dir.is_dir():
+                continue
+            for pack in pack_dir.glob("*.pack"):
+                try:
+                    stat = pack.stat()
+                except OSError:
+                    continue
+                if start_ts - 1 <= stat.st_mtime <= end_ts + 1:
+                    total += stat.st_size
+            break
+        return total
+
+    def flush(self) -> List[dict]:
+        """把已结束的根进程汇总为记录并写入本地存储"""
+        records = []
+        with self._lock:
+            finished = [sid for sid, root in self._roots.items() if "t_abs" in root]
+            for sid in finished:
+                root = self._roots.pop(sid)
+                if root["op"] not in TELEMETRY_OPS:
+                    continue
+                try:
+                    start_ts = datetime.strptime(root.get("time", ""), "%Y-%m-%dT%H:%M:%S.%fZ") \
+                        .replace(tzinfo=timezone.utc).timestamp()
+                except ValueError:
+                    start_ts = time.time() - root["t_abs"]
+                wall = max(root["t_abs"], 1e-6)
+                pack_size = self._pack_size(root["worktree"], start_ts, start_ts + wall) if root["worktree"] else 0
+                lfs_seconds = min(root.get("lfs_seconds", 0), wall)
+                parsed = urllib.parse.urlparse(root.get("remote") or root["url"])
+                record = {
+                    "ts": round(start_ts, 3), "op": root["op"], "url": root["url"],
+                    "host": urllib.parse.urlparse(root["url"]).hostname or "",
+                    "endpoint": f"{parsed.scheme}://{parsed.netloc}" if parsed.netloc else DIRECT_ENDPOINT,
+                    "wall_ms": round(wall * 1000, 1), "pack_size": pack_size, "bytes": pack_size,
+                    "bps": round(pack_size / max(wall - lfs_seconds, 1e-6), 1), "code": root.get("code", 0),
+                    "repo": root["worktree"],
+                }
+                if lfs_seconds > 0:
+                    lfs_bytes = self._lfs_size(root["worktree"], start_ts, start_ts + wall) if root["worktree"] else 0
+                    record.update(lfs_ms=round(lfs_seconds * 1000, 1), lfs_bytes=lfs_bytes,
+                                  lfs_bps=round(lfs_bytes / lfs_seconds, 1))
+                records.append(record)
+        if records:
+            self.append(records)
+            if self.on_records:
+                self.on_records(records)
+        return records
+
+    def collect_dir(self, trace_dir: Path = TRACE2_DIR) -> List[dict]:
+        """收集目录模式下的trace2文件：已结束的操作入库后删除文件，长时间未结束的残留文件直接清理"""
+        if not trace_dir.is_dir():
+            return []
+        files = {}
+        for path in trace_dir.iterdir():
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    lines = f.readlines()
+            except OSError:
+                continue
+            for line in lines:
+                self.feed(line)
+            try:
+                files[path] = json.loads(lines[0])["sid"].split("/", 1)[0] if lines else ""
+            except (ValueError, KeyError):
+                files[path] = ""
+        with self._lock:
+            pending = {sid for sid, root in self._roots.items() if "t_abs" not in root}
+        records = self.flush()
+        now = time.time()
+        for path, root_sid in files.items():
+            try:
+                if root_sid not in pending or now - path.stat().st_mtime > TRACE2_STALE_SECONDS:
+                    path.unlink()
+            except OSError:
+                pass
+        # 未结束的操作下次重新读取文件，避免重复累计
+        with self._lock:
+            self._roots.clear()
+        self.prune(trace_dir)
+        return records
+
+    @staticmethod
+    def prune(trace_dir: Path = TRACE2_DIR, max_files: int = TRACE2_MAX_FILES) -> int:
+        """事件文件超过上限时删除最旧的文件，返回删除数"""
+        try:
+            paths = list(trace_dir.iterdir())
+        except OSError:
+            return 0
+        if len(paths) <= max_files:
+            return 0
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = path.stat().st_mtime
+            except OSError:
+                pass
+        removed = 0
+        for path in sorted(mtimes, key=mtimes.get)[:len(mtimes) - max_files]:
+            try:
+                path.unlink()
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def serve_socket(self, socket_path: Path, stop_event: threading.Event):
+        """Unix socket 模式：持续接收git进程推送的事件（阻塞，需在后台线程运行）"""
+        if socket_path.exists():
+            # 已有其他进程在接收事件时不抢占
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(socket_path))
+                raise OSError("trace2 socket 已被其他进程占用")
+            except (ConnectionRefusedError, FileNotFoundError):
+                socket_path.unlink()
+            finally:
+                probe.close()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(socket_path))
+        server.listen(64)
+        server.settimeout(1)
+
+        def handle(conn):
+            with conn, conn.makefile("r", encoding="utf-8", errors="replace") as stream:
+                for line in stream:
+                    self.feed(line)
+            self.flush()
+
+        try:
+            while not stop_event.is_set():
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                threading.Thread(target=handle, args=(conn,), daemon=True).start()
+        finally:
+            server.close()
+            if socket_path.exists():
+                socket_path.unlink()
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """跨进程写锁：锁旁边的 .lock 文件（裁剪会替换记录文件本身）；不支持文件锁的平台只靠进程内锁"""
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(str(self.store_file.with_name(self.store_file.name + ".lock")), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def append(self, records: List[dict]):
+        """追加记录；文件超过 TELEMETRY_TRIM_BYTES 时裁剪到最近 TELEMETRY_MAX_RECORDS 条"""
+        with self._lock:
+            try:
+                with self._file_lock():
+                    with open(self.store_file, "a", encoding="utf-8") as f:
+                        for record in records:
+                            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    if self.store_file.stat().st_size > TELEMETRY_TRIM_BYTES:
+                        # 写临时文件后原子替换，中途崩溃不会截断记录；持锁期间其他进程的追加不会丢失
+                        with open(self.store_file, "r", encoding="utf-8") as f:
+                            lines = f.readlines()
+                        tmp = self.store_file.with_name(self.store_file.name + ".tmp")
+                        with open(tmp, "w", encoding="utf-8") as f:
+                            f.writelines(lines[-TELEMETRY_MAX_RECORDS:])
+                        os.replace(tmp, self.store_file)
+            except OSError:
+                pass
+
+    def load(self, window: float = TELEMETRY_WINDOW) -> List[dict]:
+        """读取时间窗口内的记录"""
+        since = time.time() - window
+        records = []
+        try:
+            with open(self.store_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("ts", 0) >= since:
+                        records.append(record)
+        except OSError:
+            pass
+        return records
+
+    @staticmethod
+    def summarize(records: List[dict]) -> Dict[str, dict]:
+        """按节点汇总：操作数、收到字节数、传输耗时、平均吞吐（LFS 对象单独汇总）"""
+        summary: Dict[str, dict] = {}
+        for record in records:
+            st = summary.setdefault(record["endpoint"], {"ops": 0, "bytes": 0, "seconds": 0.0, "failed": 0,
+                                                         "lfs_bytes": 0, "lfs_seconds": 0.0})
+            st["ops"] += 1
+            if record.get("code"):
+                st["failed"] += 1
+            if record.get("bytes"):
+                st["bytes"] += record["bytes"]
+                st["seconds"] += (record["wall_ms"] - record.get("lfs_ms", 0)) / 1000
+            if record.get("lfs_bytes"):
+                st["lfs_bytes"] += record["lfs_bytes"]
+                st["lfs_seconds"] += record["lfs_ms"] / 1000
+        for st in summary.values():
+            st["bps"] = st["bytes"] / st["seconds"] if st["seconds"] > 0 else 0
+            st["lfs_bps"] = st["lfs_bytes"] / st["lfs_seconds"] if st["lfs_seconds"] > 0 else 0
+        return summary
+
+
+def diagnose_probe(proxied: ProbeResult, direct: Optional[ProbeResult] = None) -> str:
+    """根据分阶段耗时判断慢在哪一段：边缘节点 / Worker / GitHub上游"""
+    if not proxied.ok:
+        return f"请求失败（{proxied.error or proxied.status}）"
+    rtt = max(proxied.connect, 1.0)
+    # 服务端处理耗时 ≈ 首字节耗时 - 一个往返
+    server_time = max(proxied.ttfb - rtt, 0)
+    if proxied.connect + proxied.tls > server_time and proxied.connect > 150:
+        return "边缘节点较慢（建连/握手耗时高，可尝试优选IP）"
+    if direct is not None and direct.ok:
+        direct_server = max(direct.ttfb - max(direct.connect, 1.0), 0)
+        if server_time > direct_server * 2 + 100:
+            return "Worker转发较慢（服务端耗时明显高于直连）"
+        if direct_server > 500:
+            return "GitHub上游较慢（直连服务端耗时同样偏高）"
+    if server_time > 1000:
+        return "Worker或GitHub上游较慢（首字节耗时高）"
+    return "正常"
+
+
+# Git配置文件语法（节头 / 键值行）
+_GIT_SECTION_RE = re.compile(r'^\s*\[\s*([A-Za-z0-9.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]')
+_GIT_ENTRY_RE = re.compile(r'^\s*([A-Za-z][A-Za-z0-9-]*)\s*(?:=(.*))?$', re.S)
+
+
+def _isolated_gitconfig(workdir: Path, hosts) -> Path:
+    """复制全局Git配置并移除指向给定主机的 insteadOf 规则，配合 GIT_CONFIG_GLOBAL 使用
+
+    git 在多条 insteadOf 前缀等长时取先读到的一条，全局规则会盖过 -c 临时规则，因此需要先剥离。
+    """
+    config_path = workdir / "gitconfig"
+    source = _global_gitconfig_path()
+    if source.exists():
+        shutil.copyfile(str(source), str(config_path))
+    else:
+        config_path.touch()
+    cfg = GitConfigFile(config_path)
+    originals = tuple(f"https://{host}/" for host in hosts)
+    for key, value in cfg.get_regexp(r"^url\..*\.insteadof$"):
+        if value.startswith(originals):
+            cfg.unset_all(key, f"^{re.escape(value)}$")
+    cfg.commit()
+    return config_path
+
+
+def _global_gitconfig_path() -> Path:
+    """定位 git config --global 实际读写的文件（与Git的查找顺序一致）"""
+    env_path = os.environ.get("GIT_CONFIG_GLOBAL")
+    if env_path:
+        return Path(env_path).expanduser()
+    home = Path(os.environ["HOME"]) if os.environ.get("HOME") else Path.home()
+    xdg_home = os.environ.get("XDG_CONFIG_HOME")
+    xdg_path = (Path(xdg_home) if xdg_home else home / ".config") / "git" / "config"
+    home_path = home / ".gitconfig"
+    if not home_path.exists() and xdg_path.exists():
+        return xdg_path
+    return home_path
+
+
+class PrometheusExporter:
+    """极简 Prometheus 文本格式导出器：后台线程提供 GET /metrics，每次抓取时调用 collect() 生成内容"""
+
+    def __init__(self, collect, host: str = "127.0.0.1", port: int = 9477):
+        class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                try:
+                    body = collect().encode("utf-8")
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                # 抓取很频繁，不输出访问日志
+                pass
+
+        self.server = _Server((host, port), MetricsHandler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @staticmethod
+    def _escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    @classmethod
+    def render(cls, families: List[Tuple[str, str, str, List[Tuple[dict, float]]]]) -> str:
+        """families: [(指标名, 类型, 说明, [(标签, 值)])] → Prometheus 文本格式"""
+        lines = []
+        for name, kind, help_text, samples in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{cls._escape(v)}"' for k, v in labels.items())
+                value = float(value)
+                value_str = "NaN" if math.isnan(value) else ("+Inf" if value == float("inf") else repr(value))
+                lines.append(f"{name}{{{label_str}}} {value_str}" if label_str else f"{name} {value_str}")
+        return "\n".join(lines) + "\n"
+
+
+class ContentCache:
+    """本地内容寻址 HTTP 缓存（raw/gist/codeload）
+
+    响应体按 sha256 存放在 objects/ 下（内容相同的地址只存一份），索引记录 地址 → 摘要与校验信息。
+    固定到提交号的地址内容不可变，命中后不再访问上游；分支等其余地址每次用 ETag/Last-Modified
+    条件请求重新验证，304 时返回本地内容。总大小超过上限时按最近使用淘汰（无地址引用的内容随之删除）。
+    """
+
+    # 随缓存内容一并保存并回放的响应头
+    KEEP_HEADERS = ("content-type", "etag", "last-modified", "content-disposition")
+    STAT_KEYS = ("hits", "misses", "revalidated", "coalesced", "stale", "bytes_saved", "bytes_fetched")
+
+    def __init__(self, root: Path = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects = root / "objects"
+        self.index_file = root / "index.json"
+        self._last_save = 0.0
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self.entries: Dict[str, dict] = data.get("entries", {})
+        self.stats = {key: data.get("stats", {}).get(key, 0) for key in self.STAT_KEYS}
+
+    @staticmethod
+    def immutable(host: str, path: str) -> bool:
+        """地址是否固定到提交号：raw /o/r/<sha>/…、gist /u/<id>/raw/<sha>/…、codeload /o/r/<格式>/<sha>"""
+        parts = path.split("?", 1)[0].strip("/").split("/")
+        index = {"raw.githubusercontent.com": 2, "gist.githubusercontent.com": 3, "codeload.github.com": 3}.get(host)
+        if index is None or len(parts) <= index:
+            return False
+        if host == "gist.githubusercontent.com" and parts[2] != "raw":
+            return False
+        return re.fullmatch(r"[0-9a-f]{40}|[0-9a-f]{64}", parts[index]) is not None
+
+    def blob_path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest
+
+    def lookup(self, key: str) -> Optional[dict]:
+        entry = self.entries.get(key)
+        if entry and self.blob_path(entry["digest"]).is_file():
+            return entry
+        return None
+
+    def hit(self, key: str, kind: str = ""):
+        """记一次命中（kind: revalidated 重新验证 / coalesced 合并请求 / stale 上游失败回退）"""
+        entry = self.entries[key]
+        entry["last_used"] = time.time()
+        self.stats["hits"] += 1
+        self.stats["bytes_saved"] += entry["size"]
+        if kind:
+            self.stats[kind] += 1
+        self.save()
+
+    def begin(self):
+        """新建临时文件用于写入响应体，返回 (文件对象, 摘要对象)"""
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        return tempfile.NamedTemporaryFile(dir=str(tmp_dir), delete=False), hashlib.sha256()
+
+    def store(self, key: str, tmp, digest: str, size: int, headers: List[Tuple[str, str]], immutable: bool):
+        """把写完的临时文件按摘要入库并登记地址"""
+        tmp.close()
+        blob = self.blob_path(digest)
+        if blob.exists():
+            os.unlink(tmp.name)
+        else:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp.name, str(blob))
+        now = time.time()
+        self.entries[key] = {"digest": digest, "size": size, "immutable": immutable, "stored": now, "last_used": now,
+                             "etag": next((v for k, v in headers if k.lower() == "etag"), ""),
+                             "last_modified": next((v for k, v in headers if k.lower() == "last-modified"), ""),
+                             "headers": [[k, v] for k, v in headers if k.lower() in self.KEEP_HEADERS]}
+        self.stats["misses"] += 1
+        self.stats["bytes_fetched"] += size
+        self.evict()
+        # 新增或删除了内容文件时立即写回：节流跳过的索引若因进程退出而丢失，
+        # 新内容不在索引中、永远不会被淘汰，淘汰掉的内容则仍被索引引用
+        self.save(force=True)
+
+    @staticmethod
+    def discard(tmp):
+        tmp.close()
+        try:
+            os.unlink(tmp.name)
+        except OSError:
+            pass
+
+    def total_bytes(self) -> int:
+        return sum({e["digest"]: e["size"] for e in self.entries.values()}.values())
+
+    def evict(self) -> int:
+        """超出上限时按最近使用从旧到新移除地址，删除不再被引用的内容，返回移除的地址数"""
+        total = self.total_bytes()
+        if total <= self.max_bytes:
+            return 0
+        # 各内容被多少地址引用：统计一次，移除地址时递减，不必每移除一个地址都扫描整个索引
+        refs: Dict[str, int] = {}
+        for e in self.entries.values():
+            refs[e["digest"]] = refs.get(e["digest"], 0) + 1
+        removed = 0
+        for key, entry in sorted(self.entries.items(), key=lambda kv: kv[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            del self.entries[key]
+            removed += 1
+            refs[entry["digest"]] -= 1
+            if not refs[entry["digest"]]:
+                total -= entry["size"]
+                try:
+                    self.blob_path(entry["digest"]).unlink()
+                except OSError:
+                    pass
+        return removed
+
+    def save(self, force: bool = False):
+        """写回索引（原子替换）；命中只更新使用时间与统计，按间隔节流，退出时再强制写回"""
+        now = time.time()
+        if not force and now - self._last_save < CACHE_SAVE_INTERVAL:
+            return
+        self._last_save = now
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.index_file.with_name(self.index_file.name + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": self.entries, "stats": self.stats}, f, ensure_ascii=False)
+            os.replace(str(tmp_path), str(self.index_file))
+        except OSError:
+            pass
+
+    def summary(self) -> dict:
+        requests = self.stats["hits"] + self.stats["misses"]
+        return dict(self.stats, entries=len(self.entries), bytes=self.total_bytes(), max_bytes=self.max_bytes,
+                    hit_ratio=self.stats["hits"] / requests if requests else 0.0)
+
+    def clear(self):
+        shutil.rmtree(str(self.root), ignore_errors=True)
+        self.entries = {}
+        self.stats = {key: 0 for key in self.STAT_KEYS}
+
+
+class AsyncRelay:
+    """自建中转：纯标准库 asyncio 反向代理，路由规则与 workers.js 一致（最长前缀优先，未匹配转发 github.com）
+
+    请求体与响应体按块流式转发（packfile/推送不会整体读入内存），上游连接按主机复用长连接，
+    并发请求数由信号量限制，上游重定向到路由表内主机时改写为经本中转的地址。
+    指定 forward 时请求按原路径转发给节点（如 Cloudflare Worker），本中转只作为本地缓存层；
+    指定 cache 时 raw/gist/codeload 的 GET 请求经 ContentCache 缓存，同一地址的并发请求合并为一次上游请求。
+    """
+
+    # 逐跳头部，不转发给对端
+    HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "proxy-authenticate", "proxy-authorization",
+                   "te", "trailer", "upgrade", "expect", "host", "cf-connecting-ip", "cf-ray"}
+
+    def __init__(self, host_routes: Optional[Dict[str, dict]] = None, concurrency: int = RELAY_CONCURRENCY,
+                 pool_size: int = RELAY_POOL_SIZE, timeout: float = RELAY_TIMEOUT,
+                 upstreams: Optional[Dict[str, str]] = None, ssl_context: Optional[ssl.SSLContext] = None,
+                 verify: bool = True, forward: str = "", cache: Optional[ContentCache] = None):
+        host_routes = host_routes or DEFAULT_ROUTES
+        self.routes = sorted(((route["prefix"], host) for host, route in host_routes.items()),
+                             key=lambda item: -len(item[0]))
+        self.prefixes = {host: route["prefix"] for host, route in host_routes.items()}
+        # 主机 → 替代上游地址（如 http://127.0.0.1:9000），用于本地联调与测试
+        self.upstreams = upstreams or {}
+        self.forward = forward.rstrip("/")
+        self.cache = cache
+        # 缓存地址 → 正在进行的上游请求（结果为是否已入库/验证），供并发的相同请求等待
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.concurrency = concurrency
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        # 上游读写可能出现的异常（asyncio 延迟导入，不能作为类属性）
+        self.upstream_errors = (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.TimeoutError)
+        self._client_ssl = ssl.create_default_context()
+        if not verify:
+            self._client_ssl.check_hostname = False
+            self._client_ssl.verify_mode = ssl.CERT_NONE
+        self._pool: Dict[Tuple[str, str, int], List[tuple]] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: set = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self.server = None
+        self.stats = {"requests": 0, "errors": 0, "active": 0, "bytes_up": 0, "bytes_down": 0, "reused": 0}
+
+    def route(self, target: str) -> Tuple[str, str]:
+        """请求路径 → (上游主机, 上游路径)"""
+        for prefix, host in self.routes:
+            if target.startswith(prefix):
+                return host, "/" + target[len(prefix):]
+        return "github.com", target
+
+    def _upstream(self, host: str) -> Tuple[str, str, int]:
+        override = self.upstreams.get(host)
+        if override:
+            parsed = urllib.parse.urlparse(override)
+            return parsed.scheme, parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80)
+        return "https", host, 443
+
+    def _target(self, host: str, path: str, target: str) -> Tuple[Tuple[str, str, int], str, str]:
+        """返回 (上游连接键, Host 头, 请求路径)；转发模式下按原路径发给节点，由节点按同一路由表分发"""
+        if self.forward:
+            parsed = urllib.parse.urlparse(self.forward)
+            key = (parsed.scheme, parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80))
+            return key, parsed.netloc, parsed.path + target
+        return self._upstream(host), host, path
+
+    @staticmethod
+    def _parse_head(data: bytes) -> Tuple[str, List[Tuple[str, str]]]:
+        lines = data.decode("latin-1").split("\r\n")
+        headers = []
+        for line in lines[1:]:
+            if ":" in line:
+                name, _, value = line.partition(":")
+                headers.append((name.strip(), value.strip()))
+        return lines[0], headers
+
+    @staticmethod
+    def _header(headers: List[Tuple[str, str]], name: str) -> str:
+        return next((v for k, v in headers if k.lower() == name), "")
+
+    async def _acquire(self, key: Tuple[str, str, int]) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        """取一条上游连接：优先复用空闲长连接，返回 (reader, writer, 是否复用)"""
+        idle = self._pool.get(key, [])
+        while idle:
+            reader, writer, since = idle.pop()
+            if time.monotonic() - since < RELAY_IDLE_TIMEOUT and not writer.is_closing() and not reader.at_eof():
+                self.stats["reused"] += 1
+                return reader, writer, True
+            writer.close()
+        scheme, host, port = key
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(
+            host, port, ssl=self._client_ssl if scheme == "https" else None,
+            server_hostname=host if scheme == "https" else None, limit=RELAY_CHUNK_SIZE), self.timeout)
+        return reader, writer, False
+
+    def _release(self, key: Tuple[str, str, int], reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        idle = self._pool.setdefault(key, [])
+        if len(idle) < self.pool_size:
+            idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    async def _pump(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                    headers: List[Tuple[str, str]], until_close: bool = False) -> int:
+        """按 chunked / Content-Length / 读到连接关闭 三种分帧方式流式转发消息体，返回转发字节数"""
+        total = 0
+        if "chunked" in self._header(headers, "transfer-encoding").lower():
+            while True:
+                size_line = await reader.readuntil(b"\r\n")
+                writer.write(size_line)
+                size = int(size_line.split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    # 尾部头部（trailer）直到空行
+                    while True:
+                        line = await reader.readuntil(b"\r\n")
+                        writer.write(line)
+                        if line == b"\r\n":
+                            break
+                    await writer.drain()
+                    return total
+                remaining = size + 2
+                while remaining:
+                    chunk = await reader.read(min(remaining, RELAY_CHUNK_SIZE))
+                    if not chunk:
+                        raise ConnectionError("消息体提前结束")
+                    remaining -= len(chunk)
+                    total += len(chunk)
+                    writer.write(chunk)
+                    await writer.drain()
+        length = self._header(headers, "content-length")
+        remaining = int(length) if length.isdigit() else None
+        if remaining is None and not until_close:
+            return 0
+        while remaining is None or remaining > 0:
+            chunk = await reader.read(RELAY_CHUNK_SIZE if remaining is None else min(remaining, RELAY_CHUNK_SIZE))
+            if not chunk:
+                if remaining:
+                    raise ConnectionError("消息体提前结束")
+                break
+            total += len(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+            writer.write(chunk)
+            await writer.drain()
+        return total
+
+    def _rewrite_location(self, location: str, relay_base: str) -> str:
+        """上游重定向到路由表内主机时，改写为经本中转的地址"""
+        parsed = urllib.parse.urlparse(location)
+        if parsed.scheme == "https" and parsed.hostname in self.prefixes:
+            rest = location.split(parsed.netloc, 1)[1].lstrip("/")
+            return f"{relay_base}{self.prefixes[parsed.hostname]}{rest}"
+        return location
+
+    def _rewrite_lfs_batch(self, body: bytes, encoding: str, relay_base: str) -> Optional[bytes]:
+        """LFS 批量接口响应：对象下载地址指向路由表内主机时改写为经本中转的地址，无法解析时返回 None
+
+        上传/校验地址保持原样（大对象上传不经中转，与 workers.js 一致）。
+        """
+        if encoding not in ("", "identity", "gzip"):
+            return None
+        try:
+            data = json.loads(gzip.decompress(body) if encoding == "gzip" else body)
+        except (ValueError, OSError, EOFError):
+            return None
+        if not isinstance(data, dict):
+            return None
+        for obj in data.get("objects") or []:
+            download = (obj.get("actions") or {}).get("download") if isinstance(obj, dict) else None
+            if download and download.get("href"):
+                download["href"] = self._rewrite_location(download["href"], relay_base)
+        return json.dumps(data).encode("utf-8")
+
+    async def _send_error(self, writer: asyncio.StreamWriter, status: int, message: str):
+        body = message.encode("utf-8")
+        writer.write(f"HTTP/1.1 {status} {http.client.responses.get(status, '')}\r\n"
+                     f"Content-Type: text/plain; charset=utf-8\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("latin-1") + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _exchange(self, key: Tuple[str, str, int], request_head: bytes, reader: Optional[asyncio.StreamReader],
+                        headers: List[Tuple[str, str]], has_body: bool):
+        """发送请求并读取响应头（跳过 1xx），返回 (ureader, uwriter, 状态码, 状态行, 响应头)，失败抛出异常
+
+        复用的空闲连接可能已被上游关闭：无请求体时换新连接重试一次。
+        """
+        for attempt in range(2):
+            uwriter, reused = None, False
+            try:
+                ureader, uwriter, reused = await self._acquire(key)
+                uwriter.write(request_head)
+                if has_body:
+                    self.stats["bytes_up"] += await self._pump(reader, uwriter, headers)
+                await uwriter.drain()
+                resp_head = await asyncio.wait_for(ureader.readuntil(b"\r\n\r\n"), self.timeout)
+                status_line, resp_headers = self._parse_head(resp_head)
+                status = int(status_line.split(" ")[1])
+                while 100 <= status < 200 and status != 101:
+                    resp_head = await asyncio.wait_for(ureader.readuntil(b"\r\n\r\n"), self.timeout)
+                    status_line, resp_headers = self._parse_head(resp_head)
+                    status = int(status_line.split(" ")[1])
+                return ureader, uwriter, status, status_line, resp_headers
+            except self.upstream_errors:
+                if uwriter:
+                    uwriter.close()
+                if reused and not has_body and attempt == 0:
+                    continue
+                raise
+
+    async def _serve_one(self, head: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """转发一个请求，返回客户端连接能否继续复用"""
+        request_line, headers = self._parse_head(head)
+        try:
+            method, target, version = request_line.split(" ", 2)
+        except ValueError:
+            await self._send_error(writer, 400, "Bad Request")
+            return False
+        client_keep = version == "HTTP/1.1" and "close" not in self._header(headers, "connection").lower()
+        host, path = self.route(target)
+        key, upstream_host, upstream_path = self._target(host, path, target)
+        has_body = "chunked" in self._header(headers, "transfer-encoding").lower() or \
+            self._header(headers, "content-length") not in ("", "0")
+        if self.cache and method == "GET" and not has_body and host in CACHE_HOSTS and \
+                not self._header(headers, "range") and not self._header(headers, "authorization"):
+            return await self._serve_cached(host + path, key, upstream_host, upstream_path, headers, writer,
+                                            client_keep, ContentCache.immutable(host, path))
+        if "100-continue" in self._header(headers, "expect").lower():
+            # 由中转直接应答 100 Continue，上游收到的是完整请求体
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        lines = [f"{method} {upstream_path} HTTP/1.1", f"Host: {upstream_host}"]
+        lines += [f"{k}: {v}" for k, v in headers if k.lower() not in self.HOP_HEADERS]
+        request_head = ("\r\n".join(lines + ["Connection: keep-alive"]) + "\r\n\r\n").encode("latin-1")
+
+        async with self._semaphore:
+            self.stats["requests"] += 1
+            self.stats["active"] += 1
+            try:
+                try:
+                    ureader, uwriter, status, status_line, resp_headers = await self._exchange(
+                        key, request_head, reader, headers, has_body)
+                except self.upstream_errors as e:
+                    self.stats["errors"] += 1
+                    await self._send_error(writer, 502, f"Relay 转发失败: {e or e.__class__.__name__}")
+                    return False
+
+                no_body = method == "HEAD" or status in (204, 304)
+                chunked = "chunked" in self._header(resp_headers, "transfer-encoding").lower()
+                until_close = not no_body and not chunked and not self._header(resp_headers, "content-length")
+                upstream_keep = not until_close and "close" not in self._header(resp_headers, "connection").lower()
+                client_keep = client_keep and not until_close
+                scheme = "https" if self.ssl_context else "http"
+                relay_base = f"{scheme}://{self._header(headers, 'host')}"
+                body = None
+                if method == "POST" and path.endswith(LFS_BATCH_SUFFIX) and status == 200 and not self.forward \
+                        and not no_body:
+                    # LFS 批量接口响应很小：整体读入后改写对象下载地址，使对象下载同样经本中转
+                    try:
+                        raw = b"".join([chunk async for chunk in self._iter_body(ureader, resp_headers, until_close)])
+                    except self.upstream_errors as e:
+                        self.stats["errors"] += 1
+                        uwriter.close()
+                        await self._send_error(writer, 502, f"Relay 转发失败: {e or e.__class__.__name__}")
+                        return False
+                    body = self._rewrite_lfs_batch(raw, self._header(resp_headers, "content-encoding").lower(),
+                                                   relay_base)
+                    framing = ("content-length", "transfer-encoding")
+                    if body is None:
+                        body = raw
+                    else:
+                        framing += ("content-encoding",)
+                    resp_headers = [(k, v) for k, v in resp_headers if k.lower() not in framing]
+                    resp_headers.append(("Content-Length", str(len(body))))
+                out = [status_line]
+                for k, v in resp_headers:
+                    if k.lower() in self.HOP_HEADERS:
+                        continue
+                    if k.lower() == "location":
+                        v = self._rewrite_location(v, relay_base)
+                    out.append(f"{k}: {v}")
+                out += ["X-Accelerated-By: github-cf-proxy-relay", "Access-Control-Allow-Origin: *",
+                        f"Connection: {'keep-alive' if client_keep else 'close'}"]
+                writer.write(("\r\n".join(out) + "\r\n\r\n").encode("latin-1"))
+                try:
+                    if body is not None:
+                        writer.write(body)
+                        self.stats["bytes_down"] += len(body)
+                    elif not no_body:
+                        self.stats["bytes_down"] += await self._pump(ureader, writer, resp_headers, until_close)
+                    await writer.drain()
+                except (OSError, ValueError, asyncio.IncompleteReadError):
+                    # 响应头已发出，只能断开连接让客户端感知失败
+                    self.stats["errors"] += 1
+                    uwriter.close()
+                    return False
+                if upstream_keep:
+                    self._release(key, ureader, uwriter)
+                else:
+                    uwriter.close()
+                return client_keep
+            finally:
+                self.stats["active"] -= 1
+
+    async def _iter_body(self, reader: asyncio.StreamReader, headers: List[Tuple[str, str]], until_close: bool):
+        """按消息分帧逐块产出解码后的响应体（chunked 去掉分块格式）"""
+        if "chunked" in self._header(headers, "transfer-encoding").lower():
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0].strip() or b"0", 16)
+                if size == 0:
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    return
+                while size:
+                    chunk = await reader.read(min(size, RELAY_CHUNK_SIZE))
+                    if not chunk:
+                        raise ConnectionError("消息体提前结束")
+                    size -= len(chunk)
+                    yield chunk
+                await reader.readexactly(2)
+        length = self._header(headers, "content-length")
+        remaining = int(length) if length.isdigit() else None
+        if remaining is None and not until_close:
+            return
+        while remaining is None or remaining > 0:
+            chunk = await reader.read(RELAY_CHUNK_SIZE if remaining is None else min(remaining, RELAY_CHUNK_SIZE))
+            if not chunk:
+                if remaining:
+                    raise ConnectionError("消息体提前结束")
+                return
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+    async def _send_cached(self, writer: asyncio.StreamWriter, entry: dict, client_keep: bool, label: str) -> bool:
+        """用本地缓存内容应答"""
+        out = ["HTTP/1.1 200 OK"] + [f"{k}: {v}" for k, v in entry["headers"]]
+        out += [f"Content-Length: {entry['size']}", f"X-Cache: {label}", "X-Accelerated-By: github-cf-proxy-relay",
+                "Access-Control-Allow-Origin: *", f"Connection: {'keep-alive' if client_keep else 'close'}"]
+        writer.write(("\r\n".join(out) + "\r\n\r\n").encode("latin-1"))
+        with open(self.cache.blob_path(entry["digest"]), "rb") as f:
+            while True:
+                chunk = f.read(RELAY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+        await writer.drain()
+        return client_keep
+
+    async def _serve_cached(self, cache_key: str, key: Tuple[str, str, int], upstream_host: str, upstream_path: str,
+                            headers: List[Tuple[str, str]], writer: asyncio.StreamWriter, client_keep: bool,
+                            immutable: bool) -> bool:
+        """可缓存的 GET：不可变地址直接命中；同一地址已有上游请求时等待其结果；否则由本请求发起（条件）请求"""
+        while True:
+            entry = self.cache.lookup(cache_key)
+            if entry and entry["immutable"]:
+                self.cache.hit(cache_key)
+                return await self._send_cached(writer, entry, client_keep, "HIT")
+            inflight = self._inflight.get(cache_key)
+            if not inflight:
+                break
+            if await asyncio.shield(inflight):
+                entry = self.cache.lookup(cache_key)
+                if entry:
+                    self.cache.hit(cache_key, "coalesced")
+                    return await self._send_cached(writer, entry, client_keep, "HIT")
+            # 前一个请求未能入库：重新检查，必要时由本请求发起
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        stored = False
+        try:
+            stored, keep = await self._fetch_cached(cache_key, key, upstream_host, upstream_path, headers, writer,
+                                                    client_keep, immutable, entry)
+            return keep
+        finally:
+            del self._inflight[cache_key]
+            future.set_result(stored)
+
+    async def _fetch_cached(self, cache_key: str, key: Tuple[str, str, int], upstream_host: str, upstream_path: str,
+                            headers: List[Tuple[str, str]], writer: asyncio.StreamWriter, client_keep: bool,
+                            immutable: bool, entry: Optional[dict]) -> Tuple[bool, bool]:
+        """向上游请求并边转发边入库，返回 (是否已入库或验证, 客户端连接能否复用)"""
+        # 客户端自己的条件/压缩协商不转发：缓存保存未压缩的完整内容，条件请求由缓存按已存版本发起
+        skip = self.HOP_HEADERS | {"if-none-match", "if-modified-since", "accept-encoding"}
+        lines = [f"GET {upstream_path} HTTP/1.1", f"Host: {upstream_host}"]
+        lines += [f"{k}: {v}" for k, v in headers if k.lower() not in skip]
+        if entry and entry["etag"]:
+            lines.append(f"If-None-Match: {entry['etag']}")
+        if entry and entry["last_modified"]:
+            lines.append(f"If-Modified-Since: {entry['last_modified']}")
+        request_head = ("\r\n".join(lines + ["Connection: keep-alive"]) + "\r\n\r\n").encode("latin-1")
+
+        async with self._semaphore:
+            self.stats["requests"] += 1
+            self.stats["active"] += 1
+            try:
+                try:
+                    ureader, uwriter, status, status_line, resp_headers = await self._exchange(
+                        key, request_head, None, headers, False)
+                except self.upstream_errors as e:
+                    self.stats["errors"] += 1
+                    if entry:
+                        # 上游不可用时回退到已缓存的旧版本
+                        self.cache.hit(cache_key, "stale")
+                        return False, await self._send_cached(writer, entry, client_keep, "STALE")
+                    await self._send_error(writer, 502, f"Relay 转发失败: {e or e.__class__.__name__}")
+                    return False, False
+                chunked = "chunked" in self._header(resp_headers, "transfer-encoding").lower()
+                length = self._header(resp_headers, "content-length")
+                until_close = status not in (204, 304) and not chunked and not length
+                upstream_keep = not until_close and "close" not in self._header(resp_headers, "connection").lower()
+
+                if status == 304 and entry:
+                    if upstream_keep:
+                        self._release(key, ureader, uwriter)
+                    else:
+                        uwriter.close()
+                    self.cache.hit(cache_key, "revalidated")
+                    return True, await self._send_cached(writer, entry, client_keep, "REVALIDATED")
+
+                no_body = status in (204, 304)
+                store = status == 200 and "no-store" not in self._header(resp_headers, "cache-control").lower()
+                out = [status_line] + [f"{k}: {v}" for k, v in resp_headers
+                                       if k.lower() not in self.HOP_HEADERS | {"content-length", "transfer-encoding"}]
+                # 上游未给出长度时改用 chunked 转发，客户端连接仍可复用
+                if not no_body:
+                    out.append(f"Content-Length: {length}" if length else "Transfer-Encoding: chunked")
+                out += [f"X-Cache: {'MISS' if store else 'BYPASS'}", "X-Accelerated-By: github-cf-proxy-relay",
+                        "Access-Control-Allow-Origin: *", f"Connection: {'keep-alive' if client_keep else 'close'}"]
+                writer.write(("\r\n".join(out) + "\r\n\r\n").encode("latin-1"))
+                tmp, digest = self.cache.begin() if store else (None, None)
+                size = 0
+                try:
+                    async for chunk in self._iter_body(ureader, resp_headers, until_close):
+                        size += len(chunk)
+                        if tmp:
+                            tmp.write(chunk)
+                            digest.update(chunk)
+                        writer.write(chunk if length else b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                        await writer.drain()
+                    if not length and not no_body:
+                        writer.write(b"0\r\n\r\n")
+                    await writer.drain()
+                except self.upstream_errors:
+                    self.stats["errors"] += 1
+                    uwriter.close()
+                    if tmp:
+                        self.cache.discard(tmp)
+                    return False, False
+                self.stats["bytes_down"] += size
+                if upstream_keep:
+                    self._release(key, ureader, uwriter)
+                else:
+                    uwriter.close()
+                if tmp:
+                    self.cache.store(cache_key, tmp, digest.hexdigest(), size, resp_headers, immutable)
+                return store, client_keep
+            finally:
+                self.stats["active"] -= 1
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """客户端连接：按 HTTP/1.1 长连接依次处理请求"""
+        # 事件循环只弱引用任务，空闲等待中的连接任务需要强引用，否则可能被回收
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), RELAY_IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, OSError):
+                    break
+                if not await self._serve_one(head, reader, writer):
+                    break
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._tasks.discard(task)
+            writer.close()
+
+    async def _start_server(self, host: str, port: int):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self.server = await asyncio.start_server(self._handle, host, port, ssl=self.ssl_context,
+                                                 limit=RELAY_CHUNK_SIZE)
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def serve(self, host: str, port: int):
+        await self._start_server(host, port)
+        async with self.server:
+            await self.server.serve_forever()
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> Tuple[str, int]:
+        """在后台线程中启动（供本地联调/测试），返回实际监听地址"""
+        ready = threading.Event()
+
+        async def main():
+            await self._start_server(host, port)
+            ready.set()
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+            # 结束仍在等待请求的客户端连接并关闭上游长连接，事件循环关闭后不留挂起的任务
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            for idle in self._pool.values():
+                for _, writer, _ in idle:
+                    writer.close()
+            self._pool.clear()
+
+        def runner():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._loop.run_until_complete(main())
+            finally:
+                self._loop.close()
+
+        self._thread = threading.Thread(target=runner, daemon=True)
+        self._thread.start()
+        if not ready.wait(10):
+            raise RuntimeError("中转启动超时")
+        return self.address
+
+    def stop(self, timeout: float = 5):
+        """停止 start() 启动的中转并等待后台线程退出"""
+        if self._loop and self.server and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.server.close)
+        if self._thread:
+            self._thread.join(timeout)
+
+
+class SegmentedDownloader:
+    """分段并行下载：探测到服务器支持 Range 后把文件切成多段，多个连接并发写入预分配文件；
+    进度记录在旁路状态文件中可断点续传；不支持 Range 时退化为单连接下载；完成后可校验摘要"""
+
+    def __init__(self, url: str, output: Path, connections: int = DOWNLOAD_CONNECTIONS, checksum: str = "",
+                 timeout: float = DOWNLOAD_TIMEOUT, verify: bool = True, rewrite=None, progress=None):
+        self.url = url
+        self.output = Path(output)
+        self.part_path = self.output.with_name(self.output.name + ".part")
+        self.state_path = self.output.with_name(self.output.name + DOWNLOAD_STATE_SUFFIX)
+        self.connections = max(1, connections)
+        # 摘要格式 "算法:十六进制"，省略算法时按 sha256
+        algo, _, digest = checksum.rpartition(":")
+        self.checksum = (algo or "sha256", digest.lower()) if digest else None
+        self.timeout = timeout
+        # 重定向地址改写（如把 objects.githubusercontent.com 也改写到代理节点）
+        self.rewrite = rewrite or (lambda u: u)
+        self.progress = progress
+        self._ssl_context = ssl.create_default_context()
+        if not verify:
+            self._ssl_context.check_hostname = False
+            self._ssl_context.verify_mode = ssl.CERT_NONE
+        self.final_url = url
+        self.size = 0
+        self.etag = ""
+        self.ranged = False
+        self.segments: List[List[int]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._last_save = 0.0
+        self._done_bytes = 0
+
+    def _connect(self, url: str) -> http.client.HTTPConnection:
+        parsed = urllib.parse.urlparse(url)
+        if parsed.scheme == "https":
+            return http.client.HTTPSConnection(parsed.hostname, parsed.port or 443,
+                                               timeout=self.timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=self.timeout)
+
+    def _request(self, url: str, headers: dict, conn: Optional[http.client.HTTPConnection] = None):
+        """GET 请求（手动跟随重定向并改写地址），返回 (响应, 最终地址, 连接)"""
+        for _ in range(6):
+            parsed = urllib.parse.urlparse(url)
+            if conn is None:
+                conn = self._connect(url)
+            path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+            conn.request("GET", path, headers=dict({"User-Agent": "github-cf-proxy", "Accept-Encoding": "identity",
+                                                    "Host": parsed.netloc}, **headers))
+            resp = conn.getresponse()
+            if resp.status in (301, 302, 303, 307, 308) and resp.getheader("Location"):
+                resp.read()
+                url = self.rewrite(urllib.parse.urljoin(url, resp.getheader("Location")))
+                conn.close()
+                conn = None
+                continue
+            return resp, url, conn
+        raise ConnectionError("重定向次数过多")
+
+    def probe(self):
+        """请求首字节，确认文件大小、是否支持 Range 与 ETag，并解析出最终下载地址"""
+        resp, self.final_url, conn = self._request(self.url, {"Range": "bytes=0-0"})
+        try:
+            if resp.status == 206:
+                self.ranged = True
+                self.size = int((resp.getheader("Content-Range") or "/0").rsplit("/", 1)[-1] or 0)
+            elif resp.status == 200:
+                self.size = int(resp.getheader("Content-Length") or 0)
+            else:
+                raise ConnectionError(f"HTTP {resp.status}")
+            self.etag = resp.getheader("ETag") or resp.getheader("Last-Modified") or ""
+        finally:
+            conn.close()
+        # 服务器支持Range但大小未知时无法分段
+        self.ranged = self.ranged and self.size > 0
+
+    def _load_state(self) -> bool:
+        """读取断点状态；地址、大小或 ETag 变化时丢弃"""
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get("url") != self.url or state.get("size") != self.size or state.get("etag") != self.etag \
+                or not self.part_path.exists():
+            return False
+        self.segments = state["segments"]
+        return True
+
+    def _save_state(self, force: bool = False):
+        now = time.time()
+        if not force and now - self._last_save < DOWNLOAD_STATE_INTERVAL:
+            return
+        self._last_save = now
+        state = {"url": self.url, "size": self.size, "etag": self.etag, "segments": self.segments}
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(str(tmp_path), str(self.state_path))
+
+    def _plan(self):
+        """按连接数切分：分段数多于连接数，先完成的连接继续领取剩余分段"""
+        seg_size = max(DOWNLOAD_MIN_SEGMENT, -(-self.size // (self.connections * 4)))
+        self.segments = [[start, min(start + seg_size, self.size) - 1, 0] for start in range(0, self.size, seg_size)]
+
+    def _preallocate(self):
+        with open(self.part_path, "wb") as f:
+            f.truncate(self.size)
+            if hasattr(os, "posix_fallocate"):
+                try:
+                    os.posix_fallocate(f.fileno(), 0, self.size)
+                except OSError:
+                    pass
+
+    def _fetch_segment(self, segment: List[int], conn_holder: list):
+        """下载一个分段的剩余部分（失败重试，签名地址过期时重新解析）"""
+        start, end = segment[0], segment[1]
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            offset = start + segment[2]
+            if offset > end or self._stop.is_set():
+                return
+            try:
+                resp, _, conn_holder[0] = self._request(self.final_url, {"Range": f"bytes={offset}-{end}"},
+                                                        conn_holder[0])
+                if resp.status != 206:
+                    resp.read()
+                    if resp.status in (401, 403, 404, 410) and attempt < DOWNLOAD_RETRIES:
+                        # 重定向得到的签名地址可能已过期，从原始地址重新解析
+                        with self._lock:
+                            self.probe()
+                        conn_holder[0] = None
+                        continue
+                    raise ConnectionError(f"HTTP {resp.status}")
+                with open(self.part_path, "r+b") as f:
+                    f.seek(offset)
+                    while not self._stop.is_set():
+                        chunk = resp.read(min(RELAY_CHUNK_SIZE, end - start + 1 - segment[2]))
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        with self._lock:
+                            segment[2] += len(chunk)
+                            self._done_bytes += len(chunk)
+                            self._save_state()
+                if start + segment[2] > end:
+                    return
+                raise ConnectionError("分段提前结束")
+            except (OSError, http.client.HTTPException) as e:
+                if conn_holder[0]:
+                    conn_holder[0].close()
+                    conn_holder[0] = None
+                if attempt == DOWNLOAD_RETRIES:
+                    raise ConnectionError(f"分段 {start}-{end} 下载失败: {e}")
+                time.sleep(min(2 ** attempt, 8))
+
+    def _run_segments(self):
+        pending = [seg for seg in self.segments if seg[0] + seg[2] <= seg[1]]
+        queue = list(reversed(pending))
+
+        def worker():
+            conn_holder = [None]
+            try:
+                while not self._stop.is_set():
+                    with self._lock:
+                        if not queue:
+                            return
+                        segment = queue.pop()
+                    self._fetch_segment(segment, conn_holder)
+            finally:
+                if conn_holder[0]:
+                    conn_holder[0].close()
+
+        with futures.ThreadPoolExecutor(max_workers=min(self.connections, max(len(pending), 1))) as executor:
+            tasks = [executor.submit(worker) for _ in range(min(self.connections, max(len(pending), 1)))]
+            try:
+                while any(not f.done() for f in tasks):
+                    time.sleep(0.5)
+                    if self.progress:
+                        self.progress(self._done_bytes, self.size)
+                    if any(f.done() and f.exception() for f in tasks):
+                        self._stop.set()
+            except KeyboardInterrupt:
+                self._stop.set()
+                raise
+            for f in tasks:
+                if f.exception():
+                    raise f.exception()
+
+    def _run_single(self):
+        """单连接下载（服务器不支持 Range），从头开始"""
+        resp, _, conn = self._request(self.final_url, {})
+        try:
+            if resp.status != 200:
+                raise ConnectionError(f"HTTP {resp.status}")
+            with open(self.part_path, "wb") as f:
+                while True:
+                    chunk = resp.read(RELAY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    self._done_bytes += len(chunk)
+                    if self.progress and time.time() - self._last_save >= DOWNLOAD_STATE_INTERVAL:
+                        self._last_save = time.time()
+                        self.progress(self._done_bytes, self.size)
+        finally:
+            conn.close()
+        if self.size and self._done_bytes != self.size:
+            raise ConnectionError(f"下载不完整（{self._done_bytes}/{self.size} 字节）")
+
+    def _verify(self) -> bool:
+        algo, expected = self.checksum
+        digest = hashlib.new(algo)
+        with open(self.part_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest() == expected
+
+    def run(self) -> dict:
+        """执行下载，返回 {bytes, seconds, bps, ranged, resumed, segments}；校验失败抛出 ValueError"""
+        start = time.perf_counter()
+        self.probe()
+        resumed = False
+        if self.ranged:
+            resumed = self._load_state()
+            if not resumed:
+                self._plan()
+                self._preallocate()
+                self._save_state(force=True)
+            already = sum(seg[2] for seg in self.segments)
+            try:
+                self._run_segments()
+            finally:
+                with self._lock:
+                    self._save_state(force=True)
+            transferred = self._done_bytes
+            total = already + transferred
+        else:
+            self._run_single()
+            transferred = total = self._done_bytes
+        seconds = time.perf_counter() - start
+        if self.checksum and not self._verify():
+            self.part_path.unlink()
+            if self.state_path.exists():
+                self.state_path.unlink()
+            raise ValueError(f"{self.checksum[0]} 校验失败，已删除下载文件")
+        os.replace(str(self.part_path), str(self.output))
+        if self.state_path.exists():
+            self.state_path.unlink()
+        return {"bytes": total, "transferred": transferred, "seconds": seconds,
+                "bps": transferred / seconds if seconds > 0 else 0, "ranged": self.ranged,
+                "resumed": resumed, "segments": len(self.segments)}
+
+
+class MirrorCache:
+    """本地裸镜像缓存：经节点拉取 github.com 仓库的裸镜像，clone/sync 克隆时以 --reference 复用其中的对象
+
+    克隆仍向节点请求引用，只补拉镜像中缺少的对象，因此镜像过期也不会取到旧内容；
+    随后 --dissociate 把用到的对象复制进新仓库，镜像被淘汰不影响已有工作区。
+    镜像以 git clone --bare 建立并只同步分支与标签（不含 refs/pull/* 等），之后的刷新只拉取增量；
+    总大小超过上限时按最近使用时间淘汰。镜像先克隆到临时目录、登记索引后再改名，
+    目录存在即表示完整可用；索引 index.json 加锁读写，守护进程与命令行可同时操作。
+    """
+
+    REFSPECS = ("+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*")
+
+    def __init__(self, root: Path = MIRROR_DIR, max_bytes: int = MIRROR_MAX_BYTES, timeout: float = SYNC_TIMEOUT):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.index_file = root / "index.json"
+
+    @staticmethod
+    def normalize(repo: str) -> str:
+        """owner/name 或 github.com 地址（含 SSH 形式） → https://github.com/owner/name.git"""
+        repo = repo.strip()
+        if repo.startswith(GITHUB_SSH_PREFIXES[0]):
+            repo = repo[len(GITHUB_SSH_PREFIXES[0]):]
+        elif "://" in repo:
+            parsed = urllib.parse.urlparse(repo)
+            if parsed.hostname != "github.com":
+                raise ValueError(f"仅支持 github.com 仓库: {repo}")
+            repo = parsed.path
+        repo = repo.strip("/")
+        if repo.endswith(".git"):
+            repo = repo[:-len(".git")]
+        if repo.count("/") != 1:
+            raise ValueError(f"无效的仓库（应为 owner/name）: {repo}")
+        return f"https://github.com/{repo}.git"
+
+    def path_for(self, url: str) -> Path:
+        return self.root / url[len("https://github.com/"):]
+
+    def reference_for(self, repo: str) -> Optional[Path]:
+        """仓库（任意 github.com 地址形式）已有就绪镜像时返回镜像目录，并记录本次使用"""
+        try:
+            url = self.normalize(repo)
+        except ValueError:
+            return None
+        if url not in self.entries():
+            return None
+        self.touch([url])
+        return self.path_for(url)
+
+    @staticmethod
+    def _dir_size(path: Path) -> int:
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+    def _update(self, modify=None) -> Dict[str, dict]:
+        """加锁读取（并可选修改后写回）索引"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.index_file, "a+", encoding="utf-8") as f:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if modify else fcntl.LOCK_SH)
+            f.seek(0)
+            try:
+                index = json.loads(f.read() or "{}")
+            except ValueError:
+                index = {}
+            if modify:
+                modify(index)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(index, ensure_ascii=False, indent=1))
+                f.flush()
+        return index
+
+    def entries(self) -> Dict[str, dict]:
+        """已就绪的镜像（索引中有记录且目录存在）"""
+        if not self.index_file.exists():
+            return {}
+        return {url: e for url, e in self._update().items() if self.path_for(url).is_dir()}
+
+    def _git(self, args: List[str], proxy_base: str = "") -> str:
+        """执行git并返回错误输出（成功为空）
+
+        全局配置中 github.com 的规则（含指向镜像自身的改写规则）先剥离，再按需用 -c 指向节点。
+        """
+        with tempfile.TemporaryDirectory(prefix="cfproxy-mirror-") as tmp:
+            env = dict(os.environ, GIT_CONFIG_GLOBAL=str(_isolated_gitconfig(Path(tmp), ["github.com"])),
+                       GIT_TERMINAL_PROMPT="0")
+            overrides = ["-c", f"url.{proxy_base}.insteadOf=https://github.com/"] if proxy_base else []
+            try:
+                result = subprocess.run(["git"] + overrides + args, capture_output=True, env=env, timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                return "timed out"
+        if result.returncode != 0:
+            return result.stderr.decode("utf-8", "replace").strip() or f"exit {result.returncode}"
+        return ""
+
+    def add(self, url: str, proxy_base: str = "") -> str:
+        """建立镜像（已存在时改为刷新），返回错误输出"""
+        path = self.path_for(url)
+        if path.is_dir():
+            return self.refresh(url, proxy_base)
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(str(tmp), ignore_errors=True)
+        tmp.parent.mkdir(parents=True, exist_ok=True)
+        error = self._git(["clone", "--bare", "--quiet", url, str(tmp)], proxy_base)
+        for i, refspec in enumerate(self.REFSPECS):
+            error = error or self._git(["-C", str(tmp), "config"] + (["--add"] if i else []) +
+                                       ["remote.origin.fetch", refspec])
+        if error:
+            shutil.rmtree(str(tmp), ignore_errors=True)
+            return error
+        now = time.time()
+        size = self._dir_size(tmp)
+        self._update(lambda index: index.__setitem__(url, {"bytes": size, "added": now, "last_used": now,
+                                                           "last_fetch": now}))
+        os.replace(str(tmp), str(path))
+        return ""
+
+    def refresh(self, url: str, proxy_base: str = "") -> str:
+        """增量拉取镜像，返回错误输出"""
+        path = self.path_for(url)
+        if not path.is_dir():
+            return f"镜像不存在: {path}"
+        error = self._git(["-C", str(path), "fetch", "--quiet", "--prune", "origin"], proxy_base)
+        if not error:
+            size, now = self._dir_size(path), time.time()
+            self._update(lambda index: index.get(url, {}).update(bytes=size, last_fetch=now))
+        return error
+
+    def touch(self, urls: List[str], ts: Optional[float] = None):
+        """记录镜像被使用（LRU 依据）"""
+        ts = ts or time.time()
+
+        def modify(index):
+            for url in urls:
+                if url in index:
+                    index[url]["last_used"] = max(index[url].get("last_used", 0), ts)
+
+        self._update(modify)
+
+    def stale(self, interval: float) -> List[str]:
+        now = time.time()
+        return [url for url, e in self.entries().items() if now - e.get("last_fetch", 0) >= interval]
+
+    def forget(self, urls: List[str]):
+        """从索引中移除（改写规则随之撤销），目录由 purge 在规则生效后删除"""
+        self._update(lambda index: [index.pop(url, None) for url in urls])
+
+    def evict(self, keep: Tuple[str, ...] = ()) -> List[str]:
+        """总大小超过上限时按最近使用时间从旧到新移出索引，返回被淘汰的地址"""
+        entries = self.entries()
+        total = sum(e.get("bytes", 0) for e in entries.values())
+        victims = []
+        for url, e in sorted(entries.items(), key=lambda kv: kv[1].get("last_used", 0)):
+            if total <= self.max_bytes:
+                break
+            if url in keep:
+                continue
+            victims.append(url)
+            total -= e.get("bytes", 0)
+        if victims:
+            self.forget(victims)
+        return victims
+
+    def purge(self) -> int:
+        """删除索引中已没有记录的镜像目录，返回删除数量"""
+        if not self.root.is_dir():
+            return 0
+        known = {self.path_for(url) for url in self._update()}
+        removed = 0
+        for path in self.root.glob("*/*.git"):
+            if path.is_dir() and path not in known:
+                shutil.rmtree(str(path), ignore_errors=True)
+                removed += 1
+        return removed
+
+
+class GitConfigFile:
+    """进程内Git全局配置引擎：一次解析，按期望状态差量修改，单次原子替换落盘
+
+    键名写法与 git config 一致（如 url.https://x/.insteadOf），节名/键名不区分大小写，
+    子节区分大小写；未修改的行（含注释、include等）原样保留。
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path or _global_gitconfig_path()
+        self.backup_path = self.path.with_name(self.path.name + GIT_CONFIG_BACKUP_SUFFIX)
+        self._original = self._read_text()
+        self.lines = self._original.splitlines(True)
+        self._parse()
+
+    def _read_text(self) -> str:
+        """读取配置原文，保留无法解码的字节"""
+        try:
+            with open(self.path, "r", encoding="utf-8", errors="surrogateescape", newline="") as f:
+                return f.read()
+        except FileNotFoundError:
+            return ""
+
+    @staticmethod
+    def _split_key(key: str) -> Tuple[str, str, Optional[str], str]:
+        """拆分键名，返回 (规范键名, 节名, 子节, 变量名)"""
+        section, _, rest = key.partition(".")
+        subsection, _, name = rest.rpartition(".")
+        prefix = section.lower() + (f".{subsection}" if subsection else "")
+        return f"{prefix}.{name.lower()}", section.lower(), subsection or None, name
+
+    @staticmethod
+    def _section_prefix(name: str, subsection: Optional[str]) -> str:
+        """节头转规范前缀，兼容旧式 [section.subsection] 写法"""
+        if subsection is not None:
+            return name.lower() + "." + re.sub(r'\\(.)', r'\1', subsection)
+        return name.lower()
+
+    @staticmethod
+    def _parse_value(raw: Optional[str]) -> str:
+        """解析值：处理引号、转义、行内注释与首尾空白"""
+        if raw is None:
+            return "true"
+        out, quoted, trailing_ws, i = [], False, 0, 0
+        raw = raw.lstrip()
+        escapes = {"n": "\n", "t": "\t", "b": "\b", '"': '"', "\\": "\\"}
+        while i < len(raw):
+            ch = raw[i]
+            if ch == "\\" and i + 1 < len(raw):
+                i += 1
+                out.append(escapes.get(raw[i], raw[i]))
+                trailing_ws = 0
+            elif ch == '"':
+                quoted = not quoted
+                trailing_ws = 0
+            elif ch in "#;" and not quoted:
+                break
+            elif ch in "\r\n":
+                pass
+            elif ch.isspace() and not quoted:
+                # 与 git 一致：引号外的空白字符（含续行后的缩进）都记为空格
+                out.append(" ")
+                trailing_ws += 1
+            else:
+                out.append(ch)
+                trailing_ws = 0
+            i += 1
+        return "".join(out[:len(out) - trailing_ws])
+
+    @staticmethod
+    def _format_value(value: str) -> str:
+        """值转写入格式，必要时加引号"""
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\t", "\\t")
+        if not value or value != value.strip() or any(c in value for c in "#;"):
+            return f'"{escaped}"'
+        return escaped
+
+    def _parse(self):
+        """解析行列表，记录节头与键值行的位置"""
+        self._sections: List[Tuple[str, int]] = []
+        self._entries: List[Tuple[str, str, int, int]] = []
+        # 节头同一行写有键值（[section] key = value）时，节头行号 → 节头结束的列
+        self._inline: Dict[int, int] = {}
+        prefix, i = None, 0
+        while i < len(self.lines):
+            line = self.lines[i]
+            header = _GIT_SECTION_RE.match(line)
+            if header:
+                prefix = self._section_prefix(header.group(1), header.group(2))
+                self._sections.append((prefix, i))
+                line = line[header.end():]
+            stripped = line.strip()
+            if prefix is None or not stripped or stripped[0] in "#;":
+                i += 1
+                continue
+            if header:
+                self._inline[i] = header.end()
+            # 续行：行尾奇数个反斜杠
+            start, text = i, line.rstrip("\r\n")
+            while (len(text) - len(text.rstrip("\\"))) % 2 == 1 and i + 1 < len(self.lines):
+                i += 1
+                text = text[:-1] + self.lines[i].rstrip("\r\n")
+            match = _GIT_ENTRY_RE.match(text)
+            if match:
+                self._entries.append((f"{prefix}.{match.group(1).lower()}", self._parse_value(match.group(2)), start, i + 1))
+            i += 1
+
+    def _section_end(self, header: int) -> int:
+        """节的结束行（下一个节头或文件末尾）"""
+        for _, line_no in self._sections:
+            if line_no > header:
+                return line_no
+        return len(self.lines)
+
+    def _splice(self, entry: Tuple[str, str, int, int], new_lines: List[str]):
+        """用 new_lines 替换一个键值的全部行；键值与节头写在同一行时保留节头"""
+        start, end = entry[2], entry[3]
+        if start in self._inline:
+            new_lines = [self.lines[start][:self._inline[start]] + "\n"] + new_lines
+        self.lines[start:end] = new_lines
+
+    def _matches(self, key: str, value_regex: Optional[str]) -> List[Tuple[str, str, int, int]]:
+        ckey = self._split_key(key)[0]
+        return [e for e in self._entries
+                if e[0] == ckey and (value_regex is None or re.search(value_regex, e[1]))]
+
+    def _prune_empty_sections(self, prefix: str):
+        """删除修改后已无任何内容的同名节头"""
+        for sec_prefix, header in reversed(self._sections):
+            if sec_prefix != prefix:
+                continue
+            end = self._section_end(header)
+            body = self.lines[header + 1:end]
+            rest = self.lines[header][_GIT_SECTION_RE.match(self.lines[header]).end():]
+            if all(not line.strip() for line in body) and not rest.strip():
+                del self.lines[header:end]
+        self._parse()
+
+    def get_all(self, key: str) -> List[str]:
+        """读取键的全部值"""
+        return [e[1] for e in self._matches(key, None)]
+
+    def get_regexp(self, key_regex: str) -> List[Tuple[str, str]]:
+        """按规范键名正则匹配，返回 [(键名, 值)]"""
+        return [(e[0], e[1]) for e in self._entries if re.search(key_regex, e[0])]
+
+    def set_all(self, key: str, values: List[str], value_regex: Optional[str] = None):
+        """使键（限定 value_regex 匹配的值）的取值恰好为 values；已一致时不做任何修改"""
+        matches = self._matches(key, value_regex)
+        if [e[1] for e in matches] == list(values):
+            return
+        ckey, section, subsection, name = self._split_key(key)
+        new_lines = [f"\t{name} = {self._format_value(v)}\n" for v in values]
+        if matches:
+            # 原位替换第一个匹配项，其余匹配项删除
+            for entry in reversed(matches[1:]):
+                self._splice(entry, [])
+            self._splice(matches[0], new_lines)
+        else:
+            prefix = ckey.rpartition(".")[0]
+            headers = [line_no for sec_prefix, line_no in self._sections if sec_prefix == prefix]
+            if headers:
+                end = self._section_end(headers[-1])
+                # 插到该节最后一个非空行之后
+                while end > headers[-1] + 1 and not self.lines[end - 1].strip():
+                    end -= 1
+                self.lines[end:end] = new_lines
+            else:
+                if self.lines and not self.lines[-1].endswith("\n"):
+                    self.lines[-1] += "\n"
+                if subsection is not None:
+                    escaped = subsection.replace("\\", "\\\\").replace('"', '\\"')
+                    header_line = f'[{section} "{escaped}"]\n'
+                else:
+                    header_line = f"[{section}]\n"
+                self.lines.extend([header_line] + new_lines)
+        self._parse()
+        if not values:
+            self._prune_empty_sections(ckey.rpartition(".")[0])
+
+    def unset_all(self, key: str, value_regex: Optional[str] = None) -> int:
+        """删除键（限定 value_regex 匹配的值），返回删除数量"""
+        matches = self._matches(key, value_regex)
+        if matches:
+            self.set_all(key, [], value_regex)
+        return len(matches)
+
+    @property
+    def changed(self) -> bool:
+        return "".join(self.lines) != self._original
+
+    def _real_path(self) -> Path:
+        """实际写入的文件：~/.gitconfig 是符号链接（dotfiles 管理）时替换链接指向的文件，保留链接本身"""
+        return Path(os.path.realpath(self.path))
+
+    def commit(self) -> bool:
+        """原子落盘：首次写入前备份原文件→写临时文件→os.replace替换；无变化时直接返回False
+
+        备份只在不存在时创建，始终保留本工具首次修改前的配置，不会被之后的写入（如守护进程切换节点）覆盖。
+        """
+        new_text = "".join(self.lines)
+        if new_text == self._original:
+            return False
+        if self._read_text() != self._original:
+            raise RuntimeError("Git配置文件已被其他程序修改，请重试")
+        path = self._real_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists() and not self.backup_path.exists():
+            shutil.copy2(str(path), str(self.backup_path))
+        tmp_path = path.with_name(path.name + ".cfproxy.tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8", errors="surrogateescape", newline="") as f:
+                f.write(new_text)
+                f.flush()
+                os.fsync(f.fileno())
+            if path.exists():
+                shutil.copymode(str(path), str(tmp_path))
+            os.replace(str(tmp_path), str(path))
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        self._original = new_text
+        return True
+
+    def rollback(self) -> bool:
+        """用首次写入前的备份恢复配置文件"""
+        if not self.backup_path.exists():
+            return False
+        path = self._real_path()
+        tmp_path = path.with_name(path.name + ".cfproxy.tmp")
+        shutil.copy2(str(self.backup_path), str(tmp_path))
+        os.replace(str(tmp_path), str(path))
+        self._original = self._read_text()
+        self.lines = self._original.splitlines(True)
+        self._parse()
+        return True
+
+
+class CallProfiler:
+    """调用剖析：记录每个调用点的 git 子进程、TCP 连接与 HTTP 请求的次数、耗时与退出状态
+
+    通过替换 subprocess.Popen、socket.create_connection、asyncio.open_connection 与 http.client 的请求方法实现，
+    工具内的直接调用与 urllib 等标准库的间接调用都会被记录，调用点取本文件中最近的调用函数与行号。
+    菜单操作与子命令记为 action 区间，可选为每个区间保存一份 cProfile 结果。退出时输出汇总表（stderr），
+    指定文件时另写 Chrome trace-event JSON（chrome://tracing 或 Perfetto 打开）。
+    """
+
+    KINDS = {"action": "操作", "subprocess": "子进程", "connect": "连接", "http": "HTTP"}
+    active: Optional[CallProfiler] = None
+
+    def __init__(self, trace_path: str = "", cprofile_dir: str = ""):
+        self.trace_path = trace_path
+        self.cprofile_dir = Path(cprofile_dir) if cprofile_dir else None
+        self.events: List[dict] = []
+        # (类型, 调用点, 名称) → {"count", "total", "durations", "statuses"}
+        self.stats: Dict[Tuple[str, str, str], dict] = {}
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._cprofile_busy = False
+
+    @classmethod
+    def from_argv(cls, argv: List[str]) -> Optional[CallProfiler]:
+        """从命令行（--profile[=trace.json]、--cprofile=目录，识别后移除）与环境变量创建并安装剖析器"""
+        profile = os.environ.get(PROFILE_ENV, "")
+        cprofile_dir = os.environ.get(CPROFILE_ENV, "")
+        for arg in list(argv[1:]):
+            if arg == "--profile" or arg.startswith("--profile="):
+                profile = arg.partition("=")[2] or "1"
+                argv.remove(arg)
+            elif arg.startswith("--cprofile="):
+                cprofile_dir = arg.partition("=")[2]
+                argv.remove(arg)
+        if not profile and not cprofile_dir:
+            return None
+        profiler = cls(profile if profile.endswith(".json") else "", cprofile_dir)
+        profiler.install()
+        return profiler
+
+    @staticmethod
+    def call_site() -> str:
+        """本文件中最近的调用者（函数名:行号），跳过标准库与剖析器自身的栈帧"""
+        frame = sys._getframe(1)
+        while frame is not None:
+            code = frame.f_code
+            name = getattr(code, "co_qualname", code.co_name)
+            if frame.f_globals is globals() and not name.startswith("CallProfiler."):
+                return f"{name}:{frame.f_lineno}"
+            frame = frame.f_back
+        return "?"
+
+    @staticmethod
+    def command_label(args) -> str:
+        """子进程的简短名称：程序名加第一个子命令（跳过 -c 键=值 等选项）"""
+        argv = args.split() if isinstance(args, (str, bytes)) else [str(a) for a in args]
+        if not argv:
+            return "?"
+        words = [os.path.basename(str(argv[0]))]
+        skip = False
+        for arg in argv[1:]:
+            if skip:
+                skip = False
+            elif arg in ("-c", "-C", "--git-dir", "--work-tree"):
+                skip = True
+            elif not arg.startswith("-"):
+                words.append(arg)
+                break
+        return " ".join(words)
+
+    def record(self, kind: str, name: str, site: str, start: float, status):
+        end = time.perf_counter()
+        duration = end - start
+        with self._lock:
+            entry = self.stats.setdefault((kind, site, name), {"count": 0, "total": 0.0, "durations": [],
+                                                              "statuses": {}})
+            entry["count"] += 1
+            entry["total"] += duration
+            if len(entry["durations"]) < PROFILE_MAX_SAMPLES:
+                entry["durations"].append(duration)
+            key = str(status)[:60]
+            entry["statuses"][key] = entry["statuses"].get(key, 0) + 1
+            if len(self.events) < PROFILE_MAX_EVENTS:
+                self.events.append({"kind": kind, "name": name, "site": site, "start": start, "dur": duration,
+                                    "status": status, "tid": threading.get_ident()})
+
+    def install(self):
+        """替换标准库中的子进程/连接/HTTP 入口，并在退出时输出结果"""
+        import atexit
+        profiler = self
+        CallProfiler.active = self
+
+        class _ProfiledPopen(subprocess.Popen):
+            def __init__(self, args, *popen_args, **kwargs):
+                self._profile = (time.perf_counter(), profiler.call_site(), profiler.command_label(args))
+                try:
+                    super().__init__(args, *popen_args, **kwargs)
+                except OSError as e:
+                    profiler.record("subprocess", self._profile[2], self._profile[1], self._profile[0],
+                                    type(e).__name__)
+                    raise
+
+            def _profile_finish(self):
+                if self.returncode is not None and self._profile:
+                    start, site, label = self._profile
+                    self._profile = None
+                    profiler.record("subprocess", label, site, start, self.returncode)
+
+            def wait(self, timeout=None):
+                try:
+                    return super().wait(timeout)
+                finally:
+                    self._profile_finish()
+
+            def poll(self):
+                try:
+                    return super().poll()
+                finally:
+                    self._profile_finish()
+
+        subprocess.Popen = _ProfiledPopen
+
+        create_connection = socket.create_connection
+
+        def profiled_create_connection(address, *args, **kwargs):
+            start, site = time.perf_counter(), profiler.call_site()
+            try:
+                sock = create_connection(address, *args, **kwargs)
+            except OSError as e:
+                profiler.record("connect", f"{address[0]}:{address[1]}", site, start, type(e).__name__)
+                raise
+            profiler.record("connect", f"{address[0]}:{address[1]}", site, start, "ok")
+            return sock
+
+        socket.create_connection = profiled_create_connection
+
+        open_connection = asyncio.open_connection
+
+        async def profiled_open_connection(host=None, port=None, **kwargs):
+            start, site = time.perf_counter(), profiler.call_site()
+            # 传入已连接套接字时只包含 TLS 握手
+            name = f"{host}:{port}" if host else f"sock {kwargs.get('server_hostname') or ''}".rstrip()
+            try:
+                streams = await open_connection(host, port, **kwargs)
+            except BaseException as e:
+                profiler.record("connect", name, site, start, type(e).__name__)
+                raise
+            profiler.record("connect", name, site, start, "ok")
+            return streams
+
+        asyncio.open_connection = profiled_open_connection
+
+        connection = http.client.HTTPConnection
+        request, getresponse = connection.request, connection.getresponse
+
+        def profiled_request(conn, method, url, *args, **kwargs):
+            conn._cfproxy_profile = (time.perf_counter(), profiler.call_site(), f"{method} {conn.host}")
+            try:
+                return request(conn, method, url, *args, **kwargs)
+            except Exception as e:
+                start, site, name = conn.__dict__.pop("_cfproxy_profile")
+                profiler.record("http", name, site, start, type(e).__name__)
+                raise
+
+        def profiled_getresponse(conn):
+            pending = conn.__dict__.pop("_cfproxy_profile", None)
+            try:
+                response = getresponse(conn)
+            except Exception as e:
+                if pending:
+                    profiler.record("http", pending[2], pending[1], pending[0], type(e).__name__)
+                raise
+            if pending:
+                profiler.record("http", pending[2], pending[1], pending[0], response.status)
+            return response
+
+        connection.request, connection.getresponse = profiled_request, profiled_getresponse
+        atexit.register(self.finish)
+
+    @classmethod
+    def span(cls, name: str):
+        """把一次菜单操作/子命令记为 action 区间（未开启剖析时为空操作），按需保存 cProfile 结果"""
+        profiler = cls.active
+        if profiler is None:
+            return contextlib.nullcontext()
+
+        @contextlib.contextmanager
+        def action():
+            start, status = time.perf_counter(), "ok"
+            prof = None
+            if profiler.cprofile_dir and not profiler._cprofile_busy:
+                import cProfile
+                prof, profiler._cprofile_busy = cProfile.Profile(), True
+                prof.enable()
+            try:
+                yield
+            except SystemExit as e:
+                status = e.code if e.code is not None else 0
+                raise
+            except BaseException as e:
+                status = type(e).__name__
+                raise
+            finally:
+                profiler.record("action", name, "-", start, status)
+                if prof:
+                    prof.disable()
+                    profiler._cprofile_busy = False
+                    profiler.cprofile_dir.mkdir(parents=True, exist_ok=True)
+                    safe = re.sub(r"[^\w.-]+", "_", name)
+                    path = profiler.cprofile_dir / f"{safe}-{datetime.now():%Y%m%d-%H%M%S-%f}.prof"
+                    prof.dump_stats(str(path))
+                    print(f"[剖析] cProfile 已保存: {path}（python -m pstats {path}）", file=sys.stderr)
+
+        return action()
+
+    def summary(self) -> List[dict]:
+        """按 类型×调用点×名称 汇总，按总耗时降序"""
+        rows = []
+        with self._lock:
+            for (kind, site, name), entry in self.stats.items():
+                durations = sorted(entry["durations"])
+                rows.append({"kind": kind, "site": site, "name": name, "count": entry["count"],
+                             "total_ms": entry["total"] * 1000, "p50_ms": statistics.median(durations) * 1000,
+                             "p95_ms": _percentile(durations, 95) * 1000, "max_ms": durations[-1] * 1000,
+                             "statuses": dict(entry["statuses"])})
+        return sorted(rows, key=lambda row: -row["total_ms"])
+
+    def trace(self) -> dict:
+        """Chrome trace-event 格式（完整事件 ph=X，时间单位微秒）"""
+        pid = os.getpid()
+        with self._lock:
+            events = [{"name": e["name"], "cat": e["kind"], "ph": "X", "pid": pid, "tid": e["tid"],
+                       "ts": round((e["start"] - self.origin) * 1e6, 1), "dur": round(e["dur"] * 1e6, 1),
+                       "args": {"site": e["site"], "status": e["status"]}} for e in self.events]
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"argv": sys.argv, "wall_seconds": time.perf_counter() - self.origin}}
+
+    def finish(self):
+        """退出时输出汇总表（stderr），并按需写出 trace 文件"""
+        rows = self.summary()
+        out = sys.stderr
+        print(f"\n[剖析] 共 {sum(r['count'] for r in rows)} 次调用，运行 {time.perf_counter() - self.origin:.2f} s",
+              file=out)
+        if rows:
+            print(f"  {'类型':<8}{'调用位置':<44}{'名称':<32}{'次数':>6}{'总耗时ms':>11}{'p50':>9}{'p95':>9}"
+                  f"{'最大':>9}  状态", file=out)
+            for row in rows:
+                statuses = " ".join(f"{k}×{v}" for k, v in sorted(row["statuses"].items()))
+                print(f"  {self.KINDS[row['kind']]:<8}{row['site'][:43]:<44}{row['name'][:31]:<32}{row['count']:>6}"
+                      f"{row['total_ms']:>11.1f}{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['max_ms']:>9.1f}"
+                      f"  {statuses}", file=out)
+        if self.trace_path:
+            try:
+                with open(self.trace_path, "w", encoding="utf-8") as f:
+                    json.dump(self.trace(), f, ensure_ascii=False)
+                print(f"[剖析] Chrome trace 已写入: {self.trace_path}", file=out)
+            except OSError as e:
+                print(f"[剖析] 写入 trace 失败: {e}", file=out)
+
+
+class AppliedState:
+    """规则同步指纹：记录上次成功应用规则时各输入文件的 (路径, mtime, 大小)
+
+    apply/status/--silent 先比对指纹，未变化时无需构造 GitHubCFProxy（不打开时序库、不导入网络模块、
+    不调用 git）即可返回；配置文件、全局Git配置（含手动编辑）或脚本本身任一变化都会触发完整同步。
+    """
+
+    STATES = {"synced": "已同步", "pending": "待同步", "not_applied": "未应用", "unconfigured": "未配置"}
+
+    def __init__(self, path: Path = APPLY_STATE_FILE):
+        self.path = path
+
+    @staticmethod
+    def inputs() -> List[Path]:
+        """决定规则内容的输入文件"""
+        return [CONFIG_FILE, _global_gitconfig_path(), SCRIPT_PATH]
+
+    @classmethod
+    def fingerprint(cls) -> List[list]:
+        result = []
+        for path in cls.inputs():
+            try:
+                st = path.stat()
+                result.append([str(path), st.st_mtime_ns, st.st_size])
+            except OSError:
+                result.append([str(path), 0, 0])
+        return result
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def changed(self, state: Optional[dict] = None) -> List[str]:
+        """与上次同步相比发生变化的输入文件；从未同步过时返回全部输入"""
+        state = self.load() if state is None else state
+        previous = {item[0]: item for item in state.get("fingerprint", [])}
+        return [item[0] for item in self.fingerprint() if previous.get(item[0]) != item]
+
+    def fresh(self) -> bool:
+        state = self.load()
+        return bool(state) and not self.changed(state)
+
+    def save(self, endpoint: str):
+        """规则同步成功后记录指纹（须在配置文件与全局Git配置都已落盘之后调用）"""
+        state = {"fingerprint": self.fingerprint(), "endpoint": endpoint, "applied_at": time.time()}
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if self.path.exists():
+            self.path.unlink()
+
+    def status(self) -> dict:
+        """只读取配置文件与指纹文件的加速状态（供 shell 提示符、配置管理脚本轮询）"""
+        config = {}
+        if CONFIG_FILE.exists():
+            try:
+                with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+                    config = json.load(f)
+            except (OSError, ValueError):
+                pass
+        state = self.load()
+        changed = self.changed(state) if state else []
+        if not config.get("worker_domain"):
+            status = "unconfigured"
+        elif not state:
+            status = "not_applied"
+        else:
+            status = "pending" if changed else "synced"
+        return {
+            "status": status,
+            "endpoint": config.get("worker_domain", ""),
+            "endpoints": len(config.get("worker_endpoints", [])),
+            "applied_endpoint": state.get("endpoint", ""),
+            "applied_at": state.get("applied_at"),
+            "changed": changed,
+            "perf_profile": config.get("perf_profile", ""),
+            "lfs": config.get("lfs_enabled", False),
+            "ssh": config.get("ssh_rewrite_enabled", False),
+            "auto_start": config.get("auto_start", False),
+        }
+
+    def report(self, as_json: bool = False, short: bool = False) -> int:
+        """输出加速状态；规则已同步时返回0，否则返回1"""
+        info = self.status()
+        if as_json:
+            print(json.dumps(info, ensure_ascii=False))
+        elif short:
+            # 供 shell 提示符使用：cf:<节点主机>，待同步加 *，未应用/未配置为 cf:off
+            if info["status"] in ("synced", "pending"):
+                print(f"cf:{_domain_host(info['endpoint'])}{'*' if info['status'] == 'pending' else ''}")
+            else:
+                print("cf:off")
+        else:
+            print(f"加速节点: {info['endpoint'] or '未配置'}（节点池 {info['endpoints']} 个）")
+            line = f"规则状态: {self.STATES[info['status']]}"
+            if info["status"] == "synced":
+                line += f"（{datetime.fromtimestamp(info['applied_at']):%Y-%m-%d %H:%M:%S}）"
+            elif info["status"] == "pending":
+                line += f"：{', '.join(info['changed'])} 在上次同步后有改动，运行 apply 同步"
+            elif info["status"] == "not_applied":
+                line += "：运行 apply 写入加速规则"
+            print(line)
+            print(f"传输方案: {info['perf_profile'] or '未启用'} | LFS加速: {'已启用' if info['lfs'] else '未启用'}"
+                  f" | 开机自启: {'已启用' if info['auto_start'] else '已禁用'}")
+        return 0 if info["status"] == "synced" else 1
+
+
+def _trace2_backlog() -> bool:
+    """trace2 目录中的事件文件是否超过上限（需走完整流程收集/清理）"""
+    try:
+        with os.scandir(TRACE2_DIR) as entries:
+            return sum(1 for _ in entries) > TRACE2_MAX_FILES
+    except OSError:
+        return False
+
+
+def _fast_command(argv: List[str]) -> Optional[int]:
+    """apply/status/--silent 的快速路径：无需完整工具时直接返回退出码，否则返回 None 走完整流程
+
+    只识别最简单的参数形式，其余（含 --help、未知参数）一律交给 argparse 处理。
+    """
+    if argv[:1] == ["status"] and set(argv[1:]) <= {"--json", "--short"}:
+        return AppliedState().report("--json" in argv, "--short" in argv)
+    quiet = argv in (["--silent"], ["apply", "-q"], ["apply", "--quiet"])
+    if (argv == ["apply"] or quiet) and AppliedState().fresh() and not _trace2_backlog():
+        if not quiet:
+            print("[信息] 加速规则已是最新（配置与Git全局配置自上次同步后未变化）")
+        return 0
+    return None
+
+
+class GitHubCFProxy:
+    def __init__(self):
+        # 基础配置
+        self.config = self._load_config()
+        self.worker_domain = self.config.get("worker_domain", "")
+        # 多Worker节点池（worker_domain 为当前生效的节点）
+        self.worker_endpoints: List[str] = self.config.get("worker_endpoints", [])
+        if self.worker_domain and self.worker_domain not in self.worker_endpoints:
+            self.worker_endpoints.insert(0, self.worker_domain)
+        self.metric_store = MetricStore()
+        self.endpoint_pool = EndpointPool(self.worker_endpoints, self.metric_store)
+        # Cloudflare 优选IP（通过 http.curloptResolve 固定）
+        self.edge_pin_enabled = self.config.get("edge_pin_enabled", False)
+        self.edge_candidates: List[str] = self.config.get("edge_candidates", CF_DEFAULT_CANDIDATES)
+        self.edge_pinned_ip = self.config.get("edge_pinned_ip", "")
+        self.edge_pinned_delay = self.config.get("edge_pinned_delay", 0)
+        self.edge_top_ips: List[str] = self.config.get("edge_top_ips", [])
+        # Git真实传输统计（trace2 事件目标：dir 目录模式 / socket Unix socket 模式）
+        self.telemetry_enabled = self.config.get("telemetry_enabled", False)
+        self.telemetry_target = self.config.get("telemetry_target", "dir")
+        # Git传输性能方案及其写入前的原值（键 → 原值列表，空列表表示原本未设置）
+        self.perf_profile = self.config.get("perf_profile", "")
+        self.perf_profile_previous: Dict[str, List[str]] = self.config.get("perf_profile_previous", {})
+        # Git LFS 加速：是否启用、调优得到的并发传输数（0 表示未调优，沿用 git-lfs 默认值）、写入前的原值
+        self.lfs_enabled = self.config.get("lfs_enabled", False)
+        self.lfs_transfers = self.config.get("lfs_transfers", 0)
+        self.lfs_previous: Dict[str, List[str]] = self.config.get("lfs_previous", {})
+        self._lfs_last_tune = 0.0
+        # SSH 形式地址改写：是否启用、推送方式（proxy 经节点 HTTPS / ssh 保持原 SSH 地址）
+        self.ssh_rewrite_enabled = self.config.get("ssh_rewrite_enabled", False)
+        self.ssh_push = self.config.get("ssh_push", "proxy")
+        self.trace2_collector = Trace2Collector(on_records=self._record_git_transfers)
+        self._trace2_last_collect = 0.0
+        self._trace2_stop_flag = threading.Event()
+        self._trace2_thread: Optional[threading.Thread] = None
+        # 主机路由表及 auto 主机的测速决策（proxy/direct）
+        self.routes: Dict[str, dict] = self.config.get("routes") or json.loads(json.dumps(DEFAULT_ROUTES))
+        # 新版本增加的默认主机补入已保存的路由表（不覆盖用户修改过的主机）
+        for host, route in DEFAULT_ROUTES.items():
+            self.routes.setdefault(host, dict(route))
+        self.route_decisions: Dict[str, str] = self.config.get("route_decisions", {})
+        self._edge_last_scan = 0.0
+        self._edge_last_check = 0.0
+        self.auto_start_enabled = self.config.get("auto_start", False)
+        # 状态栏相关配置
+        self.status_bar_enabled = self.config.get("status_bar_enabled", False)
+        self._terminal_inited = False
+        # 网速/延迟状态变量（后台线程更新）
+        self._current_speed: str = "-- MB/s"
+        self._current_delay: str = "-- ms"
+        self._speed_thread: Optional[threading.Thread] = None
+        self._thread_stop_flag = threading.Event()
+        self._thread_lock = threading.Lock()
+        # 多个终端会话/守护进程共享的测速代理（含每日请求预算）
+        self.probe_broker = ProbeBroker(budget=self.config.get("daily_request_budget", BROKER_DAILY_BUDGET))
+        # 最近一轮分阶段测速结果
+        self._last_probe_results: List[ProbeResult] = []
+        self._last_bandwidth_probe = 0.0
+        # 守护进程计数（/metrics 导出）
+        self._rule_apply_counts: Dict[str, int] = {"written": 0, "unchanged": 0, "error": 0}
+        self._endpoint_switches = 0
+        self._daemon_cycles = 0
+        self._routes_last_check = 0.0
+        self._budget_exhausted = False
+        # 各节点熔断器（守护进程按测速结果驱动）
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # 本地裸镜像缓存（守护进程后台增量刷新）
+        self.mirror_cache = MirrorCache(max_bytes=self.config.get("mirror_max_bytes", MIRROR_MAX_BYTES))
+        self._mirror_last_refresh = 0.0
+        self._mirror_thread: Optional[threading.Thread] = None
+
+    def _load_config(self):
+        """加载本地配置文件"""
+        if CONFIG_FILE.exists():
+            try:
+                with open(CONFIG_FILE, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except Exception as e:
+                print(f"[警告] 配置文件损坏，将重置: {e}")
+        return {}
+
+    def _save_config(self):
+        """保存配置到本地"""
+        self.config["worker_domain"] = self.worker_domain
+        self.config["worker_endpoints"] = self.worker_endpoints
+        self.config["edge_pin_enabled"] = self.edge_pin_enabled
+        self.config["edge_candidates"] = self.edge_candidates
+        self.config["edge_pinned_ip"] = self.edge_pinned_ip
+        self.config["edge_pinned_delay"] = self.edge_pinned_delay
+        self.config["edge_top_ips"] = self.edge_top_ips
+        self.config["telemetry_enabled"] = self.telemetry_enabled
+        self.config["telemetry_target"] = self.telemetry_target
+        self.config["routes"] = self.routes
+        self.config["route_decisions"] = self.route_decisions
+        self.config["auto_start"] = self.auto_start_enabled
+        self.config["status_bar_enabled"] = self.status_bar_enabled
+        self.config["perf_profile"] = self.perf_profile
+        self.config["perf_profile_previous"] = self.perf_profile_previous
+        self.config["lfs_enabled"] = self.lfs_enabled
+        self.config["lfs_transfers"] = self.lfs_transfers
+        self.config["lfs_previous"] = self.lfs_previous
+        self.config["ssh_rewrite_enabled"] = self.ssh_rewrite_enabled
+        self.config["ssh_push"] = self.ssh_push
+        try:
+            with open(CONFIG_FILE, "w", encoding="utf-8") as f:
+                json.dump(self.config, f, indent=4, ensure_ascii=False)
+            return True
+        except Exception as e:
+            print(f"[错误] 保存配置失败: {e}")
+            return False
+
+    def _init_terminal(self):
+        """初始化终端，开启Windows ANSI支持，跨终端兼容"""
+        if self._terminal_inited:
+            return
+        # Windows开启虚拟终端ANSI支持
+        if OS_TYPE == "windows":
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.GetStdHandle(-11)
+            mode = ctypes.c_ulong()
+            kernel32.GetConsoleMode(handle, ctypes.byref(mode))
+            kernel32.SetConsoleMode(handle, ctypes.c_ulong(mode.value | 0x0004))
+        # 隐藏光标（状态栏模式）
+        if self.status_bar_enabled:
+            print("\033[?25l", end="")
+        self._terminal_inited = True
+
+    def _reset_terminal(self):
+        """退出时重置终端状态"""
+        # 恢复光标
+        print("\033[?25h", end="")
+        # 清除状态栏行
+        print("\r\033[K", end="", flush=True)
+
+    def _probe_engine(self, **kwargs) -> AsyncProbeEngine:
+        """创建分阶段测速引擎（已固定优选IP时按固定解析连接）"""
+        resolve = {}
+        if self.edge_pin_enabled and self.edge_pinned_ip and self.worker_domain:
+            resolve[_domain_host(self.worker_domain)] = self.edge_pinned_ip
+        return AsyncProbeEngine(resolve=resolve, **kwargs)
+
+    def _measure_bandwidth(self, endpoints: List[str]) -> Dict[str, BandwidthResult]:
+        """并发对多个节点做自适应带宽测速"""
+        budget = self.config.get("bandwidth_budget", BANDWIDTH_BUDGET)
+        with futures.ThreadPoolExecutor(max_workers=max(len(endpoints), 1)) as executor:
+            results = dict(zip(endpoints, executor.map(lambda ep: BandwidthProbe(ep, budget=budget).run(), endpoints)))
+        self.probe_broker.charge(sum(r.requests for r in results.values()))
+        return results
+
+    def _charge_probes(self, results: List[ProbeResult]):
+        """把经 Worker 发出的测速请求计入每日预算（直连不计）"""
+        self.probe_broker.charge(sum(1 for r in results if r.endpoint != DIRECT_ENDPOINT))
+
+    def _probe_endpoints(self, endpoints: List[str], bandwidth: bool = False,
+                         with_direct: bool = False) -> Dict[str, Tuple[int, float]]:
+        """并发测速多个节点的全部路由，返回 {节点: (TCP延迟ms, 带宽B/s)}，失败延迟为-1
+
+        小文件测速只反映延迟，速率仅在 bandwidth=True 时由带宽测速给出，否则为0。
+        with_direct=True 时同一轮顺带测速直连（仅记入分阶段结果，供熔断器对比）。
+        """
+        results = self._probe_engine().run(endpoints + [DIRECT_ENDPOINT] if with_direct else endpoints)
+        self._charge_probes(results)
+        with self._thread_lock:
+            self._last_probe_results = results
+        alive = [ep for ep in endpoints if any(r.endpoint == ep and r.ok for r in results)]
+        bandwidths = self._measure_bandwidth(alive) if bandwidth and alive else {}
+        summary = {}
+        for endpoint in endpoints:
+            if endpoint not in alive:
+                summary[endpoint] = (-1, 0)
+                continue
+            delay = int(min(r.connect for r in results if r.endpoint == endpoint and r.ok))
+            self.metric_store.append(endpoint, "ttfb",
+                                     min(r.ttfb for r in results if r.endpoint == endpoint and r.ok))
+            bw = bandwidths.get(endpoint)
+            if bw and bw.requests:
+                self.metric_store.append(endpoint, "errors", bw.failures / bw.requests)
+            summary[endpoint] = (delay, bw.bps if bw else 0)
+        return summary
+
+    def _broker_probe(self):
+        """主控会话的一轮测速：测当前节点延迟，到期时测带宽，结果发布给所有会话"""
+        delay, _ = self._probe_endpoints([self.worker_domain])[self.worker_domain]
+        speed_str = None
+        # 带宽测速较耗流量，按更长间隔执行
+        if delay >= 0 and time.time() - self._last_bandwidth_probe >= BANDWIDTH_PROBE_INTERVAL:
+            self._last_bandwidth_probe = time.time()
+            bw = self._measure_bandwidth([self.worker_domain])[self.worker_domain]
+            speed_str = str(bw)
+            self.endpoint_pool.update(self.worker_domain, delay, bw.bps)
+        else:
+            # 顺带更新节点池统计，保持排名数据新鲜
+            self.endpoint_pool.update(self.worker_domain, delay, 0)
+        self.probe_broker.publish({self.worker_domain: (delay, speed_str)})
+
+    def _speed_monitor_worker(self):
+        """后台网速/延迟监控线程，不阻塞主线程输入
+
+        同一用户的所有会话共享一个测速代理：只有主控会话按自适应间隔发起测速，其余会话读取共享结果。
+        """
+        broker = self.probe_broker
+        while not self._thread_stop_flag.is_set():
+            if not self.worker_domain or not self.status_bar_enabled:
+                time.sleep(STATUS_REFRESH_INTERVAL)
+                continue
+            broker.heartbeat()
+            if broker.try_lead():
+                if broker.due():
+                    self._broker_probe()
+                # 优选IP：劣化自动取消固定，到期定期重扫
+                if self.edge_pin_enabled:
+                    self._edge_maintain()
+                # 收集Git真实传输记录
+                self._collect_trace2()
+            state = broker.read()
+            result = state["results"].get(self.worker_domain, {})
+            # 线程安全更新变量
+            with self._thread_lock:
+                if broker.remaining(state) <= 0:
+                    self._current_delay = "今日测速预算已用尽"
+                elif result:
+                    self._current_speed = result.get("speed") or self._current_speed
+                    self._current_delay = f"{result['delay']} ms" if result["delay"] >= 0 else "-- ms"
+            # 按间隔刷新
+            time.sleep(STATUS_REFRESH_INTERVAL)
+        # 退出时让出测速主控权，由其他会话接管
+        broker.release()
+        broker.leave()
+
+    def _start_speed_monitor(self):
+        """启动后台监控线程"""
+        if self._speed_thread and self._speed_thread.is_alive():
+            return
+        self._thread_stop_flag.clear()
+        self._speed_thread = threading.Thread(target=self._speed_monitor_worker, daemon=True)
+        self._speed_thread.start()
+
+    def _stop_speed_monitor(self):
+        """停止后台监控线程"""
+        self._thread_stop_flag.set()
+        if self._speed_thread and self._speed_thread.is_alive():
+            self._speed_thread.join(timeout=1)
+
+    def _render_status_bar(self):
+        """渲染状态栏，仅在开启状态下生效"""
+        if not self.status_bar_enabled:
+            return
+        # 线程安全读取状态
+        with self._thread_lock:
+            speed = self._current_speed
+            delay = self._current_delay
+        # 加速状态
+        accelerate_status = "已启用" if self.worker_domain else "未配置"
+        auto_start_status = "自启已开" if self.auto_start_enabled else "自启已关"
+        # 状态栏内容
+        status_content = f"[加速状态: {accelerate_status}] | [实时速率: {speed}] | [节点延迟: {delay}] | [{auto_start_status}]"
+        if self.telemetry_enabled:
+            status_content += f" | [Git实测: {self._git_throughput(self.worker_domain)}]"
+        # 终端宽度适配，超出截断
+        try:
+            terminal_width = os.get_terminal_size().columns
+        except Exception:
+            terminal_width = 80
+        if len(status_content) > terminal_width - 2:
+            status_content = status_content[:terminal_width - 5] + "..."
+        # ANSI渲染：行首清除+状态栏+固定行，不影响菜单内容
+        print(f"\r\033[K\033[38;5;47m{status_content}\033[0m\n\033[F", end="", flush=True)
+
+    def toggle_status_bar(self):
+        """切换状态栏显示/隐藏，主菜单入口"""
+        self.status_bar_enabled = not self.status_bar_enabled
+        self._save_config()
+        if self.status_bar_enabled:
+            self._init_terminal()
+            self._start_speed_monitor()
+            print("[√] 实时网速状态栏已开启，将在主菜单常驻显示")
+        else:
+            self._stop_speed_monitor()
+            self._reset_terminal()
+            print("[√] 实时网速状态栏已隐藏")
+
+    def _check_git(self):
+        """检查Git是否安装"""
+        if not shutil.which("git"):
+            print("[错误] 未找到Git！请先安装Git并添加到系统环境变量（PATH）")
+            sys.exit(1)
+        print("[√] Git环境检测正常")
+
+    def _set_git_credential_helper(self, cfg: Optional[GitConfigFile] = None, verbose: bool = True):
+        """配置Git凭证助手（自动保存用户名/Token）；传入cfg时只暂存修改，由调用方统一落盘"""
+        helpers = {
+            "windows": "manager-core",
+            "darwin": "osxkeychain",
+            "linux": "store"
+        }
+        helper = helpers.get(OS_TYPE, "store")
+        
+        try:
+            config_file = cfg or GitConfigFile()
+            config_file.set_all("credential.helper", [helper])
+            if cfg is None:
+                config_file.commit()
+            if verbose:
+                print(f"[√] Git凭证助手已配置: {helper}")
+            return True
+        except Exception as e:
+            print(f"[警告] 凭证助手配置失败: {e}")
+            return False
+
+    def _proxy_rules(self, domain: str) -> List[Tuple[str, str]]:
+        """生成指定节点下路由表全部主机的加速规则（原始地址, 代理地址）"""
+        return [(f"https://{host}/", f"{domain}{route['prefix']}") for host, route in self.routes.items()]
+
+    def _route_endpoint(self, host: str) -> str:
+        """解析主机实际使用的节点，直连返回空字符串"""
+        mode = self.routes.get(host, {}).get("endpoint", "auto")
+        if mode == "direct":
+            return ""
+        if mode == "proxy":
+            endpoint = self.worker_domain
+        elif mode == "auto":
+            # 未测速过的主机默认直连，避免旧版Worker不支持新前缀导致请求失败
+            endpoint = self.worker_domain if self.route_decisions.get(host) == "proxy" else ""
+        else:
+            endpoint = _normalize_domain(mode)
+        # 熔断断开的节点不承载规则，回落直连
+        breaker = self.breakers.get(endpoint)
+        return endpoint if not breaker or breaker.allows else ""
+
+    def _routed_rules(self) -> List[Tuple[str, str]]:
+        """按路由表生成当前应生效的加速规则（原始地址, 代理地址）"""
+        rules = []
+        for host, route in self.routes.items():
+            endpoint = self._route_endpoint(host)
+            if endpoint:
+                rules.append((f"https://{host}/", f"{endpoint}{route['prefix']}"))
+        return rules
+
+    def _check_routes(self, verbose: bool = False):
+        """逐主机对比代理与直连耗时，更新 auto 主机的路由决策"""
+        auto_hosts = [h for h, r in self.routes.items() if r.get("endpoint", "auto") == "auto"]
+        if not auto_hosts or not self.worker_domain:
+            return
+        if verbose:
+            print(f"[信息] 正在逐主机测速 {len(auto_hosts)} 个自动路由主机（代理 vs 直连）...")
+        probe_routes = [(h, self.routes[h]["prefix"] + self.routes[h].get("probe", "/").lstrip("/")) for h in auto_hosts]
+        results = self._probe_engine(routes=probe_routes, host_routes=self.routes).run(
+            [self.worker_domain, DIRECT_ENDPOINT])
+        self._charge_probes(results)
+        by_key = {(r.endpoint, r.route): r for r in results}
+        for host in auto_hosts:
+            proxied, direct = by_key[(self.worker_domain, host)], by_key[(DIRECT_ENDPOINT, host)]
+            proxied_ok = not proxied.error and 0 < proxied.status < 500
+            direct_ok = not direct.error and 0 < direct.status < 500
+            if not proxied_ok:
+                decision = "direct"
+            elif not direct_ok:
+                decision = "proxy"
+            elif proxied.status != direct.status:
+                # 同一上游返回不同状态码，说明Worker未正确路由该前缀
+                decision = "direct"
+            else:
+                decision = "proxy" if proxied.total <= direct.total * ROUTE_PROXY_BIAS else "direct"
+            self.route_decisions[host] = decision
+            if verbose:
+                p_str = f"{proxied.total:.0f} ms" if proxied_ok else "失败"
+                d_str = f"{direct.total:.0f} ms" if direct_ok else "失败"
+                print(f"  {host:<40} 代理: {p_str:<10} 直连: {d_str:<10} → {'代理' if decision == 'proxy' else '直连'}")
+        self._save_config()
+
+    def _select_best_endpoint(self, probe: bool = True) -> str:
+        """从节点池选出最优节点；probe=False时直接使用上次保存的排名"""
+        if len(self.worker_endpoints) > 1 and probe:
+            print(f"[信息] 正在并发测速 {len(self.worker_endpoints)} 个代理节点...")
+            results = self.endpoint_pool.probe_all(lambda eps: self._probe_endpoints(eps, bandwidth=True))
+            for endpoint in self.endpoint_pool.ranking():
+                delay, speed_bps = results.get(endpoint, (-1, 0))
+                delay_str = f"{delay} ms" if delay >= 0 else "超时"
+                print(f"  {endpoint}  延迟: {delay_str}  带宽: {_format_speed(speed_bps)}")
+        return self.endpoint_pool.best()
+
+    def set_accelerate(self, probe: bool = True):
+        """配置Cloudflare加速规则"""
+        self._check_git()
+        # 暂停状态栏刷新，避免操作时界面乱跳
+        self._stop_speed_monitor()
+        
+        # 首次运行或重置后，让用户输入域名
+        if not self.worker_endpoints:
+            domains = input("请输入你的Cloudflare Worker自定义域（如 https://github-proxy.example.com，多个用逗号分隔）: ")
+            self.worker_endpoints[:] = [d for d in (_normalize_domain(x) for x in domains.split(",")) if d]
+            if not self.worker_endpoints:
+                print("[错误] 未输入有效域名")
+                return False
+
+        # 选择当前最优节点，并逐主机决定走代理还是直连
+        self.worker_domain = self._select_best_endpoint(probe)
+        if probe:
+            self._check_routes(verbose=True)
+        self._save_config()
+
+        if self._apply_rules() is None:
+            return False
+        print("\n[√] 加速配置完成！")
+
+        # 恢复状态栏刷新
+        if self.status_bar_enabled:
+            self._start_speed_monitor()
+        return True
+
+    def apply(self, endpoints: Optional[List[str]] = None, probe: bool = False, force: bool = False,
+              quiet: bool = False) -> int:
+        """非交互配置/同步加速规则（apply 子命令与开机静默模式），返回退出码
+
+        不测速时直接按上次保存的排名选节点；配置与全局Git配置自上次同步后未变化时直接返回（--force 强制同步）。
+        """
+        added = [d for d in (_normalize_domain(x) for x in endpoints or []) if d]
+        for endpoint in added:
+            if endpoint not in self.worker_endpoints:
+                self.worker_endpoints.append(endpoint)
+        if not self.worker_endpoints:
+            print("[错误] 未配置代理节点，请用 --endpoint 指定Cloudflare Worker自定义域")
+            return 1
+        # 没有守护进程或状态栏收集时，trace2 事件文件在这里收集并限量
+        self._collect_trace2(force=True)
+        Trace2Collector.prune()
+        if not (added or probe or force) and AppliedState().fresh():
+            if not quiet:
+                print("[信息] 加速规则已是最新（配置与Git全局配置自上次同步后未变化）")
+            return 0
+        if not shutil.which("git"):
+            print("[错误] 未找到Git！请先安装Git并添加到系统环境变量（PATH）")
+            return 1
+        self.worker_domain = self._select_best_endpoint(probe)
+        if probe:
+            self._check_routes(verbose=not quiet)
+        self._save_config()
+        result = self._apply_rules(verbose=not quiet)
+        if result is None:
+            return 1
+        if not quiet:
+            print("\n[√] 加速规则已同步" if result else "\n[信息] 加速规则已是最新")
+        return 0
+
+    def probe(self, bandwidth: bool = False, as_json: bool = False) -> int:
+        """非交互测速全部节点并更新排名（probe 子命令）；全部节点不可用时返回1"""
+        if not self.worker_endpoints:
+            print("[错误] 未配置代理节点，请先运行 apply --endpoint <域名>")
+            return 1
+        results = self.endpoint_pool.probe_all(lambda eps: self._probe_endpoints(eps, bandwidth=bandwidth))
+        ranking = self.endpoint_pool.ranking()
+        if as_json:
+            print(json.dumps([{"endpoint": ep, "delay_ms": results.get(ep, (-1, 0))[0],
+                               "bps": results.get(ep, (-1, 0))[1], "current": ep == self.worker_domain}
+                              for ep in ranking], ensure_ascii=False, indent=2))
+        else:
+            for endpoint in ranking:
+                delay, speed_bps = results.get(endpoint, (-1, 0))
+                mark = " (当前)" if endpoint == self.worker_domain else ""
+                speed = f"  带宽: {_format_speed(speed_bps)}" if bandwidth else ""
+                print(f"  {endpoint}{mark}  延迟: {f'{delay} ms' if delay >= 0 else '超时'}{speed}")
+        return 0 if any(delay >= 0 for delay, _ in results.values()) else 1
+
+    def _apply_rules(self, verbose: bool = True) -> Optional[bool]:
+        """按当前节点/路由表同步全部Git配置（单次事务原子写入）
+
+        返回 True 已写入、False 已是最新、None 失败；结果计入 /metrics 的规则应用次数。
+        """
+        # 一次性读取全局Git配置，所有修改在内存中完成后统一原子写入
+        try:
+            cfg = GitConfigFile()
+        except Exception as e:
+            print(f"[×] 读取Git配置失败: {e}")
+            self._rule_apply_counts["error"] += 1
+            return None
+
+        # 先清除所有已知节点上不再生效的旧规则，避免多个节点规则冲突
+        rules = self._routed_rules()
+        wanted = {proxy for _, proxy in rules}
+        explicit = [_normalize_domain(r["endpoint"]) for r in self.routes.values()
+                    if r.get("endpoint", "auto") not in ("proxy", "auto", "direct")]
+        for endpoint in dict.fromkeys(self.worker_endpoints + explicit):
+            for _, proxy in self._proxy_rules(endpoint):
+                if proxy not in wanted:
+                    cfg.unset_all(f"url.{proxy}.insteadOf")
+            if endpoint != self.worker_domain:
+                self._unpin_edge_ip(endpoint, keep_state=True, cfg=cfg)
+
+        if verbose:
+            print(f"\n[信息] 开始配置加速（代理域: {self.worker_domain}）")
+        for original, proxy in rules:
+            cfg.set_all(f"url.{proxy}.insteadOf", [original])
+            if verbose:
+                print(f"  [√] {original} → {proxy}")
+        if verbose:
+            for host in self.routes:
+                if not self._route_endpoint(host):
+                    print(f"  [-] https://{host}/ 直连")
+
+        # 旧版本的镜像改写规则
+        self._remove_mirror_rules(cfg)
+        # SSH 形式地址的改写规则
+        self._apply_ssh_rules(cfg, verbose)
+
+        # 固定优选IP（与加速规则一同写入）
+        if self.edge_pin_enabled and self.edge_pinned_ip:
+            self._pin_edge_ip(self.edge_pinned_ip, self.edge_pinned_delay, cfg=cfg)
+        else:
+            self._unpin_edge_ip(keep_state=True, cfg=cfg)
+
+        # Git真实传输统计（trace2 事件目标）
+        self._apply_trace2_target(cfg)
+
+        # Git传输性能方案
+        self._apply_perf_profile(cfg)
+
+        # Git LFS 加速（代理地址上的按地址选项、并发传输数）
+        lfs_previous = dict(self.lfs_previous)
+        self._apply_lfs_rules(cfg, verbose)
+
+        # 配置凭证助手
+        self._set_git_credential_helper(cfg, verbose=verbose)
+
+        try:
+            written = cfg.commit()
+        except Exception as e:
+            self.lfs_previous = lfs_previous
+            print(f"[×] 写入Git配置失败（原配置未改动）: {e}")
+            self._rule_apply_counts["error"] += 1
+            return None
+        if self.lfs_previous != lfs_previous:
+            self._save_config()
+        # 记录同步指纹（交互配置、守护进程切换节点、镜像变更等所有写入路径都经过这里）
+        state = AppliedState()
+        if not state.fresh():
+            self._save_config()
+            self._save_applied_state(state)
+        self._rule_apply_counts["written" if written else "unchanged"] += 1
+        if written:
+            backup = f"（原配置备份: {cfg.backup_path}）" if cfg.backup_path.exists() else ""
+            print(f"[√] Git配置已写入{backup}")
+        elif verbose:
+            print("[信息] Git配置已是最新，无需写入")
+        return written
+
+    def _save_applied_state(self, state: Optional[AppliedState] = None):
+        """配置文件与全局Git配置都已落盘后记录同步指纹，使 status 反映最新同步结果"""
+        try:
+            (state or AppliedState()).save(self.worker_domain)
+        except OSError as e:
+            print(f"[警告] 保存同步指纹失败: {e}")
+
+    def _github_proxy_base(self) -> str:
+        """github.com 当前路由对应的代理地址前缀，直连时为空"""
+        endpoint = self._route_endpoint("github.com")
+        return f"{endpoint}{self.routes['github.com']['prefix']}" if endpoint else ""
+
+    def _remove_mirror_rules(self, cfg: GitConfigFile):
+        """移除旧版本写入的镜像改写规则（指向镜像目录的 insteadOf 与对应的 pushInsteadOf）
+
+        全局 insteadOf 会让已有工作区的 fetch/pull 也读取可能过期的镜像，现改为 clone/sync 克隆时以 --reference 复用镜像。
+        """
+        root = self.mirror_cache.root.as_posix()
+        for key, value in cfg.get_regexp(r"^url\..*\.(insteadof|pushinsteadof)$"):
+            base = key[len("url."):key.rindex(".")]
+            rest = value[len("https://github.com/"):] if value.startswith("https://github.com/") else ""
+            if base.startswith(root) if key.endswith(".insteadof") else rest and base.endswith(rest):
+                cfg.unset_all(key, f"^{re.escape(value)}$")
+
+    def _mirror_maintain(self):
+        """守护进程：按间隔在后台线程增量刷新到期镜像，并淘汰超出上限的镜像（目录在本轮结束时删除）"""
+        if time.time() - self._mirror_last_refresh >= MIRROR_REFRESH_INTERVAL and \
+                not (self._mirror_thread and self._mirror_thread.is_alive()):
+            self._mirror_last_refresh = time.time()
+            stale = self.mirror_cache.stale(MIRROR_REFRESH_INTERVAL)
+            proxy_base = self._github_proxy_base()
+
+            def refresh():
+                for url in stale:
+                    error = self.mirror_cache.refresh(url, proxy_base)
+                    if error:
+                        self._log(f"[警告] 镜像刷新失败 {url}: {error.splitlines()[-1]}")
+
+            if stale:
+                self._mirror_thread = threading.Thread(target=refresh, daemon=True)
+                self._mirror_thread.start()
+        for url in self.mirror_cache.evict():
+            self._log(f"[信息] 镜像缓存超出上限，淘汰最久未使用的 {url}")
+
+    def manage_mirrors(self, action: str, repos: Optional[List[str]] = None, max_size: str = "") -> int:
+        """管理本地裸镜像缓存（add/remove/refresh/list），返回退出码"""
+        cache = self.mirror_cache
+        if max_size:
+            units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+            try:
+                size = max_size.strip().upper().rstrip("B")
+                cache.max_bytes = int(float(size[:-1]) * units[size[-1]]) if size[-1:] in units else int(size)
+            except (ValueError, IndexError):
+                print(f"[错误] 无效的大小: {max_size}（示例: 50G、800M）")
+                return 1
+            self.config["mirror_max_bytes"] = cache.max_bytes
+            self._save_config()
+            print(f"[√] 镜像缓存上限: {cache.max_bytes / 1024 ** 2:.0f} MB")
+        try:
+            urls = [MirrorCache.normalize(repo) for repo in repos or []]
+        except ValueError as e:
+            print(f"[错误] {e}")
+            return 1
+        if action in ("add", "remove") and not urls:
+            print("[错误] 请指定仓库（owner/name）")
+            return 1
+        if action in ("add", "refresh") and not shutil.which("git"):
+            print("[错误] 未找到Git！请先安装Git并添加到系统环境变量（PATH）")
+            return 1
+
+        failed = 0
+        proxy_base = self._github_proxy_base()
+        if action in ("add", "refresh"):
+            targets = urls or list(cache.entries())
+            for url in targets:
+                print(f"[信息] {'建立' if action == 'add' else '刷新'}镜像 {url}（{'经 ' + proxy_base if proxy_base else '直连'}）")
+                start = time.perf_counter()
+                error = cache.add(url, proxy_base) if action == "add" else cache.refresh(url, proxy_base)
+                if error:
+                    failed += 1
+                    print(f"  [×] 失败: {error.splitlines()[-1]}")
+                else:
+                    size = cache.entries().get(url, {}).get("bytes", 0)
+                    print(f"  [√] {size / 1024 / 1024:.1f} MB，{time.perf_counter() - start:.1f} 秒")
+        elif action == "remove":
+            cache.forget(urls)
+        for url in cache.evict(keep=tuple(urls) if action == "add" else ()):
+            print(f"[信息] 超出上限，淘汰最久未使用的镜像 {url}")
+        if action != "list" or max_size:
+            cache.purge()
+
+        entries = cache.entries()
+        total = sum(e.get("bytes", 0) for e in entries.values())
+        print(f"\n[信息] 本地镜像 {len(entries)} 个，共 {total / 1024 ** 2:.1f} MB / 上限 {cache.max_bytes / 1024 ** 2:.0f} MB"
+              f"（{cache.root}）")
+        for url, e in sorted(entries.items(), key=lambda kv: -kv[1].get("last_used", 0)):
+            used = datetime.fromtimestamp(e.get("last_used", 0)).strftime("%m-%d %H:%M")
+            fetched = datetime.fromtimestamp(e.get("last_fetch", 0)).strftime("%m-%d %H:%M")
+            print(f"  {url:<50} {e.get('bytes', 0) / 1024 / 1024:10.1f} MB  最近使用 {used}  最近刷新 {fetched}")
+        return 1 if failed else 0
+
+    def manage_endpoints(self):
+        """管理多Worker节点池"""
+        # 暂停状态栏刷新
+        self._stop_speed_monitor()
+        while True:
+            print("\n--- 代理节点池（按评分排序）---")
+            for idx, endpoint in enumerate(self.endpoint_pool.ranking(), 1):
+                st = self.endpoint_pool.stats.get(endpoint, {})
+                delay = f"{st['delay']:.0f} ms" if st.get("delay") is not None else "--"
+                speed = f"{st['speed'] / 1024:.2f} KB/s" if st.get("speed") else "--"
+                mark = " (当前)" if endpoint == self.worker_domain else ""
+                print(f"  {idx}. {endpoint}  延迟: {delay}  速率: {speed}{mark}")
+            pinned = self.edge_pinned_ip if self.edge_pin_enabled and self.edge_pinned_ip else "未固定"
+            print(f"  优选IP: {pinned}")
+            print("1. 添加节点  2. 移除节点  3. 测速并切换到最优节点")
+            print("4. 扫描Cloudflare优选IP并固定  5. 取消优选IP固定  6. 返回主菜单")
+            choice = input("请选择: ").strip()
+
+            if choice == "1":
+                domain = _normalize_domain(input("请输入Worker域名: "))
+                if domain and domain not in self.worker_endpoints:
+                    self.worker_endpoints.append(domain)
+                    self._save_config()
+                    print(f"[√] 已添加: {domain}")
+            elif choice == "2":
+                domain = _normalize_domain(input("请输入要移除的Worker域名: "))
+                if domain in self.worker_endpoints:
+                    self.worker_endpoints.remove(domain)
+                    if domain == self.worker_domain:
+                        self.worker_domain = ""
+                    self._save_config()
+                    print(f"[√] 已移除: {domain}（如为当前节点，请重新配置加速规则）")
+                else:
+                    print("[错误] 节点不存在")
+            elif choice == "3":
+                if self.worker_endpoints:
+                    self.set_accelerate()
+                else:
+                    print("[错误] 节点池为空")
+            elif choice == "4":
+                if self.worker_domain:
+                    self.edge_pin_enabled = True
+                    self._edge_scan_and_pin(verbose=True)
+                else:
+                    print("[错误] 请先配置加速规则！")
+            elif choice == "5":
+                self.edge_pin_enabled = False
+                self._unpin_edge_ip()
+                print("[√] 已取消优选IP固定")
+            elif choice == "6":
+                break
+            else:
+                print("[错误] 无效选项")
+
+        # 恢复状态栏刷新
+        if self.status_bar_enabled:
+            self._start_speed_monitor()
+
+    def manage_routes(self):
+        """管理主机路由表（逐主机选择代理节点或直连）"""
+        # 暂停状态栏刷新
+        self._stop_speed_monitor()
+        modes = {"proxy": "代理(最优节点)", "auto": "自动(测速决定)", "direct": "直连"}
+        while True:
+            print("\n--- 主机路由表 ---")
+            for idx, (host, route) in enumerate(self.routes.items(), 1):
+                mode = route.get("endpoint", "auto")
+                current = "代理" if self._route_endpoint(host) else "直连"
+                print(f"  {idx}. {host:<40} 前缀: {route['prefix']:<18} 模式: {modes.get(mode, mode)}  当前: {current}")
+            print("1. 修改主机路由  2. 添加主机  3. 逐主机测速并应用  4. 导出Worker脚本  5. 返回主菜单")
+            choice = input("请选择: ").strip()
+
+            if choice == "1":
+                host = input("请输入主机名（如 codeload.github.com）: ").strip()
+                if host not in self.routes:
+                    print("[错误] 路由表中没有该主机")
+                    continue
+                mode = input("请输入模式（proxy / auto / direct / 指定Worker域名）: ").strip()
+                if mode:
+                    self.routes[host]["endpoint"] = mode if mode in modes else _normalize_domain(mode)
+                    self._save_config()
+                    print("[√] 已更新，重新配置加速规则后生效")
+            elif choice == "2":
+                host = input("请输入上游主机名: ").strip()
+                prefix = input("请输入Worker路径前缀（如 /myhost/）: ").strip()
+                if host and prefix.startswith("/") and prefix.endswith("/"):
+                    self.routes[host] = {"prefix": prefix, "endpoint": "auto", "probe": "/"}
+                    self._save_config()
+                    print("[√] 已添加，请导出Worker脚本并重新部署")
+                else:
+                    print("[错误] 主机名或前缀无效（前缀需以 / 开头和结尾）")
+            elif choice == "3":
+                if self.worker_domain:
+                    self.set_accelerate()
+                else:
+                    print("[错误] 请先配置加速规则！")
+            elif choice == "4":
+                self.export_worker_script()
+            elif choice == "5":
+                break
+            else:
+                print("[错误] 无效选项")
+
+        # 恢复状态栏刷新
+        if self.status_bar_enabled:
+            self._start_speed_monitor()
+
+    def export_worker_script(self):
+        """按当前路由表生成 Worker 脚本（以同目录 workers.js 为模板，否则仅输出路由表片段）"""
+        routes_block = generate_worker_routes(self.routes)
+        template = SCRIPT_PATH.parent / "workers.js"
+        try:
+            text = template.read_text(encoding="utf-8")
+            start = text.index(WORKER_ROUTES_BEGIN)
+            end = text.index("\n", text.index(WORKER_ROUTES_END))
+        except (OSError, ValueError):
+            print("[信息] 未找到 workers.js 模板，请将以下路由表替换到 Worker 代码中：\n")
+            print(routes_block)
+            return
+        output = SCRIPT_PATH.parent / "workers.generated.js"
+        try:
+            output.write_text(text[:start] + routes_block + text[end:], encoding="utf-8")
+            print(f"[√] Worker脚本已生成: {output}")
+        except Exception as e:
+            print(f"[错误] 生成Worker脚本失败: {e}")
+
+    def _pin_edge_ip(self, ip: str, delay: float = 0, cfg: Optional[GitConfigFile] = None) -> bool:
+        """通过 http.curloptResolve 将 Worker 域名固定解析到指定边缘IP"""
+        host = _domain_host(self.worker_domain)
+        try:
+            config_file = cfg or GitConfigFile()
+            config_file.set_all("http.curloptResolve", [f"{host}:443:{ip}"], f"^{re.escape(host)}:443:")
+            if cfg is None:
+                config_file.commit()
+        except Exception as e:
+            print(f"[警告] 固定优选IP失败: {e}")
+            return False
+        self.edge_pinned_ip = ip
+        self.edge_pinned_delay = delay
+        self._save_config()
+        return True
+
+    def _unpin_edge_ip(self, domain: str = "", keep_state: bool = False, cfg: Optional[GitConfigFile] = None):
+        """移除指定节点（默认当前节点）的 curloptResolve 固定解析"""
+        host = _domain_host(domain or self.worker_domain)
+        if host:
+            try:
+                config_file = cfg or GitConfigFile()
+                config_file.unset_all("http.curloptResolve", f"^{re.escape(host)}:443:")
+                if cfg is None:
+                    config_file.commit()
+            except Exception as e:
+                print(f"[警告] 取消优选IP固定失败: {e}")
+        if not keep_state:
+            self.edge_pinned_ip = ""
+            self.edge_pinned_delay = 0
+            self._save_config()
+
+    def _edge_scan_and_pin(self, verbose: bool = False) -> bool:
+        """扫描候选边缘IP，固定握手最快的IP"""
+        host = _domain_host(self.worker_domain)
+        if not host:
+            return False
+        if verbose:
+            print(f"\n[信息] 正在扫描Cloudflare边缘IP（SNI: {host}）...")
+        top = EdgeIPScanner(host, self.edge_candidates).scan()
+        self._edge_last_scan = time.time()
+        if not top:
+            if verbose:
+                print("[×] 没有可用的候选IP")
+            return False
+        self.edge_top_ips = [ip for ip, _ in top]
+        if verbose:
+            for ip, cost in top:
+                print(f"  {ip}  握手耗时: {cost:.0f} ms")
+        best_ip, best_cost = top[0]
+        if self._pin_edge_ip(best_ip, best_cost) and verbose:
+            print(f"[√] 已固定优选IP: {host} → {best_ip}")
+        return True
+
+    def _trace2_target(self) -> str:
+        """本工具使用的 trace2.eventTarget 取值"""
+        if self.telemetry_target == "socket" and OS_TYPE != "windows":
+            return f"af_unix:stream:{TRACE2_SOCKET}"
+        return str(TRACE2_DIR)
+
+    def _apply_trace2_target(self, cfg: GitConfigFile, enabled: Optional[bool] = None):
+        """写入/移除 trace2 事件目标；只移除本工具写入的值，不影响用户自己的trace2配置"""
+        enabled = self.telemetry_enabled if enabled is None else enabled
+        ours = f"^({re.escape(str(TRACE2_DIR))}|af_unix:stream:{re.escape(str(TRACE2_SOCKET))})$"
+        if enabled:
+            if self.telemetry_target != "socket":
+                TRACE2_DIR.mkdir(parents=True, exist_ok=True)
+            cfg.set_all("trace2.eventTarget", [self._trace2_target()], ours)
+        else:
+            cfg.unset_all("trace2.eventTarget", ours)
+
+    def _start_trace2_socket(self):
+        """socket 模式下启动后台事件接收线程（同一时刻只有一个进程能占用socket）"""
+        if not self.telemetry_enabled or self._trace2_target() == str(TRACE2_DIR):
+            return
+        if self._trace2_thread and self._trace2_thread.is_alive():
+            return
+        self._trace2_stop_flag.clear()
+
+        def serve():
+            try:
+                self.trace2_collector.serve_socket(TRACE2_SOCKET, self._trace2_stop_flag)
+            except OSError:
+                pass
+
+        self._trace2_thread = threading.Thread(target=serve, daemon=True)
+        self._trace2_thread.start()
+
+    def _collect_trace2(self, force: bool = False):
+        """目录模式下按间隔收集trace2事件"""
+        if not self.telemetry_enabled or self._trace2_target() != str(TRACE2_DIR):
+            return
+        if force or time.time() - self._trace2_last_collect >= TRACE2_COLLECT_INTERVAL:
+            self._trace2_last_collect = time.time()
+            self.trace2_collector.collect_dir()
+
+    def _record_git_transfers(self, records: List[dict]):
+        """把Git真实传输记录写入时序库（按节点记录吞吐与耗时，LFS 吞吐单独记录）"""
+        for record in records:
+            if record.get("bytes"):
+                self.metric_store.append(record["endpoint"], "git_bps", record["bps"])
+            if record.get("lfs_bytes"):
+                self.metric_store.append(record["endpoint"], "lfs_bps", record["lfs_bps"])
+            self.metric_store.append(record["endpoint"], "git_wall_ms", record["wall_ms"])
+
+    def _git_throughput(self, endpoint: str) -> str:
+        """最近时间窗口内某节点的Git真实吞吐（时序库EWMA，格式化）"""
+        bps = self.metric_store.ewma(endpoint, "git_bps", seconds=TELEMETRY_WINDOW)
+        return _format_speed(bps) if bps else "--"
+
+    def _apply_perf_profile(self, cfg: GitConfigFile):
+        """写入当前性能方案的选项；首次改动某个键时记录原值，方案不再包含的键恢复原值"""
+        settings = PERF_PROFILES.get(self.perf_profile, {}).get("settings", {})
+        for key in list(self.perf_profile_previous):
+            if key not in settings:
+                cfg.set_all(key, self.perf_profile_previous.pop(key))
+        for key, value in settings.items():
+            if key not in self.perf_profile_previous:
+                self.perf_profile_previous[key] = cfg.get_all(key)
+            cfg.set_all(key, [value])
+
+    def _apply_lfs_rules(self, cfg: GitConfigFile, verbose: bool = False, enabled: Optional[bool] = None):
+        """Git LFS：把 github.com 上按地址设置的 LFS 选项映射到当前代理地址，并写入调优后的并发传输数等选项
+
+        git-lfs 按 insteadOf 改写后的地址推导批量接口（<代理>/owner/name.git/info/lfs），
+        原地址上的 lfs.<url>.access 等选项不再匹配，因此按相同路径复制到代理地址。
+        与性能方案相同：首次改动某个键时记录原值，不再需要的键恢复原值。
+        """
+        enabled = self.lfs_enabled if enabled is None else enabled
+        settings = {}
+        base = self._github_proxy_base() if enabled else ""
+        if base:
+            origin = "https://github.com/"
+            pattern = rf"^lfs\.{re.escape(origin)}.*\.({'|'.join(LFS_URL_OPTIONS)})$"
+            for key, value in cfg.get_regexp(pattern):
+                url, _, name = key[len("lfs."):].rpartition(".")
+                settings[f"lfs.{base}{url[len(origin):]}.{name}"] = value
+        if enabled:
+            settings.update(LFS_SETTINGS)
+            if self.lfs_transfers:
+                settings["lfs.concurrenttransfers"] = str(self.lfs_transfers)
+        for key in list(self.lfs_previous):
+            if key not in settings:
+                cfg.set_all(key, self.lfs_previous.pop(key))
+        for key, value in settings.items():
+            if key not in self.lfs_previous:
+                self.lfs_previous[key] = cfg.get_all(key)
+            cfg.set_all(key, [value])
+        if verbose and enabled:
+            print(f"  [√] Git LFS 并发传输数: {self.lfs_transfers or '默认'}，对象下载经节点中转")
+
+    def _lfs_probe_target(self, endpoint: str) -> Tuple[str, str]:
+        """LFS 调优测速使用的 (地址, 路径)：经节点时与带宽测速相同，直连时改为 raw 主机"""
+        if endpoint:
+            return endpoint, BANDWIDTH_TEST_PATH
+        return "https://raw.githubusercontent.com", BANDWIDTH_TEST_PATH[len("/raw"):]
+
+    def _tune_lfs_transfers(self, endpoint: str) -> List[Tuple[int, float]]:
+        """按并发档位让多条热连接同时下载同样大小的分片测量聚合吞吐，取达到最优值 LFS_TUNE_RATIO 的最小档位
+
+        加档后聚合吞吐提升不足 LFS_TUNE_MIN_GAIN 倍即停止加档；全部失败时返回空列表且不改动当前值。
+        """
+        url, path = self._lfs_probe_target(endpoint)
+        probe = BandwidthProbe(url, path=path)
+        levels: List[Tuple[int, float]] = []
+        for streams in LFS_TRANSFER_LEVELS:
+            total, requests = probe.parallel(streams, self.config.get("lfs_tune_bytes", LFS_TUNE_BYTES))
+            if endpoint:
+                self.probe_broker.charge(requests)
+            previous = max((bps for _, bps in levels), default=0)
+            levels.append((streams, total))
+            if not total or (previous and total < previous * LFS_TUNE_MIN_GAIN):
+                break
+        peak = max(bps for _, bps in levels)
+        if not peak:
+            return []
+        self.lfs_transfers = next(n for n, bps in levels if bps >= peak * LFS_TUNE_RATIO)
+        self.config["lfs_tuning"] = {"endpoint": endpoint or DIRECT_ENDPOINT, "ts": round(time.time()),
+                                     "levels": levels, "transfers": self.lfs_transfers}
+        self.metric_store.append(endpoint or DIRECT_ENDPOINT, "lfs_tune_bps", peak)
+        return levels
+
+    def _lfs_maintain(self):
+        """守护进程：github.com 所走节点与上次调优时不同（如节点切换）时重新调优，新值在本轮规则同步时写入"""
+        endpoint = self._route_endpoint("github.com")
+        if self.config.get("lfs_tuning", {}).get("endpoint") == (endpoint or DIRECT_ENDPOINT) or \
+                time.time() - self._lfs_last_tune < DAEMON_BANDWIDTH_INTERVAL:
+            return
+        self._lfs_last_tune = time.time()
+        if self._tune_lfs_transfers(endpoint):
+            self._log(f"[信息] LFS 并发传输数调优为 {self.lfs_transfers}（节点: {endpoint or '直连'}）")
+            self._save_config()
+
+    def manage_lfs(self, action: str, endpoint: str = "", as_json: bool = False) -> int:
+        """Git LFS 加速：status 查看 / tune 测速调优并启用 / off 关闭并恢复原值"""
+        if action == "tune":
+            endpoint = _normalize_domain(endpoint) if endpoint else self._route_endpoint("github.com")
+            print(f"[信息] 正在按并发档位测速 {endpoint or '直连'}（{', '.join(map(str, LFS_TRANSFER_LEVELS))}）...")
+            levels = self._tune_lfs_transfers(endpoint)
+            if not levels:
+                print("[错误] 测速全部失败，未修改 LFS 配置")
+                return 1
+            for streams, bps in levels:
+                mark = "  ← 选用" if streams == self.lfs_transfers else ""
+                print(f"  并发 {streams:<4} 聚合吞吐 {_format_speed(bps)}{mark}")
+        if action in ("tune", "off"):
+            previous = (self.lfs_enabled, dict(self.lfs_previous))
+            synced = AppliedState().fresh()
+            self.lfs_enabled = action == "tune"
+            try:
+                cfg = GitConfigFile()
+                self._apply_lfs_rules(cfg)
+                cfg.commit()
+            except Exception as e:
+                self.lfs_enabled, self.lfs_previous = previous
+                print(f"[×] 写入Git配置失败（原配置未改动）: {e}")
+                return 1
+            self._save_config()
+            if synced:
+                self._save_applied_state()
+            print(f"[√] 已启用 Git LFS 加速（lfs.concurrenttransfers = {self.lfs_transfers}）" if self.lfs_enabled
+                  else "[√] 已关闭 Git LFS 加速，相关选项已恢复原值")
+            return 0
+
+        self._collect_trace2(force=True)
+        summary = Trace2Collector.summarize(self.trace2_collector.load())
+        transfers = {ep: {"bytes": st["lfs_bytes"], "seconds": round(st["lfs_seconds"], 3), "bps": st["lfs_bps"]}
+                     for ep, st in summary.items() if st["lfs_bytes"]}
+        try:
+            cfg = GitConfigFile()
+            current = {key: cfg.get_all(key) for key in self.lfs_previous}
+        except Exception:
+            current = {}
+        status = {"enabled": self.lfs_enabled, "transfers": self.lfs_transfers,
+                  "tuning": self.config.get("lfs_tuning"), "settings": current, "throughput": transfers}
+        if as_json:
+            print(json.dumps(status, ensure_ascii=False, indent=2))
+            return 0
+        print(f"\n--- Git LFS 加速（{'已启用' if self.lfs_enabled else '未启用'}）---")
+        tuning = status["tuning"]
+        if tuning:
+            when = time.strftime("%m-%d %H:%M", time.localtime(tuning["ts"]))
+            levels = "  ".join(f"{n}:{_format_speed(bps)}" for n, bps in tuning["levels"])
+            print(f"  上次调优: {when}  节点: {tuning['endpoint']}  并发→聚合吞吐 {levels}  选用 {tuning['transfers']}")
+        for key, values in current.items():
+            print(f"  {key} = {', '.join(values) or '(未设置)'}")
+        print(f"  LFS 真实吞吐（最近 {TELEMETRY_WINDOW // 3600} 小时，需开启Git传输统计）:")
+        if not transfers:
+            print("    暂无记录")
+        for endpoint, st in transfers.items():
+            print(f"    {endpoint:<45} 接收: {st['bytes'] / 1024 / 1024:.1f} MB  平均吞吐: {_format_speed(st['bps'])}")
+        return 0
+
+    def _apply_ssh_rules(self, cfg: GitConfigFile, verbose: bool = False, enabled: Optional[bool] = None):
+        """SSH 形式地址：在 github.com 的代理 insteadOf 上追加 SSH 前缀，使其拉取经节点 HTTPS（由凭证助手认证）
+
+        git 推送先匹配 pushInsteadOf，未匹配才沿用 insteadOf 改写后的地址；推送保持 SSH 时
+        把各 SSH 前缀的 pushInsteadOf 映射到自身即可。github.com 直连或规则未写入时不改写。
+        """
+        enabled = self.ssh_rewrite_enabled if enabled is None else enabled
+        base = self._github_proxy_base()
+        key = f"url.{base}.insteadOf"
+        current = cfg.get_all(key) if base else []
+        routed = enabled and "https://github.com/" in current
+        values = [v for v in current if v not in GITHUB_SSH_PREFIXES] + (list(GITHUB_SSH_PREFIXES) if routed else [])
+        if values != current:
+            cfg.set_all(key, values)
+        keep_ssh = routed and self.ssh_push == "ssh"
+        for prefix in GITHUB_SSH_PREFIXES:
+            if keep_ssh:
+                cfg.set_all(f"url.{prefix}.pushInsteadOf", [prefix])
+            else:
+                cfg.unset_all(f"url.{prefix}.pushInsteadOf", f"^{re.escape(prefix)}$")
+        if verbose and enabled:
+            if routed:
+                push = "保持 SSH" if keep_ssh else "同样经节点 HTTPS"
+                print(f"  [√] {', '.join(GITHUB_SSH_PREFIXES)} → {base}（推送{push}）")
+            else:
+                print(f"  [-] {', '.join(GITHUB_SSH_PREFIXES)} github.com 直连，保持 SSH")
+
+    def manage_ssh(self, action: str, push: str = "", as_json: bool = False) -> int:
+        """SSH 形式地址改写：status 查看 / on 启用 / off 关闭；push 为 proxy/ssh 时同时切换推送方式"""
+        if action != "status" or push:
+            previous = (self.ssh_rewrite_enabled, self.ssh_push)
+            synced = AppliedState().fresh()
+            if action != "status":
+                self.ssh_rewrite_enabled = action == "on"
+            self.ssh_push = push or self.ssh_push
+            try:
+                cfg = GitConfigFile()
+                self._apply_ssh_rules(cfg)
+                cfg.commit()
+            except Exception as e:
+                self.ssh_rewrite_enabled, self.ssh_push = previous
+                print(f"[×] 写入Git配置失败（原配置未改动）: {e}")
+                return 1
+            self._save_config()
+            if synced:
+                self._save_applied_state()
+            push_desc = "保持 SSH" if self.ssh_push == "ssh" else "经节点 HTTPS（由凭证助手认证）"
+            print(f"[√] 已启用 SSH 地址改写，推送{push_desc}" if self.ssh_rewrite_enabled
+                  else "[√] 已关闭 SSH 地址改写，SSH 形式的远程恢复直连 SSH")
+            if self.ssh_rewrite_enabled and not self._github_proxy_base():
+                print("[提示] github.com 当前直连，配置加速后规则才会生效")
+            return 0
+
+        base = self._github_proxy_base()
+        try:
+            cfg = GitConfigFile()
+            insteadof = cfg.get_all(f"url.{base}.insteadOf") if base else []
+            pushinsteadof = {prefix: cfg.get_all(f"url.{prefix}.pushInsteadOf") for prefix in GITHUB_SSH_PREFIXES}
+        except Exception:
+            insteadof, pushinsteadof = [], {}
+        status = {"enabled": self.ssh_rewrite_enabled, "push": self.ssh_push, "proxy": base,
+                  "active": any(prefix in insteadof for prefix in GITHUB_SSH_PREFIXES),
+                  "insteadof": insteadof, "pushinsteadof": pushinsteadof}
+        if as_json:
+            print(json.dumps(status, ensure_ascii=False, indent=2))
+            return 0
+        print(f"\n--- SSH 地址改写（{'已启用' if self.ssh_rewrite_enabled else '未启用'}，"
+              f"推送方式: {self.ssh_push}）---")
+        print(f"  github.com 代理地址: {base or '(直连)'}  规则{'已生效' if status['active'] else '未生效'}")
+        if base:
+            print(f"  url.{base}.insteadOf = {', '.join(insteadof) or '(未设置)'}")
+        for prefix, values in pushinsteadof.items():
+            if values:
+                print(f"  url.{prefix}.pushInsteadOf = {', '.join(values)}")
+        return 0
+
+    def _measure_profile(self, repo: str, repeat: int) -> Dict[str, float]:
+        """用A/B基准测试的工作负载测量当前配置下各操作的中位耗时（秒）"""
+        mode = "proxy" if self.worker_domain else "direct"
+        bench = ABBenchmark(self.worker_domain, self.routes, repo=repo, repeat=repeat, ops=PERF_MEASURE_OPS)
+        rows = ABBenchmark.summarize(bench.run([mode]))
+        return {row["op"]: row["median_s"] for row in rows if row["median_s"] is not None}
+
+    def set_perf_profile(self, name: str, measure: bool = False, repo: str = BENCHMARK_REPO,
+                         repeat: int = BENCHMARK_REPEAT) -> bool:
+        """切换Git传输性能方案（空字符串表示关闭并恢复原值）；measure=True 时前后各测一次并对比"""
+        if name and name not in PERF_PROFILES:
+            print(f"[错误] 未知的性能方案: {name}（可选: {', '.join(PERF_PROFILES)}）")
+            return False
+        if measure:
+            print(f"[信息] 正在测量当前配置（{repo}，{', '.join(PERF_MEASURE_OPS)}，各 {repeat} 次）...")
+            before = self._measure_profile(repo, repeat)
+
+        previous_profile, previous_values = self.perf_profile, dict(self.perf_profile_previous)
+        self.perf_profile = name
+        try:
+            cfg = GitConfigFile()
+            self._apply_perf_profile(cfg)
+            cfg.commit()
+        except Exception as e:
+            self.perf_profile, self.perf_profile_previous = previous_profile, previous_values
+            print(f"[×] 写入Git配置失败（原配置未改动）: {e}")
+            return False
+        self._save_config()
+        if name:
+            print(f"[√] 已应用性能方案: {name}")
+            for key, value in PERF_PROFILES[name]["settings"].items():
+                print(f"  {key} = {value}")
+        else:
+            print("[√] 已关闭性能方案，相关选项已恢复原值")
+
+        if measure:
+            print("[信息] 正在测量新配置...")
+            after = self._measure_profile(repo, repeat)
+            print(f"\n  {'操作':<14}{'之前':<12}{'之后':<12}变化")
+            for op in PERF_MEASURE_OPS:
+                b, a = before.get(op), after.get(op)
+                change = f"{(a - b) / b * 100:+.0f}%" if a and b else "--"
+                print(f"  {op:<14}{f'{b:.2f} s' if b else '失败':<12}{f'{a:.2f} s' if a else '失败':<12}{change}")
+        return True
+
+    def manage_perf_profile(self):
+        """Git传输性能方案：选择/关闭方案，可选前后对比测量"""
+        # 暂停状态栏刷新
+        self._stop_speed_monitor()
+        names = list(PERF_PROFILES)
+        while True:
+            print(f"\n--- Git传输性能方案（当前: {self.perf_profile or '未启用'}）---")
+            for idx, name in enumerate(names, 1):
+                mark = " (当前)" if name == self.perf_profile else ""
+                print(f"  {idx}. {name}{mark}  {PERF_PROFILES[name]['description']}")
+            print(f"  {len(names) + 1}. 关闭方案并恢复原值")
+            print(f"  {len(names) + 2}. 返回主菜单")
+            choice = input("请选择: ").strip()
+            if not choice.isdigit() or not 1 <= int(choice) <= len(names) + 2:
+                print("[错误] 无效选项")
+                continue
+            if int(choice) == len(names) + 2:
+                break
+            name = names[int(choice) - 1] if int(choice) <= len(names) else ""
+            measure = input("是否在切换前后测量克隆耗时进行对比? (y/n): ").strip().lower() == "y"
+            repo = BENCHMARK_REPO
+            if measure:
+                repo = input(f"测量使用的仓库（owner/name，回车默认 {BENCHMARK_REPO}）: ").strip() or BENCHMARK_REPO
+            self.set_perf_profile(name, measure, repo)
+
+        # 恢复状态栏刷新
+        if self.status_bar_enabled:
+            self._start_speed_monitor()
+
+    def manage_telemetry(self):
+        """Git真实传输统计：开关 trace2 收集、按节点查看最近的实际吞吐"""
+        # 暂停状态栏刷新
+        self._stop_speed_monitor()
+        while True:
+            self._collect_trace2(force=True)
+            records = self.trace2_collector.load()
+            print(f"\n--- Git传输统计（最近 {TELEMETRY_WINDOW // 3600} 小时）---")
+            print(f"  收集状态: {'已开启' if self.telemetry_enabled else '已关闭'}（目标: {self._trace2_target()}）")
+            summary = Trace2Collector.summarize(records)
+            if not summary:
+                print("  暂无记录")
+            for endpoint, st in sorted(summary.items(), key=lambda item: -item[1]["ops"]):
+                print(f"  {endpoint:<45} 操作: {st['ops']:<5} 失败: {st['failed']:<4} "
+                      f"接收: {st['bytes'] / 1024 / 1024:.1f} MB  平均吞吐: {_format_speed(st['bps'])}")
+                if st["lfs_bytes"]:
+                    print(f"  {'':<45} LFS对象: {st['lfs_bytes'] / 1024 / 1024:.1f} MB  "
+                          f"平均吞吐: {_format_speed(st['lfs_bps'])}")
+            for record in records[-5:]:
+                when = time.strftime("%m-%d %H:%M", time.localtime(record["ts"]))
+                print(f"    {when} {record['op']:<6} {record['host'] or '-':<30} "
+                      f"{record['wall_ms'] / 1000:.1f}s  {_format_speed(record['bps'])}")
+            print("1. 开启/关闭收集  2. 切换收集方式（目录/Unix socket）  3. 返回主菜单")
+            choice = input("请选择: ").strip()
+
+            if choice in ("1", "2"):
+                if choice == "1":
+                    self.telemetry_enabled = not self.telemetry_enabled
+                elif OS_TYPE == "windows":
+                    print("[错误] Windows 仅支持目录模式")
+                    continue
+                else:
+                    self.telemetry_target = "socket" if self.telemetry_target == "dir" else "dir"
+                self._save_config()
+                try:
+                    cfg = GitConfigFile()
+                    self._apply_trace2_target(cfg)
+                    cfg.commit()
+                    print(f"[√] 已{'开启' if self.telemetry_enabled else '关闭'}Git传输统计（{self._trace2_target()}）")
+                except Exception as e:
+                    print(f"[错误] 写入Git配置失败: {e}")
+                if self._trace2_target() == str(TRACE2_DIR) or not self.telemetry_enabled:
+                    self._trace2_stop_flag.set()
+                else:
+                    self._start_trace2_socket()
+            elif choice == "3":
+                break
+            else:
+                print("[错误] 无效选项")
+
+        # 恢复状态栏刷新
+        if self.status_bar_enabled:
+            self._start_speed_monitor()
+
+    def report(self, window: float = 3600, as_json: bool = False) -> List[dict]:
+        """输出时序库中各节点各指标在窗口内的 p50/p95/p99/EWMA"""
+        rows = []
+        for endpoint, metric in sorted(self.metric_store.keys()):
+            values = [v for _, v in self.metric_store.window(endpoint, metric, window)]
+            if not values:
+                continue
+            ordered = sorted(values)
+            rows.append({"endpoint": endpoint, "metric": metric, "count": len(values),
+                         "p50": _percentile(ordered, 50), "p95": _percentile(ordered, 95),
+                         "p99": _percentile(ordered, 99), "mean": statistics.mean(values),
+                         "ewma": self.metric_store.ewma(endpoint, metric, seconds=window)})
+        failover = self._failover_summary(window)
+        cache = ContentCache().summary() if (CACHE_DIR / "index.json").exists() else None
+        # 环形文件写满后更早的样本已被覆盖，窗口超出保留范围时统计只覆盖实际保留的部分
+        oldest = self.metric_store.oldest()
+        retained = time.time() - oldest if oldest is not None and oldest > time.time() - window else None
+        if as_json:
+            print(json.dumps({"metrics": rows, "failover": failover, "cache": cache, "window": window,
+                              "retained_seconds": retained}, ensure_ascii=False, indent=2))
+            return rows
+
+        def fmt(metric, value):
+            if metric == "bandwidth" or metric.endswith("_bps"):
+                return _format_speed(value)
+            if metric == "fail":
+                return f"{value * 100:.0f}%"
+            return f"{value:.0f} ms"
+
+        print(f"\n[信息] 最近 {window:.0f} 秒统计（时序库: {METRICS_FILE}）")
+        if retained is not None:
+            print(f"[提示] 时序库已写满，只保留了最近 {retained / 3600:.1f} 小时的样本，短于统计窗口 {window / 3600:.1f} 小时；"
+                  f"熔断统计来自单独的事件日志，不受影响")
+        if not rows:
+            print("  暂无数据")
+        for row in rows:
+            m = row["metric"]
+            # 失败率只看均值，分位数无意义
+            detail = f"失败率 {fmt(m, row['mean'])}" if m == "fail" else \
+                f"p50 {fmt(m, row['p50'])}  p95 {fmt(m, row['p95'])}  p99 {fmt(m, row['p99'])}  EWMA {fmt(m, row['ewma'])}"
+            print(f"  {row['endpoint']:<40} {m:<12} 样本 {row['count']:<6} {detail}")
+        for endpoint, st in failover.items():
+            print(f"  {endpoint:<40} {'熔断':<12} 次数 {st['trips']:<6} 降级时长 {st['degraded_seconds']:.0f} 秒")
+        if cache:
+            self._print_cache_summary(cache)
+        return rows
+
+    @staticmethod
+    def _print_cache_summary(cache: dict):
+        print(f"\n[信息] 本地内容缓存（累计）: 命中率 {cache['hit_ratio'] * 100:.1f}%，命中 {cache['hits']} 次"
+              f"（重新验证 {cache['revalidated']}，合并请求 {cache['coalesced']}，上游失败回退 {cache['stale']}），"
+              f"未命中 {cache['misses']} 次")
+        print(f"  节省上游流量 {cache['bytes_saved'] / 1024 / 1024:.1f} MB，上游下载 {cache['bytes_fetched'] / 1024 / 1024:.1f} MB，"
+              f"已缓存 {cache['entries']} 个地址 / {cache['bytes'] / 1024 / 1024:.1f} MB（上限 {cache['max_bytes'] / 1024 / 1024:.0f} MB）")
 
-# ========== 全局常量 ==========
-CONFIG_FILE = Path.home() / ".github_cf_proxy_config.json"
-SCRIPT_PATH = Path(__file__).resolve()
-OS_TYPE = platform.system().lower()
-# 测速配置：走加速代理的GitHub小文件（仅10KB以内，无流量负担）
-SPEED_TEST_URL = "/raw/octocat/Hello-World/master/README"
-# 状态栏刷新间隔（秒）
-STATUS_REFRESH_INTERVAL = 2
-# 测速超时时间（秒）
-TEST_TIMEOUT = 5
+    def simulate(self, scenarios: Optional[List[str]] = None, rounds: int = SIM_ROUNDS, seed: int = SIM_SEED,
+                 as_json: bool = False) -> int:
+        """模拟链路基准；有场景未达门限时返回1，便于CI判定"""
+        unknown = [name for name in scenarios or [] if name not in ProbeHarness.SCENARIOS]
+        if unknown:
+            print(f"[错误] 未知场景: {', '.join(unknown)}（可选: {', '.join(ProbeHarness.SCENARIOS)}）")
+            return 1
+        harness = ProbeHarness(rounds, seed, None if as_json else lambda message: print(f"[信息] 运行 {message} ..."))
+        report = harness.run(scenarios)
+        if as_json:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+            return 0 if report["passed"] else 1
 
+        def verdict(row):
+            return "达标" if row["passed"] else "未达标"
 
-class GitHubCFProxy:
-    def __init__(self):
-        # 基础配置
-        self.config = self._load_config()
-        self.worker_domain = self.config.get("worker_domain", "")
-        self.auto_start_enabled = self.config.get("auto_start", False)
-        # 状态栏相关配置
-        self.status_bar_enabled = self.config.get("status_bar_enabled", False)
-        self._terminal_inited = False
-        # 网速/延迟状态变量（后台线程更新）
-        self._current_speed: str = "-- MB/s"
-        self._current_delay: str = "-- ms"
-        self._speed_thread: Optional[threading.Thread] = None
-        self._thread_stop_flag = threading.Event()
-        self._thread_lock = threading.Lock()
+        if "accuracy" in report:
+            print(f"\n[测速精度] 每种链路 {harness.rounds} 轮；门限: 首字节误差 ±{SIM_MAX_TTFB_ERROR_MS} ms，"
+                  f"带宽误差 ±{SIM_MAX_BANDWIDTH_ERROR:.0%}，置信区间覆盖率 ≥{SIM_MIN_CI_COVERAGE:.0%}")
+            print(f"  {'链路':<12}{'施加延迟':>8}{'首字节中位':>10}{'误差':>8}{'p95偏差':>9}{'设定带宽':>14}{'测得带宽':>14}"
+                  f"{'误差':>8}{'CI覆盖':>8}{'测速耗时':>9}  结论")
+            for row in report["accuracy"]:
+                def ms(value):
+                    return f"{value:.1f}" if value is not None else "--"
+                profile = row["profile"]
+                bw_error = f"{row['bandwidth_error']:+.1%}" if row["bandwidth_error"] is not None else "--"
+                coverage = f"{row['ci_coverage']:.0%}" if row["ci_coverage"] is not None else "--"
+                print(f"  {row['link']:<12}{row['ttfb_applied_ms']:>8.1f}{ms(row['ttfb_median_ms']):>10}"
+                      f"{ms(row['ttfb_error_ms']):>8}{ms(row['ttfb_p95_deviation_ms']):>9}"
+                      f"{_format_speed(profile['bandwidth']):>14}{_format_speed(row['bandwidth_bps'] or 0):>14}"
+                      f"{bw_error:>8}{coverage:>8}{row['probe_seconds']:>8.2f}s  "
+                      f"{verdict(row) if row['gated'] else '参考'}")
+        if "ranking" in report:
+            ranking = report["ranking"]
+            print(f"\n[节点排名] 理想: {' > '.join(ranking['ideal'])}")
+            print(f"           实测: {' > '.join(ranking['measured'])}")
+            print(f"  首选正确: {'是' if ranking['top1_correct'] else '否'}，两两顺序一致率 {ranking['pairwise_agreement']:.0%}"
+                  f"  {verdict(ranking)}")
+        for row in report.get("failover", []):
+            def cycles(value):
+                return f"{value} 轮（约 {value * DAEMON_INTERVAL} s）" if value else "未发生"
+            print(f"\n[熔断切换] 首选节点劣化方式: {row['mode']} {row['degradation']}")
+            print(f"  检测: {cycles(row['detect_cycles'])}  切换: {cycles(row['switch_cycles'])}  "
+                  f"恢复后重新启用: {cycles(row['recover_cycles'])}  {verdict(row)}")
+        print(f"\n[{'√' if report['passed'] else '×'}] 模拟链路基准{'全部达标' if report['passed'] else '有未达标项'}")
+        return 0 if report["passed"] else 1
 
-    def _load_config(self):
-        """加载本地配置文件"""
-        if CONFIG_FILE.exists():
-            try:
-                with open(CONFIG_FILE, "r", encoding="utf-8") as f:
-                    return json.load(f)
-            except Exception as e:
-                print(f"[警告] 配置文件损坏，将重置: {e}")
-        return {}
+    def benchmark_startup(self, repeat: int = STARTUP_BENCH_REPEAT, as_json: bool = False) -> int:
+        """命令行启动耗时基准；module 模式有命令超出目标时返回1，便于CI判定"""
+        commands = ["status"]
+        if AppliedState().fresh():
+            commands.insert(0, "apply")
+        elif not as_json:
+            print("[提示] 规则未同步（或配置已改动），apply 不是空操作，本次只测 status；先运行 apply 后再测")
+        if not as_json:
+            print(f"\n[信息] 启动耗时基准：每项 {max(1, repeat)} 次，目标（扣除解释器启动）{STARTUP_BUDGET_MS} ms")
+        report = StartupBenchmark(commands, repeat).run()
+        if as_json:
+            print(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            print(f"\n  空解释器（Python {report['python']}）中位 {report['baseline_ms']:.1f} ms，"
+                  f"p95 {report['baseline_p95_ms']:.1f} ms")
+            print(f"  {'模式':<10}{'命令':<10}{'中位耗时':<12}{'p95耗时':<12}{'工具开销':<12}结论")
+            for row in report["results"]:
+                verdict = {True: "达标", False: "超出目标", None: "仅对照（每次重新编译）"}[row["within_budget"]]
+                print(f"  {row['mode']:<10}{row['command']:<10}{row['median_ms']:<12.1f}{row['p95_ms']:<12.1f}"
+                      f"{row['overhead_ms']:<12.1f}{verdict}")
+        return 1 if any(row["within_budget"] is False for row in report["results"]) else 0
 
-    def _save_config(self):
-        """保存配置到本地"""
-        self.config["worker_domain"] = self.worker_domain
-        self.config["auto_start"] = self.auto_start_enabled
-        self.config["status_bar_enabled"] = self.status_bar_enabled
-        try:
-            with open(CONFIG_FILE, "w", encoding="utf-8") as f:
-                json.dump(self.config, f, indent=4, ensure_ascii=False)
-            return True
-        except Exception as e:
-            print(f"[错误] 保存配置失败: {e}")
-            return False
+    def benchmark(self, repo: str = BENCHMARK_REPO, ref: str = BENCHMARK_REF, raw_file: str = BENCHMARK_FILE,
+                  repeat: int = BENCHMARK_REPEAT, ops: Optional[List[str]] = None, modes: Optional[List[str]] = None,
+                  endpoint: str = "", as_json: bool = False) -> int:
+        """直连 vs 代理 A/B 基准测试；返回退出码（有操作在某模式下全部失败时为1，便于CI判定）"""
+        endpoint = _normalize_domain(endpoint) if endpoint else self.worker_domain
+        modes = modes or list(ABBenchmark.MODES)
+        if "proxy" in modes and not endpoint:
+            print("[错误] 请先配置加速规则，或通过 --endpoint 指定代理节点")
+            return 1
+        if not shutil.which("git"):
+            print("[错误] 未找到Git！请先安装Git并添加到系统环境变量（PATH）")
+            return 1
+        bench = ABBenchmark(endpoint, self.routes, repo, ref, raw_file, repeat, ops)
 
-    def _init_terminal(self):
-        """初始化终端，开启Windows ANSI支持，跨终端兼容"""
-        if self._terminal_inited:
-            return
-        # Windows开启虚拟终端ANSI支持
-        if OS_TYPE == "windows":
-            kernel32 = ctypes.windll.kernel32
-            handle = kernel32.GetStdHandle(-11)
-            mode = ctypes.c_ulong()
-            kernel32.GetConsoleMode(handle, ctypes.byref(mode))
-            kernel32.SetConsoleMode(handle, ctypes.c_ulong(mode.value | 0x0004))
-        # 隐藏光标（状态栏模式）
-        if self.status_bar_enabled:
-            print("\033[?25l", end="")
-        self._terminal_inited = True
+        def progress(sample):
+            if sample["error"]:
+                result = f"失败: {sample['error']}"
+            else:
+                speed = sample["bytes"] / sample["seconds"] if sample["seconds"] > 0 else 0
+                result = f"{sample['seconds']:.2f} s  {_format_speed(speed)}"
+            print(f"  第{sample['round']}轮  {sample['op']:<14}{sample['mode']:<8}{result}")
 
-    def _reset_terminal(self):
-        """退出时重置终端状态"""
-        # 恢复光标
-        print("\033[?25h", end="")
-        # 清除状态栏行
-        print("\r\033[K", end="", flush=True)
+        if not as_json:
+            print(f"\n[信息] A/B 基准测试: {bench.repo}@{ref}，每项 {bench.repeat} 次，代理节点: {endpoint or '无'}")
+        samples = bench.run(modes, None if as_json else progress)
+        rows = ABBenchmark.summarize(samples)
 
-    def _test_node_delay(self) -> int:
-        """测试Cloudflare代理节点TCP延迟（ms），无权限要求，跨平台兼容"""
-        if not self.worker_domain:
-            return -1
-        try:
-            # 提取域名，去掉https://前缀
-            host = self.worker_domain.replace("https://", "").replace("http://", "").split("/")[0]
-            port = 443
-            start_time = time.time()
-            # 建立TCP连接，测握手延迟
-            sock = socket.create_connection((host, port), timeout=TEST_TIMEOUT)
-            sock.close()
-            delay = int((time.time() - start_time) * 1000)
-            return delay if delay > 0 else 0
-        except Exception:
-            return -1
+        if as_json:
+            print(json.dumps({"endpoint": endpoint, "repo": bench.repo, "ref": ref, "repeat": bench.repeat,
+                              "results": rows, "samples": samples}, ensure_ascii=False, indent=2))
+        else:
+            def seconds(value):
+                return f"{value:.2f} s" if value is not None else "--"
 
-    def _test_download_speed(self) -> Tuple[float, str]:
-        """测试加速链路下载速率，返回字节数+格式化字符串"""
-        if not self.worker_domain:
-            return 0, "-- MB/s"
-        try:
-            test_url = f"{self.worker_domain}{SPEED_TEST_URL}"
-            start_time = time.time()
-            # 仅下载前10KB，无流量负担
-            req = urllib.request.Request(test_url, method="GET", headers={"Range": "bytes=0-10240"})
-            with urllib.request.urlopen(req, timeout=TEST_TIMEOUT) as resp:
-                data = resp.read()
-                download_size = len(data)
-                cost_time = time.time() - start_time
-                if cost_time <= 0:
-                    return 0, "-- MB/s"
-                # 计算速率
-                speed_bps = download_size / cost_time
-                # 格式化单位
-                if speed_bps < 1024:
-                    speed_str = f"{speed_bps:.2f} B/s"
-                elif speed_bps < 1024 * 1024:
-                    speed_str = f"{speed_bps/1024:.2f} KB/s"
-                else:
-                    speed_str = f"{speed_bps/(1024*1024):.2f} MB/s"
-                return speed_bps, speed_str
-        except Exception:
-            return 0, "-- MB/s"
+            print(f"\n  {'操作':<14}{'模式':<8}{'成功':<8}{'中位耗时':<12}{'p95耗时':<12}{'中位吞吐':<14}加速比")
+            for row in rows:
+                speed = _format_speed(row["median_bps"]) if row["median_bps"] is not None else "--"
+                speedup = f"{row['speedup']:.2f}x" if row.get("speedup") else ""
+                print(f"  {row['op']:<14}{row['mode']:<8}{row['ok']}/{row['runs']:<6}{seconds(row['median_s']):<12}"
+                      f"{seconds(row['p95_s']):<12}{speed:<14}{speedup}")
+        return 1 if any(row["ok"] == 0 for row in rows) else 0
 
-    def _speed_monitor_worker(self):
-        """后台网速/延迟监控线程，不阻塞主线程输入"""
-        while not self._thread_stop_flag.is_set():
-            if not self.worker_domain or not self.status_bar_enabled:
-                time.sleep(STATUS_REFRESH_INTERVAL)
+    def run_command(self, argv: List[str]) -> int:
+        """非交互子命令入口"""
+        parser = argparse.ArgumentParser(prog="github_cf_proxy.py",
+                                         description="GitHub Cloudflare 全自动加速工具（不带参数运行进入交互菜单）")
+        sub = parser.add_subparsers(dest="command")
+        p_apply = sub.add_parser("apply", help="配置/同步加速规则（配置未变化时立即返回，适合开机与批量部署脚本）")
+        p_apply.add_argument("--endpoint", action="append", default=[], metavar="DOMAIN",
+                             help="加入节点池的Worker自定义域（可多次指定）")
+        p_apply.add_argument("--probe", action="store_true", help="先测速选择最优节点并逐主机决定走代理/直连")
+        p_apply.add_argument("--force", action="store_true", help="即使配置未变化也重新同步")
+        p_apply.add_argument("-q", "--quiet", action="store_true", help="只输出错误与实际写入的变更")
+        p_status = sub.add_parser("status", help="输出加速状态（只读本地文件，退出码0表示规则已同步）")
+        p_status.add_argument("--short", action="store_true", help="单行输出，供 shell 提示符使用")
+        p_status.add_argument("--json", action="store_true", help="以JSON输出")
+        p_probe = sub.add_parser("probe", help="测速全部节点并更新排名")
+        p_probe.add_argument("--bandwidth", action="store_true", help="同时测带宽（消耗较多流量）")
+        p_probe.add_argument("--json", action="store_true", help="以JSON输出")
+        sub.add_parser("clean", help="清理全部加速规则（保留节点等配置）")
+        p_reset = sub.add_parser("reset", help="重置所有配置（加速规则、Git凭证、脚本配置、自启）")
+        p_reset.add_argument("-y", "--yes", action="store_true", help="不询问确认（非交互环境必须指定）")
+        p_report = sub.add_parser("report", help="输出测速/传输时序统计（p50/p95/p99/EWMA）")
+        p_report.add_argument("--window", type=float, default=3600, help="统计窗口（秒），默认3600")
+        p_report.add_argument("--json", action="store_true", help="以JSON输出")
+        p_daemon = sub.add_parser("daemon", help="常驻后台：周期测速、保持Git规则同步，并提供 Prometheus /metrics")
+        p_daemon.add_argument("--listen", default=DAEMON_LISTEN, help=f"/metrics 监听地址，默认 {DAEMON_LISTEN}")
+        p_daemon.add_argument("--interval", type=float, default=DAEMON_INTERVAL,
+                              help=f"测速周期（秒），默认 {DAEMON_INTERVAL}")
+        p_bench = sub.add_parser("benchmark", help="直连 vs 代理 A/B 基准测试（耗时中位数/p95与吞吐）")
+        p_bench.add_argument("--repo", default=BENCHMARK_REPO, help=f"测试仓库 owner/name，默认 {BENCHMARK_REPO}")
+        p_bench.add_argument("--ref", default=BENCHMARK_REF, help=f"raw/archive 使用的分支，默认 {BENCHMARK_REF}")
+        p_bench.add_argument("--file", default=BENCHMARK_FILE, help=f"raw 下载的文件路径，默认 {BENCHMARK_FILE}")
+        p_bench.add_argument("--repeat", type=int, default=None,
+                             help=f"每项重复次数，默认 {BENCHMARK_REPEAT}（--startup 时为 {STARTUP_BENCH_REPEAT}）")
+        p_bench.add_argument("--ops", default=",".join(ABBenchmark.OPS),
+                             help=f"逗号分隔的操作，默认全部: {','.join(ABBenchmark.OPS)}")
+        p_bench.add_argument("--mode", choices=("both",) + ABBenchmark.MODES, default="both", help="测试模式，默认 both")
+        p_bench.add_argument("--endpoint", default="", help="代理节点（默认当前节点）")
+        p_bench.add_argument("--startup", action="store_true",
+                             help=f"改为测量命令行空操作（apply/status）启动耗时，目标 {STARTUP_BUDGET_MS} ms")
+        p_bench.add_argument("--json", action="store_true", help="以JSON输出")
+        p_sim = sub.add_parser("simulate", help="在本机回环模拟链路上评估测速精度、节点排名与熔断切换（回归基准，不访问网络）")
+        p_sim.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                           help=f"场景（默认全部）: {', '.join(ProbeHarness.SCENARIOS)}")
+        p_sim.add_argument("--rounds", type=int, default=SIM_ROUNDS, help=f"每项测量轮数，默认 {SIM_ROUNDS}")
+        p_sim.add_argument("--seed", type=int, default=SIM_SEED, help=f"模拟链路随机种子，默认 {SIM_SEED}")
+        p_sim.add_argument("--json", action="store_true", help="以JSON输出（含熔断场景逐轮时间线）")
+        p_profile = sub.add_parser("profile", help="查看/应用/关闭Git传输性能方案")
+        p_profile.add_argument("name", nargs="?", help=f"方案名（{', '.join(PERF_PROFILES)}），off 表示关闭；省略则列出方案")
+        p_profile.add_argument("--measure", action="store_true", help="应用前后测量克隆耗时并对比")
+        p_profile.add_argument("--repo", default=BENCHMARK_REPO, help=f"测量使用的仓库，默认 {BENCHMARK_REPO}")
+        p_profile.add_argument("--repeat", type=int, default=BENCHMARK_REPEAT, help=f"测量重复次数，默认 {BENCHMARK_REPEAT}")
+        p_relay = sub.add_parser("relay", help="运行自建中转（Python 版 workers.js），可作为节点地址使用")
+        p_relay.add_argument("--listen", default=RELAY_LISTEN, help=f"监听地址，默认 {RELAY_LISTEN}")
+        p_relay.add_argument("--concurrency", type=int, default=RELAY_CONCURRENCY,
+                             help=f"并发请求上限，默认 {RELAY_CONCURRENCY}")
+        p_relay.add_argument("--cert", default="", help="TLS 证书文件（与 --key 同时指定时以 HTTPS 提供服务）")
+        p_relay.add_argument("--key", default="", help="TLS 私钥文件")
+        p_relay.add_argument("--upstream", action="append", default=[], metavar="HOST=URL",
+                             help="替换某个上游主机的地址（可多次指定），如 github.com=http://127.0.0.1:9000")
+        p_relay.add_argument("--cache", action="store_true", help="缓存 raw/gist/codeload 响应（见 cache 子命令）")
+        p_cache = sub.add_parser("cache", help="本地内容缓存：在节点前缓存 raw/gist/codeload 响应")
+        p_cache.add_argument("action", nargs="?", choices=("serve", "stats", "clear"), default="serve",
+                             help="serve 运行缓存层（默认）/ stats 查看命中率 / clear 清空")
+        p_cache.add_argument("--listen", default=CACHE_LISTEN, help=f"监听地址，默认 {CACHE_LISTEN}")
+        p_cache.add_argument("--max-size", default="", help="设置缓存总大小上限（如 2G），超出按最近使用淘汰")
+        p_cache.add_argument("--direct", action="store_true", help="不经节点，直接向 GitHub 请求")
+        p_cache.add_argument("--json", action="store_true", help="stats 以JSON输出")
+        p_download = sub.add_parser("download", help="经代理节点分段并行下载 Release 资源/源码归档（支持断点续传）")
+        p_download.add_argument("url", help="GitHub 下载地址（如 https://github.com/o/r/releases/download/v1/x.tar.gz）")
+        p_download.add_argument("-o", "--output", default="", help="保存路径，默认取地址中的文件名")
+        p_download.add_argument("-c", "--connections", type=int, default=DOWNLOAD_CONNECTIONS,
+                                help=f"并发连接数，默认 {DOWNLOAD_CONNECTIONS}")
+        p_download.add_argument("--checksum", default="", help="完成后校验摘要，格式 [算法:]十六进制，默认算法 sha256")
+        p_download.add_argument("--direct", action="store_true", help="不经代理节点，直连下载")
+        p_sync = sub.add_parser("sync", help="按清单并发 clone/fetch 多个仓库（大仓库优先、自适应并发、出错退避重试）")
+        p_sync.add_argument("manifest", help="JSON 清单文件")
+        p_sync.add_argument("-j", "--jobs", type=int, default=SYNC_JOBS, help=f"最大并发数，默认 {SYNC_JOBS}")
+        p_sync.add_argument("--retries", type=int, default=SYNC_RETRIES,
+                            help=f"Worker 5xx/网络错误重试次数，默认 {SYNC_RETRIES}")
+        p_sync.add_argument("--direct", action="store_true", help="不经代理节点，直连同步")
+        p_sync.add_argument("--json", action="store_true", help="以JSON输出")
+        p_clone = sub.add_parser("clone", help="按仓库大小、用途与实测吞吐自动选择 完整/浅/部分/稀疏 克隆")
+        p_clone.add_argument("repo", help="仓库（owner/name 或克隆地址）")
+        p_clone.add_argument("directory", nargs="?", default="", help="目标目录，默认取仓库名")
+        p_clone.add_argument("--intent", choices=tuple(CLONE_INTENTS), default="build",
+                             help="用途：build 构建（默认）/ browse 阅读代码与历史 / ci 持续集成只需当前提交")
+        p_clone.add_argument("--strategy", choices=("auto",) + tuple(CLONE_STRATEGIES), default="auto",
+                             help="手动指定策略（仍记录耗时），默认 auto")
+        p_clone.add_argument("--sparse", nargs="+", metavar="PATH", help="只检出这些目录（部分克隆 + sparse-checkout）")
+        p_clone.add_argument("-b", "--branch", default="", help="检出的分支或标签")
+        p_clone.add_argument("--dry-run", action="store_true", help="只探测并输出各策略预估，不克隆")
+        p_clone.add_argument("--json", action="store_true", help="以JSON输出")
+        p_lfs = sub.add_parser("lfs", help="Git LFS 加速：按节点实测吞吐调优并发传输数，单独统计LFS吞吐")
+        p_lfs.add_argument("action", nargs="?", choices=("status", "tune", "off"), default="status",
+                           help="status 查看（默认）/ tune 测速调优并启用 / off 关闭并恢复原值")
+        p_lfs.add_argument("--endpoint", default="", help="tune 测速的节点（默认 github.com 当前所走节点）")
+        p_lfs.add_argument("--json", action="store_true", help="status 以JSON输出")
+        p_ssh = sub.add_parser("ssh", help="把 SSH 形式的 github.com 地址（git@github.com:…）改写为经节点 HTTPS 拉取")
+        p_ssh.add_argument("action", nargs="?", choices=("status", "on", "off"), default="status",
+                           help="status 查看（默认）/ on 启用 / off 关闭")
+        p_ssh.add_argument("--push", choices=("proxy", "ssh"), default="",
+                           help="推送方式：proxy 同样经节点 HTTPS（由凭证助手认证）/ ssh 保持原 SSH 地址")
+        p_ssh.add_argument("--json", action="store_true", help="status 以JSON输出")
+        p_submodules = sub.add_parser("submodules", help="经节点并行初始化/更新子模块（递归，含 SSH 形式地址）")
+        p_submodules.add_argument("path", nargs="?", default=".", help="仓库目录，默认当前目录")
+        p_submodules.add_argument("-j", "--jobs", type=int, default=SYNC_JOBS, help=f"并行拉取数，默认 {SYNC_JOBS}")
+        p_submodules.add_argument("--depth", type=int, default=0, help="浅克隆子模块的深度，默认完整克隆")
+        p_mirror = sub.add_parser("mirror", help="管理本地裸镜像缓存（clone/sync 克隆时复用镜像中的对象）")
+        p_mirror.add_argument("action", choices=("list", "add", "remove", "refresh"), help="操作")
+        p_mirror.add_argument("repos", nargs="*", help="仓库（owner/name 或 github.com 地址）；refresh 省略时刷新全部")
+        p_mirror.add_argument("--max-size", default="", help="设置缓存总大小上限（如 50G），超出按最近使用淘汰")
+        args = parser.parse_args(argv)
+
+        if args.command == "apply":
+            return self.apply(args.endpoint, args.probe, args.force, args.quiet)
+        if args.command == "status":
+            return AppliedState().report(args.json, args.short)
+        if args.command == "probe":
+            return self.probe(args.bandwidth, args.json)
+        if args.command == "clean":
+            return 0 if self.clean_rules() else 1
+        if args.command == "reset":
+            if not args.yes and not sys.stdin.isatty():
+                print("[错误] 非交互环境请加 --yes 确认重置")
+                return 1
+            self.reset_all(assume_yes=args.yes)
+            return 0
+        if args.command == "simulate":
+            return self.simulate(args.scenarios, args.rounds, args.seed, args.json)
+        if args.command == "clone":
+            return self.clone(args.repo, args.directory, args.intent, args.strategy, args.branch, args.sparse,
+                              args.dry_run, args.json)
+        if args.command == "lfs":
+            return self.manage_lfs(args.action, args.endpoint, args.json)
+        if args.command == "ssh":
+            return self.manage_ssh(args.action, args.push, args.json)
+        if args.command == "submodules":
+            return self.update_submodules(args.path, args.jobs, args.depth)
+        if args.command == "mirror":
+            return self.manage_mirrors(args.action, args.repos, args.max_size)
+        if args.command == "sync":
+            return self.sync(args.manifest, args.jobs, args.retries, args.direct, args.json)
+        if args.command == "download":
+            return self.download(args.url, args.output, args.connections, args.checksum, args.direct)
+        if args.command == "relay":
+            return self.run_relay(args.listen, args.concurrency, args.cert, args.key, args.upstream, args.cache)
+        if args.command == "cache":
+            return self.manage_cache(args.action, args.listen, args.max_size, args.direct, args.json)
+        if args.command == "profile":
+            if not args.name:
+                for name, profile in PERF_PROFILES.items():
+                    mark = " (当前)" if name == self.perf_profile else ""
+                    print(f"{name}{mark}: {profile['description']}")
+                    for key, value in profile["settings"].items():
+                        print(f"  {key} = {value}")
+                return 0
+            name = "" if args.name == "off" else args.name
+            return 0 if self.set_perf_profile(name, args.measure, args.repo, args.repeat) else 1
+
+        if args.command == "benchmark":
+            if args.startup:
+                return self.benchmark_startup(args.repeat or STARTUP_BENCH_REPEAT, args.json)
+            return self.benchmark(args.repo, args.ref, args.file, args.repeat or BENCHMARK_REPEAT,
+                                  [op.strip() for op in args.ops.split(",") if op.strip()],
+                                  None if args.mode == "both" else [args.mode], args.endpoint, args.json)
+        if args.command == "report":
+            self.report(args.window, args.json)
+            return 0
+        if args.command == "daemon":
+            return self.run_daemon(args.listen, args.interval)
+        parser.print_help()
+        return 1
+
+    @staticmethod
+    def _log(message: str):
+        """守护进程日志（带时间戳，立即刷新以便 journald/launchd 收集）"""
+        print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {message}", flush=True)
+
+    def _breaker(self, endpoint: str) -> CircuitBreaker:
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker()
+        return self.breakers[endpoint]
+
+    def _update_breakers(self) -> bool:
+        """用最近一轮分阶段测速（含直连）驱动各节点熔断器，返回是否有节点状态变化"""
+        with self._thread_lock:
+            results = list(self._last_probe_results)
+        direct = {r.route: r for r in results if r.endpoint == DIRECT_ENDPOINT}
+        changed = False
+        for endpoint in self.worker_endpoints:
+            probes = [r for r in results if r.endpoint == endpoint]
+            if not probes:
                 continue
-            # 测延迟和速率
-            delay = self._test_node_delay()
-            speed_bps, speed_str = self._test_download_speed()
-            # 线程安全更新变量
-            with self._thread_lock:
-                self._current_speed = speed_str
-                self._current_delay = f"{delay} ms" if delay >= 0 else "-- ms"
-            # 按间隔刷新
-            time.sleep(STATUS_REFRESH_INTERVAL)
+            breaker = self._breaker(endpoint)
+            verdict = assess_endpoint(probes, direct, breaker.allows)
+            if verdict is None:
+                continue
+            healthy, reason = verdict
+            state = breaker.record(healthy, reason)
+            if state:
+                changed = True
+                self._log_failover(endpoint, state, breaker.reason or reason)
+        return changed
 
-    def _start_speed_monitor(self):
-        """启动后台监控线程"""
-        if self._speed_thread and self._speed_thread.is_alive():
-            return
-        self._thread_stop_flag.clear()
-        self._speed_thread = threading.Thread(target=self._speed_monitor_worker, daemon=True)
-        self._speed_thread.start()
+    def _select_daemon_endpoint(self) -> str:
+        """从熔断器闭合的节点中选出承载规则的节点；评分优势不足时保持当前节点"""
+        return self.endpoint_pool.select(self.worker_domain, lambda ep: self._breaker(ep).allows)
 
-    def _stop_speed_monitor(self):
-        """停止后台监控线程"""
-        self._thread_stop_flag.set()
-        if self._speed_thread and self._speed_thread.is_alive():
-            self._speed_thread.join(timeout=1)
+    def _daemon_cycle(self):
+        """守护进程单轮：测速全部节点与直连→驱动熔断器→选择节点→维护优选IP与路由决策→同步Git规则"""
+        now = time.time()
+        broker = self.probe_broker
+        # 守护进程优先担任测速主控，终端会话直接读取其发布的结果
+        broker.try_lead()
+        within_budget = broker.remaining() > 0
+        if within_budget:
+            bandwidth = now - self._last_bandwidth_probe >= DAEMON_BANDWIDTH_INTERVAL
+            if bandwidth:
+                self._last_bandwidth_probe = now
+            results = self.endpoint_pool.probe_all(
+                lambda eps: self._probe_endpoints(eps, bandwidth=bandwidth, with_direct=True))
+            self._update_breakers()
+            broker.publish({ep: (delay, _format_speed(bps) if bps else None) for ep, (delay, bps) in results.items()})
+        elif not self._budget_exhausted:
+            self._log(f"[警告] 今日测速请求已达预算 {broker.budget} 次，暂停测速至次日（规则同步不受影响）")
+        self._budget_exhausted = not within_budget
+        best = self._select_daemon_endpoint()
+        if best and best != self.worker_domain:
+            self._log(f"[信息] 切换节点: {self.worker_domain or '无'} → {best}")
+            self._log_failover(best, "active", f"替换 {self.worker_domain or '无'}")
+            self.worker_domain = best
+            self._endpoint_switches += 1
+            self._save_config()
+        if self.edge_pin_enabled:
+            self._edge_maintain()
+        if within_budget and now - self._routes_last_check >= DAEMON_ROUTE_CHECK_INTERVAL:
+            self._routes_last_check = now
+            self._check_routes()
+        self._collect_trace2()
+        self._mirror_maintain()
+        if self.lfs_enabled and within_budget:
+            self._lfs_maintain()
+        # 每轮都比对一次，被外部改动的规则会被恢复；熔断状态变化也在这里一次性原子生效；无变化时不写文件
+        self._apply_rules(verbose=False)
+        self.mirror_cache.purge()
+        self._daemon_cycles += 1
 
-    def _render_status_bar(self):
-        """渲染状态栏，仅在开启状态下生效"""
-        if not self.status_bar_enabled:
-            return
-        # 线程安全读取状态
+    def _log_failover(self, endpoint: str, state: str, reason: str):
+        """记录熔断/切换事件（日志输出 + JSON Lines 文件）"""
+        labels = {CircuitBreaker.OPEN: "熔断断开，规则已摘除", CircuitBreaker.HALF_OPEN: "进入半开试探",
+                  CircuitBreaker.CLOSED: "恢复正常，规则已恢复", "active": "成为当前节点"}
+        self._log(f"[熔断] {endpoint} {labels.get(state, state)}（{reason}）")
+        record = {"ts": time.time(), "endpoint": endpoint, "state": state, "reason": reason}
+        try:
+            with open(FAILOVER_LOG_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            if FAILOVER_LOG_FILE.stat().st_size > FAILOVER_TRIM_BYTES:
+                # 裁剪写临时文件后原子替换，中途崩溃也不会截断 _restore_breakers 依赖的事件历史
+                with open(FAILOVER_LOG_FILE, "r", encoding="utf-8") as f:
+                    lines = f.readlines()
+                tmp = FAILOVER_LOG_FILE.with_name(FAILOVER_LOG_FILE.name + ".tmp")
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.writelines(lines[-FAILOVER_MAX_RECORDS:])
+                os.replace(tmp, FAILOVER_LOG_FILE)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _load_failover_events() -> List[dict]:
+        events = []
+        try:
+            with open(FAILOVER_LOG_FILE, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return sorted(events, key=lambda e: e.get("ts", 0))
+
+    def _restore_breakers(self):
+        """守护进程重启时按事件日志恢复未恢复的熔断状态，避免重启后立即把规则切回异常节点"""
+        last_state = {}
+        # 降级起点是本次断开的第一条 open 事件，半开试探失败后的再次断开不重新计时
+        degraded_since: Dict[str, float] = {}
+        for event in self._load_failover_events():
+            endpoint, state = event.get("endpoint", ""), event.get("state")
+            if state in (CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN, CircuitBreaker.CLOSED):
+                last_state[endpoint] = event
+                if state == CircuitBreaker.CLOSED:
+                    degraded_since.pop(endpoint, None)
+                else:
+                    degraded_since.setdefault(endpoint, event.get("ts", time.time()))
+        for endpoint, event in last_state.items():
+            if endpoint in self.worker_endpoints and event["state"] != CircuitBreaker.CLOSED:
+                breaker = self._breaker(endpoint)
+                breaker.state = CircuitBreaker.OPEN
+                breaker.opened_at = time.time()
+                breaker.degraded_since = degraded_since[endpoint]
+                breaker.reason = event.get("reason", "")
+
+    @classmethod
+    def _failover_summary(cls, window: float) -> Dict[str, dict]:
+        """按事件日志统计窗口内各节点的熔断次数与降级时长（秒）"""
+        now = time.time()
+        since = now - window
+        summary: Dict[str, dict] = {}
+        degraded_since: Dict[str, float] = {}
+        for event in cls._load_failover_events():
+            endpoint, state, ts = event.get("endpoint", ""), event.get("state"), event.get("ts", 0)
+            st = summary.setdefault(endpoint, {"trips": 0, "degraded_seconds": 0.0})
+            if state == CircuitBreaker.OPEN and endpoint not in degraded_since:
+                degraded_since[endpoint] = ts
+                if ts >= since:
+                    st["trips"] += 1
+            elif state == CircuitBreaker.CLOSED and endpoint in degraded_since:
+                start = degraded_since.pop(endpoint)
+                st["degraded_seconds"] += max(0.0, ts - max(start, since))
+        for endpoint, start in degraded_since.items():
+            summary[endpoint]["degraded_seconds"] += now - max(start, since)
+        return {ep: st for ep, st in summary.items() if st["trips"] or st["degraded_seconds"]}
+
+    def _prometheus_metrics(self) -> str:
+        """生成 /metrics 内容：分阶段测速耗时、吞吐、节点健康度与规则应用次数"""
         with self._thread_lock:
-            speed = self._current_speed
-            delay = self._current_delay
-        # 加速状态
-        accelerate_status = "已启用" if self.worker_domain else "未配置"
-        auto_start_status = "自启已开" if self.auto_start_enabled else "自启已关"
-        # 状态栏内容
-        status_content = f"[加速状态: {accelerate_status}] | [实时速率: {speed}] | [节点延迟: {delay}] | [{auto_start_status}]"
-        # 终端宽度适配，超出截断
+            results = list(self._last_probe_results)
+        stats = self.endpoint_pool.stats
+        endpoints = list(self.worker_endpoints)
+
+        def up(endpoint):
+            last = self.metric_store.last(endpoint, "fail", 1)
+            return 1 if last and not last[0][1] else 0
+
+        git_endpoints = sorted({ep for ep, metric in self.metric_store.keys() if metric == "git_bps"})
+        broker_state = self.probe_broker.read()
+        families = [
+            ("cfproxy_probe_phase_seconds", "gauge", "Latest probe duration by phase",
+             [({"endpoint": r.endpoint, "route": r.route, "phase": phase}, getattr(r, phase) / 1000)
+              for r in results if r.ok for phase in ProbeResult.PHASES]),
+            ("cfproxy_probe_success", "gauge", "Whether the latest probe of a route succeeded",
+             [({"endpoint": r.endpoint, "route": r.route}, 1 if r.ok else 0) for r in results]),
+            ("cfproxy_endpoint_up", "gauge", "Whether the latest probe of the endpoint succeeded",
+             [({"endpoint": ep}, up(ep)) for ep in endpoints]),
+            ("cfproxy_endpoint_active", "gauge", "Endpoint currently used by git rules",
+             [({"endpoint": ep}, 1 if ep == self.worker_domain else 0) for ep in endpoints]),
+            ("cfproxy_endpoint_consecutive_failures", "gauge", "Consecutive failed probes",
+             [({"endpoint": ep}, stats[ep]["fails"]) for ep in endpoints]),
+            ("cfproxy_endpoint_latency_seconds", "gauge", "EWMA of TCP connect latency",
+             [({"endpoint": ep}, stats[ep]["delay"] / 1000) for ep in endpoints if stats[ep]["delay"] is not None]),
+            ("cfproxy_endpoint_bandwidth_bytes_per_second", "gauge", "EWMA of measured bandwidth",
+             [({"endpoint": ep}, stats[ep]["speed"]) for ep in endpoints if stats[ep]["speed"]]),
+            ("cfproxy_endpoint_score_seconds", "gauge", "Ranking score (estimated seconds per reference transfer)",
+             [({"endpoint": ep}, self.endpoint_pool.score(ep, stats[ep])) for ep in endpoints]),
+            ("cfproxy_git_throughput_bytes_per_second", "gauge", "EWMA of real git transfer throughput",
+             [({"endpoint": ep}, self.metric_store.ewma(ep, "git_bps", seconds=TELEMETRY_WINDOW) or 0)
+              for ep in git_endpoints]),
+            ("cfproxy_route_proxied", "gauge", "Whether a host is routed through the proxy",
+             [({"host": host}, 1 if self._route_endpoint(host) else 0) for host in self.routes]),
+            ("cfproxy_rule_apply_total", "counter", "Git rule sync attempts by result",
+             [({"result": result}, count) for result, count in self._rule_apply_counts.items()]),
+            ("cfproxy_circuit_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+             [({"endpoint": ep}, {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}[b.state])
+              for ep, b in self.breakers.items()]),
+            ("cfproxy_circuit_trips_total", "counter", "Times the circuit breaker opened",
+             [({"endpoint": ep}, b.trips) for ep, b in self.breakers.items()]),
+            ("cfproxy_endpoint_degraded_seconds_total", "counter", "Time spent with the circuit breaker not closed",
+             [({"endpoint": ep}, b.degraded_total()) for ep, b in self.breakers.items()]),
+            ("cfproxy_endpoint_switches_total", "counter", "Active endpoint changes", [({}, self._endpoint_switches)]),
+            ("cfproxy_daemon_cycles_total", "counter", "Completed probe cycles", [({}, self._daemon_cycles)]),
+            ("cfproxy_probe_requests_today", "gauge", "Probe requests sent through workers today",
+             [({}, broker_state.get("requests", 0))]),
+            ("cfproxy_probe_budget_remaining", "gauge", "Remaining daily probe request budget",
+             [({}, self.probe_broker.remaining(broker_state))]),
+            ("cfproxy_probe_sessions", "gauge", "Interactive sessions subscribed to the probe broker",
+             [({}, ProbeBroker.active_sessions(broker_state))]),
+        ]
+        return PrometheusExporter.render(families)
+
+    def run_daemon(self, listen: str = DAEMON_LISTEN, interval: float = DAEMON_INTERVAL) -> int:
+        """守护进程模式：无交互常驻运行，周期测速并保持Git规则同步，提供 /metrics"""
+        if not shutil.which("git"):
+            self._log("[错误] 未找到Git！请先安装Git并添加到系统环境变量（PATH）")
+            return 1
+        if not self.worker_endpoints:
+            self._log("[错误] 尚未配置Worker节点，请先运行交互菜单完成配置")
+            return 1
+        host, _, port = listen.rpartition(":")
         try:
-            terminal_width = os.get_terminal_size().columns
+            exporter = PrometheusExporter(self._prometheus_metrics, host.strip("[]") or "127.0.0.1", int(port))
+        except (OSError, ValueError) as e:
+            self._log(f"[错误] /metrics 监听 {listen} 失败: {e}")
+            return 1
+        exporter.start()
+        self._start_trace2_socket()
+        self._log(f"[信息] 守护进程已启动，节点 {len(self.worker_endpoints)} 个，"
+                  f"测速周期 {interval:.0f} 秒，指标地址 http://{listen}/metrics")
+
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+        # 开机时先按上次保存的排名与熔断状态立即同步规则，再进入测速循环
+        self._restore_breakers()
+        self.worker_domain = self._select_daemon_endpoint() or self.endpoint_pool.best()
+        self._apply_rules(verbose=False)
+        while not stop.is_set():
+            try:
+                self._daemon_cycle()
+            except Exception as e:
+                self._log(f"[警告] 本轮测速失败: {e}")
+            # 有节点处于异常/熔断状态时加快测速，缩短故障切换与恢复耗时；
+            # 否则按共享测速代理的自适应间隔：有终端会话订阅时不慢于 interval，无人订阅且结果稳定时进一步放缓
+            unsettled = any(b.failures or not b.allows for b in self.breakers.values())
+            state = self.probe_broker.read()
+            if unsettled:
+                wait = min(interval, BREAKER_PROBE_INTERVAL)
+            elif ProbeBroker.active_sessions(state):
+                wait = max(min(interval, state["interval"]), BREAKER_PROBE_INTERVAL)
+            else:
+                wait = max(interval, state["interval"])
+            stop.wait(wait)
+
+        self._log("[信息] 守护进程退出")
+        self.probe_broker.release()
+        self._trace2_stop_flag.set()
+        exporter.stop()
+        self.metric_store.close()
+        return 0
+
+    def _sync_sizes(self, entries: List[dict], direct: bool = False):
+        """补全各仓库的预计大小：清单 size → 上次同步记录 → GitHub API（经节点，失败则记为0排在最后）"""
+        try:
+            with open(SYNC_HISTORY_FILE, "r", encoding="utf-8") as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            history = {}
+        for entry in entries:
+            entry["size"] = entry["size"] or history.get(entry["url"], 0)
+        unknown = [e for e in entries if not e["size"] and e["url"].startswith("https://github.com/")]
+        if unknown:
+            with futures.ThreadPoolExecutor(max_workers=min(len(unknown), SYNC_JOBS)) as executor:
+                sizes = executor.map(lambda e: self._github_repo_size(e["url"], direct), unknown)
+                for entry, size in zip(unknown, sizes):
+                    entry["size"] = size
+        return history
+
+    def _github_repo_size(self, url: str, direct: bool = False) -> int:
+        """经节点查询 GitHub API 给出的仓库大小（字节），失败时为0；使用 GITHUB_TOKEN/GH_TOKEN 提高限额"""
+        repo = url[len("https://github.com/"):-len(".git")]
+        api_url = f"https://api.github.com/repos/{repo}"
+        headers = {"User-Agent": "github-cf-proxy", "Accept": "application/vnd.github+json"}
+        token = os.environ.get("GITHUB_TOKEN") or os.environ.get("GH_TOKEN")
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        try:
+            request = urllib.request.Request(api_url if direct else self._proxied_url(api_url), headers=headers)
+            with urllib.request.urlopen(request, timeout=TEST_TIMEOUT) as response:
+                return int(json.load(response).get("size", 0)) * 1024
         except Exception:
-            terminal_width = 80
-        if len(status_content) > terminal_width - 2:
-            status_content = status_content[:terminal_width - 5] + "..."
-        # ANSI渲染：行首清除+状态栏+固定行，不影响菜单内容
-        print(f"\r\033[K\033[38;5;47m{status_content}\033[0m\n\033[F", end="", flush=True)
+            return 0
 
-    def toggle_status_bar(self):
-        """切换状态栏显示/隐藏，主菜单入口"""
-        self.status_bar_enabled = not self.status_bar_enabled
-        self._save_config()
-        if self.status_bar_enabled:
-            self._init_terminal()
-            self._start_speed_monitor()
-            print("[√] 实时网速状态栏已开启，将在主菜单常驻显示")
+    def _sync_monitor(self, endpoints: List[str], baseline: Dict[str, int], limiter: AdaptiveLimiter,
+                      stop: threading.Event, verbose: bool):
+        """同步期间周期复测节点：驱动熔断器（断开的节点不再分配任务），首选节点失败或握手延迟劣化时并发减半"""
+        while not stop.wait(SYNC_PROBE_INTERVAL):
+            if self.probe_broker.remaining() <= 0:
+                continue
+            results = self._probe_endpoints(endpoints, with_direct=True)
+            self._update_breakers()
+            live = [ep for ep in endpoints if self._breaker(ep).allows]
+            if not live:
+                continue
+            delay = results[live[0]][0]
+            base = baseline.get(live[0], -1)
+            if (delay < 0 or (base > 0 and delay > base * BREAKER_DEGRADE_RATIO)) and limiter.decrease() and verbose:
+                state = "失败" if delay < 0 else f"{delay} ms（基线 {base} ms）"
+                print(f"  [信息] 节点 {live[0]} 测速{state}，并发上限降至 {limiter.allowed}")
+
+    def sync(self, manifest: str, jobs: int = SYNC_JOBS, retries: int = SYNC_RETRIES, direct: bool = False,
+             as_json: bool = False) -> int:
+        """按清单并发 clone/fetch 多个仓库，输出各仓库与整体吞吐；返回退出码（有仓库失败时为1）"""
+        if not shutil.which("git"):
+            print("[错误] 未找到Git！请先安装Git并添加到系统环境变量（PATH）")
+            return 1
+        try:
+            entries = RepoSync.load_manifest(Path(manifest))
+        except (OSError, ValueError) as e:
+            print(f"[错误] 读取清单失败: {e}")
+            return 1
+        if not entries:
+            print("[错误] 清单中没有仓库")
+            return 1
+        verbose = not as_json
+
+        # 候选节点：github.com 当前路由的节点优先，其余熔断器闭合的节点按排名作为重试时的备用
+        primary = "" if direct else self._route_endpoint("github.com")
+        endpoints = [primary] + [ep for ep in self.endpoint_pool.ranking() if ep != primary] if primary else []
+        proxied = {h: r for h, r in self.routes.items() if primary and self._route_endpoint(h)}
+        baseline: Dict[str, int] = {}
+        if endpoints and self.probe_broker.remaining() > 0:
+            results = self._probe_endpoints(endpoints, with_direct=True)
+            self._update_breakers()
+            baseline = {ep: delay for ep, (delay, _) in results.items() if delay >= 0}
+            # 本轮测速失败的节点排到后面
+            endpoints.sort(key=lambda ep: ep not in baseline)
+        jobs = max(1, jobs)
+        # 经节点时从一半并发起步逐步增加；直连时不受 Worker 限制
+        initial = max(1, jobs // 2) if endpoints else jobs
+        limiter = AdaptiveLimiter(jobs, initial)
+
+        history = self._sync_sizes(entries, direct)
+
+        def progress(r):
+            if not verbose:
+                return
+            if r["ok"]:
+                retry = f"，重试 {r['attempts'] - 1} 次" if r["attempts"] > 1 else ""
+                speed = _format_speed(r["bytes"] / r["seconds"]) if r["seconds"] > 0 else "--"
+                print(f"  [√] {r['name']:<36} {r['op']:<6} {r['bytes'] / 1024 / 1024:8.1f} MB  {r['seconds']:6.1f} s  "
+                      f"{speed:<12} {r['endpoint']}{retry}")
+            else:
+                print(f"  [×] {r['name']:<36} {r['op']:<6} 失败（{r['attempts']} 次）: {r['error']}")
+
+        if verbose:
+            route = ", ".join(endpoints) if endpoints else "直连"
+            print(f"[信息] 同步 {len(entries)} 个仓库，并发上限 {initial}→{jobs}，节点: {route}")
+        runner = RepoSync(entries, proxied, lambda: [ep for ep in endpoints if self._breaker(ep).allows], limiter,
+                          retries, progress=progress, strip_hosts=list(self.routes),
+                          references=self.mirror_cache.reference_for)
+        stop = threading.Event()
+        monitor = threading.Thread(target=self._sync_monitor, args=(endpoints, baseline, limiter, stop, verbose),
+                                   daemon=True)
+        if endpoints:
+            monitor.start()
+        start = time.perf_counter()
+        try:
+            results = runner.run()
+        finally:
+            stop.set()
+        total = RepoSync.summarize(results, time.perf_counter() - start)
+
+        for r in results:
+            if r["ok"]:
+                history[r["url"]] = r["size"]
+                if r["bytes"] and r["seconds"] > 0 and not r["mirror"]:
+                    self.metric_store.append(r["endpoint"], "sync_bps", r["bytes"] / r["seconds"])
+        try:
+            with open(SYNC_HISTORY_FILE, "w", encoding="utf-8") as f:
+                json.dump(history, f, indent=1)
+        except OSError:
+            pass
+
+        concurrency = {"initial": initial, "final": limiter.allowed, "max": jobs, "peak": limiter.peak,
+                       "decreases": limiter.decreases}
+        if as_json:
+            print(json.dumps({"endpoints": endpoints, "concurrency": concurrency, "total": total,
+                              "results": results}, ensure_ascii=False, indent=2))
         else:
-            self._stop_speed_monitor()
-            self._reset_terminal()
-            print("[√] 实时网速状态栏已隐藏")
+            print(f"\n[信息] 完成 {total['ok']}/{total['repos']} 个仓库，失败 {total['failed']}，重试 {total['retries']} 次")
+            print(f"  传输 {total['bytes'] / 1024 / 1024:.1f} MB，耗时 {total['seconds']:.1f} 秒，"
+                  f"整体吞吐 {_format_speed(total['bps'])}")
+            print(f"  并发上限 {initial} → {limiter.allowed}（最高并发 {limiter.peak}，减半 {limiter.decreases} 次）")
+        return 1 if total["failed"] else 0
 
-    def _check_git(self):
-        """检查Git是否安装"""
+    def clone(self, repo: str, directory: str = "", intent: str = "build", strategy: str = "auto", ref: str = "",
+              sparse: Optional[List[str]] = None, dry_run: bool = False, as_json: bool = False) -> int:
+        """按仓库大小、用途与实测吞吐选择 clone 策略并执行，记录选择与实际耗时；返回 git 退出码"""
         if not shutil.which("git"):
             print("[错误] 未找到Git！请先安装Git并添加到系统环境变量（PATH）")
-            sys.exit(1)
-        print("[√] Git环境检测正常")
+            return 1
+        try:
+            url = MirrorCache.normalize(repo)
+        except ValueError:
+            # 非 github.com 地址按原样克隆，只是没有 API 大小信息
+            url = repo
+        name = url.rstrip("/").rsplit("/", 1)[-1]
+        target = Path(directory or (name[:-len(".git")] if name.endswith(".git") else name))
+        if not dry_run and target.exists() and (not target.is_dir() or any(target.iterdir())):
+            print(f"[错误] 目标目录已存在且非空: {target}")
+            return 1
+        verbose = not as_json
+        planner = ClonePlanner()
+        endpoint = self._route_endpoint("github.com") or DIRECT_ENDPOINT
 
-    def _set_git_credential_helper(self):
-        """配置Git凭证助手（自动保存用户名/Token）"""
-        helpers = {
-            "windows": "manager-core",
-            "darwin": "osxkeychain",
-            "linux": "store"
-        }
-        helper = helpers.get(OS_TYPE, "store")
-        
+        if verbose:
+            print(f"[信息] 正在探测 {url}（经 {endpoint if endpoint != DIRECT_ENDPOINT else '直连'}）...")
+        probe = ClonePlanner.probe(url)
+        if not probe["ok"]:
+            print(f"[错误] ls-remote 失败: {probe['error']}")
+            return 1
+        size = 0
+        if url.startswith("https://github.com/"):
+            size = self._github_repo_size(url)
+            if not size:
+                try:
+                    with open(SYNC_HISTORY_FILE, "r", encoding="utf-8") as f:
+                        size = json.load(f).get(url, 0)
+                except (OSError, ValueError):
+                    pass
+        bps, bps_source = planner.throughput(endpoint), "clone历史"
+        if not bps:
+            bps, bps_source = self.metric_store.ewma(endpoint, "git_bps", seconds=TELEMETRY_WINDOW), "Git传输统计"
+        if not bps and endpoint != DIRECT_ENDPOINT:
+            bps, bps_source = self.endpoint_pool.stat(endpoint)["speed"], "带宽测速"
+        if not bps:
+            bps, bps_source = CLONE_DEFAULT_BPS, "默认值"
+        plan = planner.plan(url, intent, size, bps, probe, sparse=bool(sparse))
+        if strategy != "auto":
+            plan.update(strategy=strategy, reason="手动指定")
+        chosen = plan["strategy"]
+
+        if verbose:
+            print(f"  ls-remote {probe['seconds'] * 1000:.0f} ms，默认分支 {probe.get('head') or '-'}，"
+                  f"协议 {'v2' if probe.get('v2') else 'v0'}，部分克隆 {'支持' if probe.get('filter') else '不支持'}")
+            print(f"  仓库大小 {size / 1024 / 1024:.1f} MB，吞吐 {_format_speed(bps)}（{bps_source}），用途 {intent}")
+            for name, est in plan["estimates"].items():
+                seconds = f"{est['seconds']:.1f} s" if est["seconds"] is not None else "--"
+                mark = "  ← 选用" if name == chosen else ""
+                print(f"    {name:<10} 预计接收 {est['bytes'] / 1024 / 1024:8.1f} MB（{est['source']}）  预计 {seconds}{mark}")
+            print(f"[信息] 策略: {chosen}（{plan['reason']}）")
+        if dry_run:
+            if as_json:
+                print(json.dumps({"url": url, "probe": probe, "size": size, "bps": bps, **plan}, ensure_ascii=False, indent=2))
+            return 0
+
+        depth = 1 if intent == "ci" and chosen == "sparse" else 0
+        reference = self.mirror_cache.reference_for(url)
+        if reference and verbose:
+            print(f"[信息] 复用本地镜像中的对象: {reference}（引用与缺少的对象仍经节点获取）")
+        code, seconds, nbytes = ClonePlanner.clone(url, target, chosen, ref, sparse, depth, quiet=as_json,
+                                                   reference=reference)
+        estimate = plan["estimates"].get(chosen, {}).get("seconds")
+        # mirror：对象取自本地镜像，不计入预估与吞吐历史
+        record = {"ts": round(time.time()), "url": url, "intent": intent, "strategy": chosen, "auto": strategy == "auto",
+                  "endpoint": endpoint, "size": size, "bytes": nbytes, "seconds": round(seconds, 2),
+                  "bps": round(nbytes / seconds, 1) if seconds > 0 and nbytes else 0, "estimate_s": estimate,
+                  "probe_ms": round(probe["seconds"] * 1000), "code": code, "mirror": bool(reference)}
+        planner.record(record)
+        if code == 0 and nbytes and not reference:
+            self.metric_store.append(endpoint, "clone_bps", record["bps"])
+        if as_json:
+            print(json.dumps({"url": url, "probe": probe, **plan, "result": record}, ensure_ascii=False, indent=2))
+        elif code == 0:
+            predicted = f"（预计 {estimate:.1f} 秒）" if estimate is not None else ""
+            print(f"[√] 已克隆到 {target}：{chosen}，接收 {nbytes / 1024 / 1024:.1f} MB，耗时 {seconds:.1f} 秒{predicted}，"
+                  f"吞吐 {_format_speed(record['bps'])}")
+        else:
+            print(f"[×] clone 失败（退出码 {code}）")
+        return code
+
+    def update_submodules(self, path: str = ".", jobs: int = SYNC_JOBS, depth: int = 0) -> int:
+        """递归初始化/更新子模块，git 按 --jobs 并行拉取；返回 git 退出码
+
+        github.com 的 HTTPS 与 SSH 形式地址只对本次命令（-c，经 GIT_CONFIG_PARAMETERS 传给子进程）
+        改写到节点，未启用 SSH 改写时同样经节点拉取，且不修改全局配置。
+        """
+        if not shutil.which("git"):
+            print("[错误] 未找到Git！请先安装Git并添加到系统环境变量（PATH）")
+            return 1
+        result = subprocess.run(["git", "-C", path, "rev-parse", "--show-toplevel"],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"[错误] 不是Git仓库: {path}")
+            return 1
+        top = result.stdout.strip()
+        result = subprocess.run(["git", "-C", top, "config", "-f", ".gitmodules", "--get-regexp", r"^submodule\..*\.url$"],
+                                capture_output=True, text=True)
+        urls = [line.split(None, 1)[1] for line in result.stdout.splitlines() if " " in line]
+        if not urls:
+            print(f"[信息] {top} 没有子模块")
+            return 0
+
+        base = self._github_proxy_base()
+        options = ["-c", f"submodule.fetchJobs={jobs}"]
+        if base:
+            for prefix in ("https://github.com/",) + GITHUB_SSH_PREFIXES:
+                options += ["-c", f"url.{base}.insteadOf={prefix}"]
+        ssh_count = sum(url.startswith(GITHUB_SSH_PREFIXES) for url in urls)
+        print(f"[信息] 正在并行更新 {len(urls)} 个子模块（其中 SSH 形式 {ssh_count} 个，并发 {jobs}，"
+              f"经 {base or '直连'}）...")
+        command = ["git", *options, "-C", top, "submodule", "update", "--init", "--recursive", "--jobs", str(jobs)]
+        if depth:
+            command += ["--depth", str(depth)]
+        started = time.time()
         try:
-            subprocess.run(
-                ["git", "config", "--global", "credential.helper", helper],
-                check=True, capture_output=True
-            )
-            print(f"[√] Git凭证助手已配置: {helper}")
-            return True
-        except Exception as e:
-            print(f"[警告] 凭证助手配置失败: {e}")
-            return False
+            code = subprocess.run(command).returncode
+        except KeyboardInterrupt:
+            print("\n[信息] 已中断，重新运行相同命令即可继续")
+            return 130
+        seconds = time.time() - started
+        if code == 0:
+            print(f"[√] 子模块已更新，耗时 {seconds:.1f} 秒")
+        else:
+            print(f"[×] 子模块更新失败（退出码 {code}）")
+        return code
 
-    def set_accelerate(self):
-        """配置Cloudflare加速规则"""
-        self._check_git()
-        # 暂停状态栏刷新，避免操作时界面乱跳
-        self._stop_speed_monitor()
-        
-        # 首次运行或重置后，让用户输入域名
-        if not self.worker_domain:
-            self.worker_domain = input("请输入你的Cloudflare Worker自定义域（如 https://github-proxy.example.com）: ").strip()
-            if not self.worker_domain.startswith("http"):
-                self.worker_domain = "https://" + self.worker_domain
-            self.worker_domain = self.worker_domain.rstrip("/")
-            self._save_config()
+    def _proxied_url(self, url: str) -> str:
+        """把路由表内主机的 GitHub 地址改写为经当前节点的地址（未配置节点时原样返回）"""
+        parsed = urllib.parse.urlparse(url)
+        if parsed.scheme != "https" or parsed.hostname not in self.routes or not self.worker_domain:
+            return url
+        rest = url.split(parsed.netloc, 1)[1].lstrip("/")
+        return f"{self.worker_domain}{self.routes[parsed.hostname]['prefix']}{rest}"
 
-        # 定义加速规则
-        rules = [
-            ("https://github.com/", f"{self.worker_domain}/"),
-            ("https://raw.githubusercontent.com/", f"{self.worker_domain}/raw/"),
-            ("https://gist.githubusercontent.com/", f"{self.worker_domain}/gist/"),
-            ("https://gist.github.com/", f"{self.worker_domain}/gist-web/")
-        ]
+    def download(self, url: str, output: str = "", connections: int = DOWNLOAD_CONNECTIONS, checksum: str = "",
+                 direct: bool = False) -> int:
+        """经代理节点分段并行下载，返回退出码"""
+        output_path = Path(output or urllib.parse.unquote(urllib.parse.urlparse(url).path.rstrip("/").split("/")[-1])
+                           or "download")
+        rewrite = (lambda u: u) if direct else self._proxied_url
+        source = rewrite(url)
 
-        print(f"\n[信息] 开始配置加速（代理域: {self.worker_domain}）")
-        for original, proxy in rules:
-            # 先清除旧规则避免重复
-            subprocess.run(
-                ["git", "config", "--global", "--unset-all", f"url.{proxy}.insteadOf"],
-                capture_output=True
-            )
-            # 添加新规则
-            try:
-                subprocess.run(
-                    ["git", "config", "--global", f"url.{proxy}.insteadOf", original],
-                    check=True, capture_output=True
-                )
-                print(f"  [√] {original} → {proxy}")
-            except Exception as e:
-                print(f"  [×] 配置失败: {original} - {e}")
-                return False
+        def progress(done, total):
+            percent = f"{done / total * 100:5.1f}%" if total else ""
+            print(f"\r\033[K  {percent} {done / 1024 / 1024:.1f} MB", end="", flush=True)
 
-        # 配置凭证助手
-        self._set_git_credential_helper()
-        print("\n[√] 加速配置完成！")
+        print(f"[信息] 下载: {source}")
+        downloader = SegmentedDownloader(source, output_path, connections, checksum, rewrite=rewrite,
+                                         progress=progress)
+        try:
+            result = downloader.run()
+        except KeyboardInterrupt:
+            print(f"\n[信息] 已中断，重新运行相同命令即可从断点继续（状态文件: {downloader.state_path}）")
+            return 130
+        except ValueError as e:
+            print(f"\n[×] {e}")
+            return 1
+        except (OSError, http.client.HTTPException) as e:
+            print(f"\n[×] 下载失败: {e}")
+            if downloader.ranged:
+                print("[信息] 已下载部分已保存，重新运行相同命令即可续传")
+            return 1
+        endpoint = self.worker_domain if source != url else DIRECT_ENDPOINT
+        if result["transferred"] and result["seconds"] > 0:
+            self.metric_store.append(endpoint, "download_bps", result["bps"])
+        mode = f"{result['segments']} 段 / {min(connections, result['segments'])} 连接" if result["ranged"] else "单连接（服务器不支持Range）"
+        print(f"\r\033[K[√] 已保存 {output_path}（{result['bytes'] / 1024 / 1024:.1f} MB，{result['seconds']:.1f} 秒，"
+              f"{_format_speed(result['bps'])}，{mode}{'，断点续传' if result['resumed'] else ''}"
+              f"{'，校验通过' if checksum else ''}）")
+        return 0
 
-        # 恢复状态栏刷新
-        if self.status_bar_enabled:
-            self._start_speed_monitor()
-        return True
+    def run_relay(self, listen: str = RELAY_LISTEN, concurrency: int = RELAY_CONCURRENCY, cert: str = "",
+                  key: str = "", upstreams: Optional[List[str]] = None, cache: bool = False, forward: str = "") -> int:
+        """前台运行自建中转，路由表与本机配置一致；forward 指定节点时只作为本地缓存层转发给该节点"""
+        host, _, port = listen.rpartition(":")
+        ssl_context = None
+        if cert and key:
+            ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            ssl_context.load_cert_chain(cert, key)
+        overrides = dict(item.split("=", 1) for item in (upstreams or []) if "=" in item)
+        content_cache = ContentCache(max_bytes=self.config.get("cache_max_bytes", CACHE_MAX_BYTES)) if cache else None
+        relay = AsyncRelay(self.routes, concurrency=concurrency, upstreams=overrides, ssl_context=ssl_context,
+                           forward=forward, cache=content_cache)
+        scheme = "https" if ssl_context else "http"
+        if forward:
+            self._log(f"[信息] 本地缓存层已启动: {scheme}://{listen} → {forward}，"
+                      f"用法与节点地址相同（如 {scheme}://{listen}/raw/owner/repo/<提交号>/文件）")
+        else:
+            self._log(f"[信息] 自建中转已启动: {scheme}://{listen}（并发上限 {concurrency}"
+                      f"{'，已启用本地缓存' if cache else ''}），可在「配置/更新加速规则」或节点池中填入该地址")
+        try:
+            asyncio.run(relay.serve(host.strip("[]") or "0.0.0.0", int(port)))
+        except KeyboardInterrupt:
+            pass
+        except (OSError, ValueError) as e:
+            self._log(f"[错误] 中转启动失败: {e}")
+            return 1
+        finally:
+            if content_cache:
+                content_cache.save(force=True)
+        if content_cache:
+            self._print_cache_summary(content_cache.summary())
+        return 0
+
+    def manage_cache(self, action: str, listen: str = CACHE_LISTEN, max_size: str = "", direct: bool = False,
+                     as_json: bool = False) -> int:
+        """本地内容缓存：serve 运行缓存层 / stats 查看命中率 / clear 清空"""
+        if max_size:
+            units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+            try:
+                size = max_size.strip().upper().rstrip("B")
+                self.config["cache_max_bytes"] = int(float(size[:-1]) * units[size[-1]]) if size[-1:] in units \
+                    else int(size)
+            except (ValueError, IndexError):
+                print(f"[错误] 无效的大小: {max_size}（示例: 2G、500M）")
+                return 1
+            self._save_config()
+        if action == "clear":
+            ContentCache().clear()
+            print(f"[√] 已清空本地内容缓存（{CACHE_DIR}）")
+            return 0
+        if action == "stats":
+            summary = ContentCache(max_bytes=self.config.get("cache_max_bytes", CACHE_MAX_BYTES)).summary()
+            if as_json:
+                print(json.dumps(summary, ensure_ascii=False, indent=2))
+            else:
+                self._print_cache_summary(summary)
+            return 0
+        if not direct and not self.worker_domain:
+            print("[错误] 请先配置加速规则，或使用 --direct 直接访问 GitHub")
+            return 1
+        return self.run_relay(listen, cache=True, forward="" if direct else self.worker_domain)
+
+    def _edge_maintain(self):
+        """后台维护优选IP：固定IP劣化时自动取消固定并重扫，到期定期重扫"""
+        now = time.time()
+        if self.edge_pinned_ip and now - self._edge_last_check >= EDGE_CHECK_INTERVAL:
+            self._edge_last_check = now
+            cost = EdgeIPScanner(_domain_host(self.worker_domain), []).measure(self.edge_pinned_ip)
+            if cost < 0 or (self.edge_pinned_delay and cost > self.edge_pinned_delay * EDGE_DEGRADE_RATIO):
+                self._unpin_edge_ip()
+                # 立即触发重扫
+                self._edge_last_scan = 0.0
+        if now - self._edge_last_scan >= EDGE_RESCAN_INTERVAL:
+            self._edge_scan_and_pin()
 
     def test_accelerate(self):
         """测试加速效果"""
@@ -304,10 +6561,32 @@ class GitHubCFProxy:
         except Exception as e:
             print(f"[×] 测试异常: {e}")
 
+        self._print_phase_breakdown()
+
         # 恢复状态栏刷新
         if self.status_bar_enabled:
             self._start_speed_monitor()
 
+    def _print_phase_breakdown(self):
+        """代理与直连各路由并发分阶段测速，定位慢在边缘/Worker/上游"""
+        print("\n[信息] 分阶段测速（代理 vs 直连，单位 ms）...")
+        results = self._probe_engine().run([self.worker_domain, DIRECT_ENDPOINT])
+        self._charge_probes(results)
+        direct = {r.route: r for r in results if r.endpoint == DIRECT_ENDPOINT}
+        print(f"  {'路由':<12}{'链路':<8}{'DNS':>8}{'TCP':>8}{'TLS':>8}{'首字节':>8}{'传输':>8}  结论")
+        for r in results:
+            if r.endpoint == DIRECT_ENDPOINT:
+                continue
+            for label, item in (("代理", r), ("直连", direct.get(r.route))):
+                if item is None:
+                    continue
+                if item.ok:
+                    phases = "".join(f"{getattr(item, phase):>8.0f}" for phase in ProbeResult.PHASES)
+                else:
+                    phases = f"{'失败: ' + (item.error or str(item.status)):>40}"
+                verdict = diagnose_probe(r, direct.get(r.route)) if item is r else ""
+                print(f"  {r.route:<12}{label:<8}{phases}  {verdict}")
+
     def _get_auto_start_path(self):
         """获取不同系统的自启路径"""
         if OS_TYPE == "windows":
@@ -329,9 +6608,9 @@ class GitHubCFProxy:
 
         try:
             if OS_TYPE == "windows":
-                # Windows: 创建BAT启动脚本
+                # Windows: 创建BAT启动脚本（最小化窗口常驻守护进程）
                 with open(auto_path, "w", encoding="gbk") as f:
-                    f.write(f'@echo off\npython "{SCRIPT_PATH}" --silent\n')
+                    f.write(f'@echo off\nstart "GitHub CF Proxy" /min python "{SCRIPT_PATH}" daemon\n')
             elif OS_TYPE == "darwin":
                 # macOS: 创建LaunchAgents plist
                 plist_content = f'''<?xml version="1.0" encoding="UTF-8"?>
@@ -344,12 +6623,16 @@ class GitHubCFProxy:
     <array>
         <string>{sys.executable}</string>
         <string>{SCRIPT_PATH}</string>
-        <string>--silent</string>
+        <string>daemon</string>
     </array>
     <key>RunAtLoad</key>
     <true/>
     <key>KeepAlive</key>
-    <false/>
+    <true/>
+    <key>StandardOutPath</key>
+    <string>{Path.home() / "Library/Logs/github-cf-proxy.log"}</string>
+    <key>StandardErrorPath</key>
+    <string>{Path.home() / "Library/Logs/github-cf-proxy.log"}</string>
 </dict>
 </plist>'''
                 with open(auto_path, "w", encoding="utf-8") as f:
@@ -359,12 +6642,15 @@ class GitHubCFProxy:
             elif OS_TYPE == "linux":
                 # Linux: 创建Systemd用户服务
                 service_content = f'''[Unit]
-Description=GitHub Cloudflare Proxy Auto Config
-After=network.target
+Description=GitHub Cloudflare Proxy Daemon
+After=network-online.target
+Wants=network-online.target
 
 [Service]
-Type=oneshot
-ExecStart={sys.executable} {SCRIPT_PATH} --silent
+Type=simple
+ExecStart={sys.executable} {SCRIPT_PATH} daemon
+Restart=on-failure
+RestartSec=30
 
 [Install]
 WantedBy=default.target'''
@@ -372,7 +6658,7 @@ WantedBy=default.target'''
                     f.write(service_content)
                 # 启用服务
                 subprocess.run(["systemctl", "--user", "daemon-reload"], capture_output=True)
-                subprocess.run(["systemctl", "--user", "enable", "github-cf-proxy.service"], capture_output=True)
+                subprocess.run(["systemctl", "--user", "enable", "--now", "github-cf-proxy.service"], capture_output=True)
             return True
         except Exception as e:
             print(f"[错误] 创建自启文件失败: {e}")
@@ -388,7 +6674,7 @@ WantedBy=default.target'''
             if OS_TYPE == "darwin" and auto_path.exists():
                 subprocess.run(["launchctl", "unload", "-w", str(auto_path)], capture_output=True)
             elif OS_TYPE == "linux" and auto_path.exists():
-                subprocess.run(["systemctl", "--user", "disable", "github-cf-proxy.service"], capture_output=True)
+                subprocess.run(["systemctl", "--user", "disable", "--now", "github-cf-proxy.service"], capture_output=True)
             
             if auto_path.exists():
                 auto_path.unlink()
@@ -423,36 +6709,70 @@ WantedBy=default.target'''
         if self.status_bar_enabled:
             self._start_speed_monitor()
 
-    def clean_rules(self):
-        """仅清理加速规则"""
+    def clean_rules(self) -> bool:
+        """仅清理加速规则，返回是否成功"""
         # 暂停状态栏刷新
         self._stop_speed_monitor()
         print("\n[信息] 正在清理加速规则...")
+        lfs_previous = dict(self.lfs_previous)
+        ok = True
         try:
-            result = subprocess.run(
-                ["git", "config", "--global", "--get-regexp", "url\\..*\\.insteadOf"],
-                capture_output=True, text=True
-            )
-            if result.stdout:
-                for line in result.stdout.splitlines():
-                    key = line.split()[0]
-                    subprocess.run(["git", "config", "--global", "--unset", key], check=True)
+            cfg = GitConfigFile()
+            keys = list(dict.fromkeys(key for key, _ in cfg.get_regexp(r"^url\..*\.insteadof$")))
+            if keys:
+                for key in keys:
+                    cfg.unset_all(key)
                     print(f"  [√] 已清除: {key}")
             else:
                 print("  [信息] 未找到加速规则")
+            # 同时移除优选IP固定解析（保留记录，重新配置加速时恢复）
+            for endpoint in self.worker_endpoints:
+                self._unpin_edge_ip(endpoint, keep_state=True, cfg=cfg)
+            self._apply_trace2_target(cfg, enabled=False)
+            self._remove_mirror_rules(cfg)
+            self._apply_lfs_rules(cfg, enabled=False)
+            self._apply_ssh_rules(cfg, enabled=False)
+            cfg.commit()
+            if self.lfs_previous != lfs_previous:
+                self._save_config()
+            AppliedState().clear()
         except Exception as e:
+            self.lfs_previous = lfs_previous
+            ok = False
             print(f"[错误] 清理失败: {e}")
+        if self.auto_start_enabled:
+            print("[提示] 开机自启的守护进程会在下一轮重新写入规则，如需彻底取消加速请同时禁用自启")
 
         # 恢复状态栏刷新
         if self.status_bar_enabled:
             self._start_speed_monitor()
+        return ok
+
+    def rollback_git_config(self, assume_yes: bool = False):
+        """用本工具首次修改前的备份恢复全局Git配置（之后的所有改动都会丢失，需确认）"""
+        try:
+            cfg = GitConfigFile()
+            if not cfg.backup_path.exists():
+                print("[信息] 未找到Git配置备份")
+                return
+            # 备份保留原文件的修改时间，即本工具首次修改前该配置最后一次保存的时间
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(cfg.backup_path.stat().st_mtime))
+            print(f"\n[警告] 将用备份 {cfg.backup_path} 覆盖当前Git配置：这是本工具首次修改前的配置"
+                  f"（最后修改于 {when}），之后对全局Git配置的所有改动（含其他程序的修改）都会丢失！")
+            confirm = "y" if assume_yes else input("确认继续? (y/n): ").strip().lower()
+            if confirm != "y":
+                return
+            if cfg.rollback():
+                print(f"[√] 已从备份恢复Git配置: {cfg.backup_path}")
+        except Exception as e:
+            print(f"[错误] 恢复Git配置失败: {e}")
 
-    def clean_credentials(self):
+    def clean_credentials(self, assume_yes: bool = False):
         """仅清理Git凭证"""
         # 暂停状态栏刷新
         self._stop_speed_monitor()
         print("\n[警告] 此操作将清除Git保存的GitHub用户名/Token！")
-        confirm = input("确认继续? (y/n): ").strip().lower()
+        confirm = "y" if assume_yes else input("确认继续? (y/n): ").strip().lower()
         if confirm != "y":
             # 恢复状态栏刷新
             if self.status_bar_enabled:
@@ -461,7 +6781,9 @@ WantedBy=default.target'''
 
         try:
             # 清除凭证助手配置
-            subprocess.run(["git", "config", "--global", "--unset", "credential.helper"], capture_output=True)
+            cfg = GitConfigFile()
+            cfg.unset_all("credential.helper")
+            cfg.commit()
             # 不同系统的额外清理
             if OS_TYPE == "windows":
                 print("[信息] Windows请手动打开「凭据管理器」→「Windows凭据」删除GitHub相关条目")
@@ -494,6 +6816,9 @@ WantedBy=default.target'''
         if CONFIG_FILE.exists():
             CONFIG_FILE.unlink()
             self.worker_domain = ""
+            self.worker_endpoints.clear()
+            self.routes = json.loads(json.dumps(DEFAULT_ROUTES))
+            self.route_decisions = {}
             self.auto_start_enabled = False
             self.status_bar_enabled = False
             print("[√] 脚本配置已清理")
@@ -504,12 +6829,12 @@ WantedBy=default.target'''
         if self.status_bar_enabled:
             self._start_speed_monitor()
 
-    def reset_all(self):
+    def reset_all(self, assume_yes: bool = False):
         """一键重置所有"""
         # 暂停状态栏刷新
         self._stop_speed_monitor()
         print("\n[警告] 此操作将重置所有配置（加速规则、Git凭证、脚本配置、自启、状态栏）！")
-        confirm = input("确认继续? (y/n): ").strip().lower()
+        confirm = "y" if assume_yes else input("确认继续? (y/n): ").strip().lower()
         if confirm != "y":
             # 恢复状态栏刷新
             if self.status_bar_enabled:
@@ -518,16 +6843,36 @@ WantedBy=default.target'''
 
         print("\n[信息] 开始重置...")
         self.clean_rules()
+        if self.perf_profile or self.perf_profile_previous:
+            self.set_perf_profile("")
+        self.lfs_enabled, self.lfs_transfers = False, 0
+        self.ssh_rewrite_enabled = False
         self._remove_auto_start_file()
-        self.clean_credentials()
+        self.clean_credentials(assume_yes)
         if CONFIG_FILE.exists():
             CONFIG_FILE.unlink()
+        self.metric_store.close()
+        gitconfig = _global_gitconfig_path()
+        for path in (METRICS_FILE, FAILOVER_LOG_FILE, BROKER_STATE_FILE, SYNC_HISTORY_FILE, CLONE_HISTORY_FILE,
+                     APPLY_STATE_FILE, gitconfig.with_name(gitconfig.name + GIT_CONFIG_BACKUP_SUFFIX)):
+            if path.exists():
+                path.unlink()
+        for path in (MIRROR_DIR, CACHE_DIR):
+            shutil.rmtree(str(path), ignore_errors=True)
+        self.metric_store = MetricStore()
+        self.endpoint_pool.store = self.metric_store
         # 重置所有状态
         self.worker_domain = ""
+        self.worker_endpoints.clear()
+        self.edge_pin_enabled = False
+        self.edge_pinned_ip = ""
+        self.routes = json.loads(json.dumps(DEFAULT_ROUTES))
+        self.route_decisions = {}
         self.auto_start_enabled = False
         self.status_bar_enabled = False
-        # 重置终端
-        self._reset_terminal()
+        # 重置终端（reset 子命令未初始化终端，无需输出控制序列）
+        if self._terminal_inited:
+            self._reset_terminal()
         print("\n[√] 所有配置已重置，恢复初始状态")
 
     def show_menu(self):
@@ -545,7 +6890,11 @@ WantedBy=default.target'''
         print("  4. 清理选项")
         print("  5. 一键重置所有")
         print("  6. 显示/隐藏实时网速状态栏")
-        print("  7. 退出")
+        print("  7. 管理代理节点池")
+        print("  8. 管理主机路由表")
+        print("  9. Git传输统计")
+        print("  10. Git传输性能方案")
+        print("  11. 退出")
         print("="*60)
 
     def clean_menu(self):
@@ -557,7 +6906,8 @@ WantedBy=default.target'''
             print("1. 仅清理加速规则")
             print("2. 仅清理Git凭证")
             print("3. 仅清理脚本配置")
-            print("4. 返回主菜单")
+            print("4. 恢复本工具首次修改前的Git配置")
+            print("5. 返回主菜单")
             choice = input("请选择: ").strip()
 
             if choice == "1":
@@ -567,6 +6917,8 @@ WantedBy=default.target'''
             elif choice == "3":
                 self.clean_config()
             elif choice == "4":
+                self.rollback_git_config()
+            elif choice == "5":
                 break
             else:
                 print("[错误] 无效选项")
@@ -577,10 +6929,17 @@ WantedBy=default.target'''
 
     def run(self):
         """主运行逻辑"""
+        # 子命令模式（非交互）
+        if len(sys.argv) > 1 and (not sys.argv[1].startswith("-") or sys.argv[1] in ("-h", "--help")):
+            with CallProfiler.span(sys.argv[1]):
+                sys.exit(self.run_command(sys.argv[1:]))
+
         # 静默模式（用于开机自启，不启动状态栏和交互）
         if "--silent" in sys.argv:
-            if self.worker_domain:
-                self.set_accelerate()
+            if self.worker_endpoints:
+                # 开机时直接用上次保存的排名选节点，不阻塞在测速上；配置未变化时不重写规则
+                with CallProfiler.span("--silent"):
+                    sys.exit(self.apply(quiet=True))
             sys.exit(0)
 
         # 初始化环境
@@ -589,36 +6948,54 @@ WantedBy=default.target'''
         # 开启状态栏的情况下，启动后台监控
         if self.status_bar_enabled:
             self._start_speed_monitor()
+        self._start_trace2_socket()
 
         # 注册退出钩子，重置终端状态
         import atexit
         atexit.register(self._reset_terminal)
         atexit.register(self._stop_speed_monitor)
+        atexit.register(self._trace2_stop_flag.set)
 
         # 主交互循环
         while True:
             self.show_menu()
-            choice = input("请选择操作 (1-7): ").strip()
+            choice = input("请选择操作 (1-11): ").strip()
 
-            if choice == "1":
-                self.set_accelerate()
-            elif choice == "2":
-                self.test_accelerate()
-            elif choice == "3":
-                self.manage_auto_start()
-            elif choice == "4":
-                self.clean_menu()
-            elif choice == "5":
-                self.reset_all()
-            elif choice == "6":
-                self.toggle_status_bar()
-            elif choice == "7":
-                print("\n[信息] 退出工具，再见！")
-                sys.exit(0)
-            else:
-                print("[错误] 无效选项，请重新输入")
+            # 开启剖析时每个菜单操作记为一个区间
+            with CallProfiler.span(f"menu:{choice}"):
+                if choice == "1":
+                    self.set_accelerate()
+                elif choice == "2":
+                    self.test_accelerate()
+                elif choice == "3":
+                    self.manage_auto_start()
+                elif choice == "4":
+                    self.clean_menu()
+                elif choice == "5":
+                    self.reset_all()
+                elif choice == "6":
+                    self.toggle_status_bar()
+                elif choice == "7":
+                    self.manage_endpoints()
+                elif choice == "8":
+                    self.manage_routes()
+                elif choice == "9":
+                    self.manage_telemetry()
+                elif choice == "10":
+                    self.manage_perf_profile()
+                elif choice == "11":
+                    print("\n[信息] 退出工具，再见！")
+                    sys.exit(0)
+                else:
+                    print("[错误] 无效选项，请重新输入")
 
 
 if __name__ == "__main__":
+    # --profile / --cprofile 在其余参数解析前识别并移除
+    CallProfiler.from_argv(sys.argv)
+    # 规则已是最新时的 apply/status 不构造完整工具，保证开机自启与 shell 提示符调用足够快
+    fast_exit = _fast_command(sys.argv[1:])
+    if fast_exit is not None:
+        sys.exit(fast_exit)
     proxy = GitHubCFProxy()
     proxy.run()
\ No newline at end of file
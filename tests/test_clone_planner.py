@@ -0,0 +1,50 @@
+"""ClonePlanner 回归测试：超出时间预算时的回退选择与历史裁剪
+
+不执行 git，只用临时目录中的历史文件；可用 python -m pytest 或 python -m unittest 运行。
+"""
+
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import github_cf_proxy as proxy  # noqa: E402
+
+
+class ClonePlannerTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix="cfproxy-test-")
+        self.history_file = Path(self._tmp.name) / "clone_history.jsonl"
+        self.planner = proxy.ClonePlanner(self.history_file)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_fallback_ranks_unknown_estimates_last(self):
+        # 仓库大小未知：full/shallow 无法预估，blobless 有上次的实际接收量（远超预算）
+        self.planner.history = [{"url": "u", "strategy": "blobless", "bytes": 20 * 1024 ** 3, "size": 0}]
+        plan = self.planner.plan("u", "build", 0, 1e6, {"ok": True, "filter": True, "seconds": 1.0})
+        self.assertIsNone(plan["estimates"]["full"]["seconds"])
+        self.assertEqual(plan["strategy"], "blobless")
+
+    def test_fallback_picks_fastest_estimate(self):
+        plan = self.planner.plan("u", "build", 10 * 1024 ** 3, 1e6, {"ok": True, "filter": True, "seconds": 1.0})
+        self.assertTrue(all(e["seconds"] > proxy.CLONE_TIME_BUDGET for e in plan["estimates"].values()))
+        self.assertEqual(plan["strategy"], "shallow")
+
+    def test_record_trims_history_atomically(self):
+        with mock.patch.object(proxy, "CLONE_MAX_RECORDS", 3):
+            for index in range(5):
+                self.planner.record({"url": f"u{index}", "strategy": "full"})
+        lines = self.history_file.read_text(encoding="utf-8").splitlines()
+        self.assertEqual([json.loads(line)["url"] for line in lines], ["u2", "u3", "u4"])
+        self.assertFalse(self.history_file.with_name(self.history_file.name + ".tmp").exists())
+        self.assertEqual([r["url"] for r in proxy.ClonePlanner(self.history_file).history], ["u2", "u3", "u4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+"""ContentCache 回归测试：按最近使用淘汰、索引写回，以及经 AsyncRelay 的条件请求重新验证与并发请求合并
+
+缓存目录在临时目录中，上游是本机回环上的假服务器，不访问网络；可用 python -m pytest 或 python -m unittest 运行。
+"""
+
+import hashlib
+import http.client
+import http.server
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import github_cf_proxy as proxy  # noqa: E402
+
+
+class ContentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix="cfproxy-test-")
+        self.root = Path(self._tmp.name) / "cache"
+        self.cache = proxy.ContentCache(self.root, max_bytes=100)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def put(self, key: str, body: bytes, last_used: float):
+        tmp, digest = self.cache.begin()
+        tmp.write(body)
+        digest.update(body)
+        self.cache.store(key, tmp, digest.hexdigest(), len(body), [("ETag", '"x"')], False)
+        self.cache.entries[key]["last_used"] = last_used
+
+    def test_evicts_least_recently_used(self):
+        self.put("a", b"a" * 40, 1)
+        self.put("b", b"b" * 40, 3)
+        self.put("c", b"c" * 40, 2)
+        # 超出上限时移除最久未用的 a，其内容文件一并删除
+        self.assertEqual(sorted(self.cache.entries), ["b", "c"])
+        self.assertEqual(self.cache.total_bytes(), 80)
+        self.assertFalse(self.cache.blob_path(hashlib.sha256(b"a" * 40).hexdigest()).exists())
+        self.cache.hit("c")
+        self.put("d", b"d" * 40, time.time() + 1)
+        self.assertEqual(sorted(self.cache.entries), ["c", "d"])
+
+    def test_shared_content_kept_while_referenced(self):
+        self.put("a", b"x" * 60, 1)
+        self.put("b", b"x" * 60, 2)
+        # 两个地址共用一份内容，总大小只计一次
+        self.assertEqual(self.cache.total_bytes(), 60)
+        self.put("c", b"c" * 30, 3)
+        self.assertEqual(self.cache.total_bytes(), 90)
+        self.put("d", b"d" * 30, 4)
+        # 移除 a 后内容仍被 b 引用，不减少总量，继续移除 b 才删除内容
+        self.assertEqual(sorted(self.cache.entries), ["c", "d"])
+        self.assertFalse(self.cache.blob_path(hashlib.sha256(b"x" * 60).hexdigest()).exists())
+
+    def test_store_writes_index_immediately(self):
+        self.put("a", b"a" * 10, 1)
+        self.put("b", b"b" * 10, 2)
+        # 入库不受写回节流影响：随后进程退出也不会留下索引之外的内容文件
+        reopened = proxy.ContentCache(self.root, max_bytes=100)
+        self.assertEqual(sorted(reopened.entries), ["a", "b"])
+        self.assertEqual(reopened.stats["misses"], 2)
+
+
+class Upstream:
+    """按路径返回 (ETag, 内容)，支持 If-None-Match；gate 未放行时请求在上游挂起"""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.gate = threading.Event()
+        self.gate.set()
+        upstream = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                upstream.requests.append((self.path, self.headers.get("If-None-Match")))
+                upstream.gate.wait(10)
+                etag, body = upstream.files[self.path]
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.gate.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CachedRelayTest(unittest.TestCase):
+    BRANCH = "/raw/o/r/main/README"
+    PINNED = "/raw/o/r/" + "a" * 40 + "/README"
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix="cfproxy-test-")
+        self.cache = proxy.ContentCache(Path(self._tmp.name) / "cache")
+        self.upstream = Upstream()
+        self.upstream.files = {"/o/r/main/README": ('"v1"', b"hello v1"),
+                               "/o/r/" + "a" * 40 + "/README": ('"p"', b"pinned")}
+        self.relay = proxy.AsyncRelay(upstreams={"raw.githubusercontent.com": self.upstream.url}, cache=self.cache)
+        self.host, self.port = self.relay.start()
+
+    def tearDown(self):
+        self.upstream.close()
+        self.relay.stop()
+        self._tmp.cleanup()
+
+    def get(self, path: str):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=10)
+        try:
+            conn.request("GET", path)
+            resp = conn.getresponse()
+            return resp.getheader("X-Cache"), resp.read()
+        finally:
+            conn.close()
+
+    def test_pinned_path_served_without_upstream(self):
+        self.assertEqual(self.get(self.PINNED), ("MISS", b"pinned"))
+        self.assertEqual(self.get(self.PINNED), ("HIT", b"pinned"))
+        self.assertEqual(len(self.upstream.requests), 1)
+
+    def test_revalidates_branch_path(self):
+        self.assertEqual(self.get(self.BRANCH), ("MISS", b"hello v1"))
+        self.assertEqual(self.get(self.BRANCH), ("REVALIDATED", b"hello v1"))
+        self.assertEqual(self.upstream.requests[-1], ("/o/r/main/README", '"v1"'))
+        # 上游内容更新后按新版本返回并替换缓存
+        self.upstream.files["/o/r/main/README"] = ('"v2"', b"hello v2")
+        self.assertEqual(self.get(self.BRANCH), ("MISS", b"hello v2"))
+        self.assertEqual(self.get(self.BRANCH), ("REVALIDATED", b"hello v2"))
+        self.assertEqual((self.cache.stats["revalidated"], self.cache.stats["misses"]), (2, 2))
+
+    def test_coalesces_concurrent_requests(self):
+        self.upstream.gate.clear()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.get(self.BRANCH))) for _ in range(3)]
+        threads[0].start()
+        deadline = time.time() + 5
+        while not self.upstream.requests and time.time() < deadline:
+            time.sleep(0.01)
+        # 第一个请求已到达上游并挂起，其余请求等待它的结果而不再访问上游
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.3)
+        self.upstream.gate.set()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(len(self.upstream.requests), 1)
+        self.assertEqual(sorted(results), [("HIT", b"hello v1"), ("HIT", b"hello v1"), ("MISS", b"hello v1")])
+        self.assertEqual(self.cache.stats["coalesced"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
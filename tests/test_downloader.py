@@ -0,0 +1,164 @@
+"""SegmentedDownloader 回环测试：分段下载、按状态文件断点续传与不支持 Range 时的单连接回退
+
+文件服务器运行在本机回环上，不访问网络；可用 python -m pytest 或 python -m unittest 运行。
+"""
+
+import hashlib
+import http.server
+import re
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import github_cf_proxy as proxy  # noqa: E402
+
+
+class FileServer:
+    """提供固定内容的文件；ranged=False 时忽略 Range 头返回整个文件（200），记录收到的 Range 头"""
+
+    def __init__(self, payload: bytes, ranged: bool = True, etag: str = '"v1"'):
+        self.payload = payload
+        self.ranged = ranged
+        self.etag = etag
+        self.ranges = []
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                requested = self.headers.get("Range")
+                server.ranges.append(requested)
+                match = re.fullmatch(r"bytes=(\d+)-(\d*)", requested or "")
+                if server.ranged and match:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2) or len(server.payload) - 1), len(server.payload) - 1)
+                    body = server.payload[start:end + 1]
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(server.payload)}")
+                else:
+                    body = server.payload
+                    self.send_response(200)
+                self.send_header("ETag", server.etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/o/r/releases/download/v1/asset.bin"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SegmentedDownloaderTest(unittest.TestCase):
+    SIZE = 10 * 1024 + 123
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix="cfproxy-test-")
+        self.output = Path(self._tmp.name) / "asset.bin"
+        self.payload = bytes(i * 7 % 251 for i in range(self.SIZE))
+        patcher = mock.patch.object(proxy, "DOWNLOAD_MIN_SEGMENT", 1024)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def serve(self, **kwargs) -> FileServer:
+        server = FileServer(self.payload, **kwargs)
+        self.addCleanup(server.close)
+        return server
+
+    def downloader(self, url: str, **kwargs) -> proxy.SegmentedDownloader:
+        return proxy.SegmentedDownloader(url, self.output, connections=3, timeout=10, **kwargs)
+
+    def test_segmented_download_with_checksum(self):
+        server = self.serve()
+        result = self.downloader(server.url, checksum="sha256:" + hashlib.sha256(self.payload).hexdigest()).run()
+        self.assertTrue(result["ranged"])
+        self.assertFalse(result["resumed"])
+        self.assertEqual(result["segments"], 11)
+        self.assertEqual(result["bytes"], self.SIZE)
+        self.assertEqual(self.output.read_bytes(), self.payload)
+        self.assertFalse(Path(str(self.output) + ".part").exists())
+        self.assertFalse(Path(str(self.output) + proxy.DOWNLOAD_STATE_SUFFIX).exists())
+
+    def interrupted(self, url: str, done: int) -> proxy.SegmentedDownloader:
+        """模拟中断：规划并写入前 done 个分段（最后一段只写一半），保存状态后退出"""
+        first = self.downloader(url)
+        first.probe()
+        first._plan()
+        first._preallocate()
+        with open(first.part_path, "r+b") as f:
+            for index, segment in enumerate(first.segments[:done]):
+                length = segment[1] - segment[0] + 1
+                segment[2] = length if index < done - 1 else length // 2
+                f.seek(segment[0])
+                f.write(self.payload[segment[0]:segment[0] + segment[2]])
+        first._save_state(force=True)
+        return first
+
+    def test_resumes_from_state_file(self):
+        server = self.serve()
+        first = self.interrupted(server.url, 4)
+        already = sum(segment[2] for segment in first.segments)
+        server.ranges.clear()
+        result = self.downloader(server.url).run()
+        self.assertTrue(result["resumed"])
+        self.assertEqual(result["transferred"], self.SIZE - already)
+        self.assertEqual(result["bytes"], self.SIZE)
+        self.assertEqual(self.output.read_bytes(), self.payload)
+        self.assertFalse(first.state_path.exists())
+        # 已完成的分段不再请求，写了一半的分段从断点处继续
+        starts = sorted(int(re.match(r"bytes=(\d+)-", r).group(1)) for r in server.ranges[1:])
+        self.assertEqual(starts[0], 3 * 1024 + 512)
+        self.assertEqual(len(starts), 11 - 3)
+
+    def test_discards_state_when_file_changed(self):
+        server = self.serve()
+        first = self.interrupted(server.url, 4)
+        # 服务器上的文件已更新（ETag 变化），旧的断点数据不能拼接
+        server.etag = '"v2"'
+        with open(first.part_path, "r+b") as f:
+            f.write(b"\xff" * 1024)
+        result = self.downloader(server.url).run()
+        self.assertFalse(result["resumed"])
+        self.assertEqual(result["transferred"], self.SIZE)
+        self.assertEqual(self.output.read_bytes(), self.payload)
+
+    def test_falls_back_when_range_ignored(self):
+        server = self.serve(ranged=False)
+        result = self.downloader(server.url).run()
+        self.assertFalse(result["ranged"])
+        self.assertEqual(result["bytes"], self.SIZE)
+        self.assertEqual(self.output.read_bytes(), self.payload)
+        # 探测请求之后只发出一个不带 Range 的完整请求，也不写状态文件
+        self.assertEqual(server.ranges, ["bytes=0-0", None])
+        self.assertFalse(Path(str(self.output) + proxy.DOWNLOAD_STATE_SUFFIX).exists())
+
+    def test_stale_state_ignored_when_range_unsupported(self):
+        server = self.serve()
+        self.interrupted(server.url, 2)
+        server.ranged = False
+        result = self.downloader(server.url).run()
+        self.assertFalse(result["resumed"])
+        self.assertEqual(self.output.read_bytes(), self.payload)
+        state = Path(str(self.output) + proxy.DOWNLOAD_STATE_SUFFIX)
+        # 单连接下载不使用旧状态；完成后状态文件一并清理
+        self.assertFalse(state.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
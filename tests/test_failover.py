@@ -0,0 +1,141 @@
+"""熔断与切换回归测试：CircuitBreaker 状态转换、按事件日志恢复熔断状态与窗口内降级时长统计
+
+事件日志写在临时目录中，不访问网络；可用 python -m pytest 或 python -m unittest 运行。
+"""
+
+import contextlib
+import io
+import json
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import github_cf_proxy as proxy  # noqa: E402
+
+Breaker = proxy.CircuitBreaker
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.breaker = Breaker(failure_threshold=3, recovery_threshold=2, cooldown=10, max_cooldown=30)
+
+    def test_closed_open_half_open_closed(self):
+        b = self.breaker
+        self.assertIsNone(b.record(False, "超时", now=1000))
+        self.assertIsNone(b.record(False, "超时", now=1001))
+        self.assertEqual(b.record(False, "超时", now=1002), Breaker.OPEN)
+        self.assertFalse(b.allows)
+        self.assertEqual((b.trips, b.degraded_since, b.reason), (1, 1002, "超时"))
+        # 冷却期内的健康结论不改变状态
+        self.assertIsNone(b.record(True, now=1011))
+        self.assertEqual(b.record(True, now=1012), Breaker.HALF_OPEN)
+        self.assertFalse(b.allows)
+        self.assertEqual(b.record(True, now=1013), Breaker.CLOSED)
+        self.assertTrue(b.allows)
+        self.assertEqual((b.degraded_seconds, b.degraded_since, b.reason), (11, 0.0, ""))
+        self.assertEqual(b.degraded_total(now=5000), 11)
+
+    def test_healthy_sample_resets_failure_count(self):
+        b = self.breaker
+        for healthy in (False, False, True, False, False):
+            self.assertIsNone(b.record(healthy, now=1000))
+        self.assertEqual(b.state, Breaker.CLOSED)
+
+    def test_failed_trial_reopens_with_backoff(self):
+        b = self.breaker
+        for now in (1000, 1001, 1002):
+            b.record(False, "HTTP 502", now=now)
+        self.assertEqual(b.record(True, now=1012), Breaker.HALF_OPEN)
+        # 试探失败：重新断开，冷却加倍，但仍是同一次降级
+        self.assertEqual(b.record(False, "HTTP 502", now=1013), Breaker.OPEN)
+        self.assertEqual((b.cooldown, b.trips, b.degraded_since), (20, 1, 1002))
+        self.assertIsNone(b.record(True, now=1032))
+        self.assertEqual(b.record(True, now=1033), Breaker.HALF_OPEN)
+        self.assertEqual(b.record(False, now=1034), Breaker.OPEN)
+        self.assertEqual(b.cooldown, 30)
+        self.assertEqual(b.record(True, now=1064), Breaker.HALF_OPEN)
+        self.assertEqual(b.record(True, now=1065), Breaker.CLOSED)
+        # 恢复后冷却回到初始值，降级时长从第一次断开算起
+        self.assertEqual((b.cooldown, b.degraded_seconds), (10, 63))
+        self.assertEqual(b.degraded_total(now=2000), 63)
+
+
+class FailoverLogTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix="cfproxy-test-")
+        self.log_file = Path(self._tmp.name) / "failover.jsonl"
+        patcher = mock.patch.object(proxy, "FAILOVER_LOG_FILE", self.log_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = time.time()
+        # 不构造完整的 GitHubCFProxy（会读写家目录中的配置与时序库），只准备熔断相关属性
+        self.app = proxy.GitHubCFProxy.__new__(proxy.GitHubCFProxy)
+        self.app.worker_endpoints = ["a.example.com", "b.example.com", "c.example.com"]
+        self.app.breakers = {}
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def write_events(self, events):
+        with open(self.log_file, "w", encoding="utf-8") as f:
+            for endpoint, state, age in events:
+                record = {"ts": self.now - age, "endpoint": endpoint, "state": state, "reason": state}
+                f.write(json.dumps(record) + "\n")
+            f.write("{损坏的行\n")
+
+    def test_restore_breakers_from_log(self):
+        self.write_events([
+            ("a.example.com", Breaker.OPEN, 300), ("a.example.com", Breaker.CLOSED, 200),
+            ("b.example.com", Breaker.OPEN, 100), ("b.example.com", Breaker.HALF_OPEN, 60),
+            ("b.example.com", Breaker.OPEN, 59), ("b.example.com", "active", 50),
+            ("removed.example.com", Breaker.OPEN, 10),
+        ])
+        self.app._restore_breakers()
+        # 已恢复的节点与已从节点池移除的节点不恢复熔断
+        self.assertEqual(list(self.app.breakers), ["b.example.com"])
+        breaker = self.app.breakers["b.example.com"]
+        self.assertEqual(breaker.state, Breaker.OPEN)
+        self.assertFalse(breaker.allows)
+        self.assertEqual(breaker.reason, Breaker.OPEN)
+        self.assertAlmostEqual(breaker.degraded_since, self.now - 100)
+        self.assertAlmostEqual(breaker.degraded_total(now=self.now), 100)
+
+    def test_failover_summary_clips_to_window(self):
+        self.write_events([
+            # 窗口外开始、窗口内恢复：只计窗口内的 20 秒，不计熔断次数
+            ("a.example.com", Breaker.OPEN, 150), ("a.example.com", Breaker.CLOSED, 80),
+            # 半开试探失败后的再次断开属于同一次降级
+            ("b.example.com", Breaker.OPEN, 50), ("b.example.com", Breaker.HALF_OPEN, 40),
+            ("b.example.com", Breaker.OPEN, 39), ("b.example.com", Breaker.CLOSED, 10),
+            # 仍在降级：计到当前时刻
+            ("c.example.com", Breaker.OPEN, 30),
+            # 整段在窗口外：不出现在统计中
+            ("d.example.com", Breaker.OPEN, 300), ("d.example.com", Breaker.CLOSED, 200),
+        ])
+        summary = proxy.GitHubCFProxy._failover_summary(100)
+        self.assertEqual(sorted(summary), ["a.example.com", "b.example.com", "c.example.com"])
+        self.assertEqual([summary[ep]["trips"] for ep in sorted(summary)], [0, 1, 1])
+        self.assertAlmostEqual(summary["a.example.com"]["degraded_seconds"], 20, delta=0.01)
+        self.assertAlmostEqual(summary["b.example.com"]["degraded_seconds"], 40, delta=0.01)
+        self.assertAlmostEqual(summary["c.example.com"]["degraded_seconds"], 30, delta=1)
+
+    def test_log_trims_past_threshold(self):
+        with mock.patch.object(proxy, "FAILOVER_MAX_RECORDS", 5), \
+                mock.patch.object(proxy, "FAILOVER_TRIM_BYTES", 1000), \
+                contextlib.redirect_stdout(io.StringIO()):
+            for index in range(30):
+                self.app._log_failover("a.example.com", Breaker.OPEN, f"第{index}次")
+                self.assertLessEqual(self.log_file.stat().st_size, 1000 + 200)
+        reasons = [e["reason"] for e in self.app._load_failover_events()]
+        self.assertEqual(reasons[-1], "第29次")
+        self.assertGreaterEqual(len(reasons), 5)
+        self.assertFalse(self.log_file.with_name(self.log_file.name + ".tmp").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+"""GitConfigFile 回归测试：解析与差量写回的往返一致性
+
+只读写临时目录中的配置文件，不调用 git；可用 python -m pytest 或 python -m unittest 运行。
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import github_cf_proxy as proxy  # noqa: E402
+
+
+class GitConfigFileTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix="cfproxy-test-")
+        self.path = Path(self._tmp.name) / ".gitconfig"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def load(self, text: str) -> proxy.GitConfigFile:
+        self.path.write_bytes(text.encode("utf-8"))
+        return proxy.GitConfigFile(self.path)
+
+    def reread(self) -> proxy.GitConfigFile:
+        return proxy.GitConfigFile(self.path)
+
+    def test_untouched_file_round_trips(self):
+        text = ('# 注释\n[user]\n\tname = "A  B" ; 行内注释\n[include]\n\tpath = ~/.gitconfig.local\n'
+                '[alias]\n\tlg = log --graph \\\n\t\t--oneline\n')
+        cfg = self.load(text)
+        cfg.set_all("user.name", ["A  B"])
+        self.assertFalse(cfg.changed)
+        self.assertFalse(cfg.commit())
+        self.assertEqual(self.path.read_bytes().decode("utf-8"), text)
+
+    def test_quoting_and_escapes(self):
+        cfg = self.load('[core]\n\tpager = "less \\"-R\\"" # 注释\n\teditor = vim ; 注释\n')
+        self.assertEqual(cfg.get_all("core.pager"), ['less "-R"'])
+        self.assertEqual(cfg.get_all("core.editor"), ["vim"])
+        values = ["a#b", " lead", "tab\there", 'quo"te', "back\\slash", ""]
+        cfg.set_all("core.test", values)
+        self.assertTrue(cfg.commit())
+        self.assertEqual(self.reread().get_all("core.test"), values)
+
+    def test_continuation_lines(self):
+        cfg = self.load("[alias]\n\tlg = log \\\n\t--graph\n\tst = status\n")
+        # 与 git 一致：引号外的空白（含续行后的缩进）记为空格
+        self.assertEqual(cfg.get_all("alias.lg"), ["log  --graph"])
+        cfg.set_all("alias.lg", ["log --oneline"])
+        cfg.commit()
+        self.assertEqual(self.path.read_text(encoding="utf-8"), "[alias]\n\tlg = log --oneline\n\tst = status\n")
+
+    def test_crlf_preserved(self):
+        cfg = self.load("[user]\r\n\tname = A\r\n[core]\r\n\tautocrlf = true\r\n")
+        self.assertEqual(cfg.get_all("user.name"), ["A"])
+        self.assertEqual(cfg.get_all("core.autocrlf"), ["true"])
+        cfg.set_all("url.https://proxy/https://github.com/.insteadOf", ["https://github.com/"])
+        cfg.commit()
+        text = self.path.read_bytes().decode("utf-8")
+        self.assertTrue(text.startswith("[user]\r\n\tname = A\r\n[core]\r\n\tautocrlf = true\r\n"))
+        self.assertEqual(self.reread().get_all("url.https://proxy/https://github.com/.insteadOf"),
+                         ["https://github.com/"])
+
+    def test_old_style_section_header(self):
+        cfg = self.load("[Branch.Main]\n\tRemote = origin\n")
+        # 旧式 [section.subsection] 的子节不区分大小写，按小写匹配
+        self.assertEqual(cfg.get_all("branch.main.remote"), ["origin"])
+        cfg.set_all("branch.main.remote", ["upstream"])
+        cfg.commit()
+        self.assertEqual(self.path.read_text(encoding="utf-8"), "[Branch.Main]\n\tremote = upstream\n")
+
+    def test_key_on_section_header_line(self):
+        cfg = self.load('[url "https://a/"] insteadOf = https://github.com/\n[user]\n\tname = A\n')
+        self.assertEqual(cfg.get_all('url.https://a/.insteadof'), ["https://github.com/"])
+        cfg.set_all("url.https://a/.insteadOf", ["https://github.com/", "git@github.com:"])
+        cfg.commit()
+        self.assertEqual(self.reread().get_all("url.https://a/.insteadOf"), ["https://github.com/", "git@github.com:"])
+        self.assertEqual(self.reread().get_all("user.name"), ["A"])
+        cfg.unset_all("url.https://a/.insteadOf")
+        cfg.commit()
+        self.assertEqual(self.path.read_text(encoding="utf-8"), "[user]\n\tname = A\n")
+
+    def test_unset_all_prunes_empty_sections(self):
+        cfg = self.load('[url "https://p/"]\n\tinsteadOf = https://github.com/\n\tinsteadOf = https://gist.github.com/\n'
+                        '[url "https://q/"]\n\t# 保留注释\n\tinsteadOf = https://x/\n[user]\n\tname = A\n')
+        self.assertEqual(cfg.unset_all("url.https://p/.insteadOf", r"^https://gist\."), 1)
+        self.assertEqual(cfg.get_all("url.https://p/.insteadOf"), ["https://github.com/"])
+        self.assertEqual(cfg.unset_all("url.https://p/.insteadOf"), 1)
+        self.assertEqual(cfg.unset_all("url.https://q/.insteadOf"), 1)
+        self.assertEqual(cfg.unset_all("url.https://q/.insteadOf"), 0)
+        cfg.commit()
+        # 空节删除；仍有注释的节保留
+        self.assertEqual(self.path.read_text(encoding="utf-8"),
+                         '[url "https://q/"]\n\t# 保留注释\n[user]\n\tname = A\n')
+
+    def test_backup_created_once_and_rollback(self):
+        original = "[user]\n\tname = A\n"
+        cfg = self.load(original)
+        cfg.set_all("user.name", ["B"])
+        cfg.commit()
+        cfg.set_all("user.name", ["C"])
+        cfg.commit()
+        self.assertEqual(cfg.backup_path.read_text(encoding="utf-8"), original)
+        self.assertTrue(self.reread().rollback())
+        self.assertEqual(self.path.read_text(encoding="utf-8"), original)
+
+
+if __name__ == "__main__":
+    unittest.main()
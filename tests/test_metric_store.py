@@ -0,0 +1,124 @@
+"""MetricStore 回归测试：环形记录区写满回绕后的窗口查询、最近样本与最旧时间戳
+
+只读写临时目录中的时序文件；可用 python -m pytest 或 python -m unittest 运行。
+"""
+
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import github_cf_proxy as proxy  # noqa: E402
+
+
+class MetricStoreTest(unittest.TestCase):
+    CAPACITY = 10
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix="cfproxy-test-")
+        self.path = Path(self._tmp.name) / "metrics.bin"
+        self.store = proxy.MetricStore(self.path, capacity=self.CAPACITY)
+        self.now = int(time.time())
+
+    def tearDown(self):
+        self.store.close()
+        self._tmp.cleanup()
+
+    def fill(self, n: int):
+        """按时间顺序交替写入两个序列，第 i 个样本的时间戳为 now-n+i、值为 i"""
+        for index in range(n):
+            self.store.append("a" if index % 2 == 0 else "b", "ttfb", index, ts=self.now - n + index)
+
+    def test_window_across_wrap(self):
+        self.fill(25)
+        # 只剩最近 10 条（15..24），其物理位置从第 5 格开始回绕
+        self.assertEqual([v for _, v in self.store.window("a", "ttfb", 3600)], [16, 18, 20, 22, 24])
+        self.assertEqual([v for _, v in self.store.window("b", "ttfb", 3600)], [15, 17, 19, 21, 23])
+        # 窗口起点落在回绕点之后：now-6 起只有 19..24
+        self.assertEqual([v for _, v in self.store.window("a", "ttfb", 6)], [20, 22, 24])
+        self.assertEqual(self.store.window("a", "missing", 3600), [])
+
+    def test_last_across_wrap(self):
+        self.fill(25)
+        self.assertEqual([v for _, v in self.store.last("a", "ttfb", 3)], [20, 22, 24])
+        self.assertEqual([v for _, v in self.store.last("b", "ttfb", 100)], [15, 17, 19, 21, 23])
+        self.assertEqual([ts for ts, _ in self.store.last("b", "ttfb", 2)], [self.now - 4, self.now - 2])
+        # 时间窗口同样限制结果
+        self.assertEqual([v for _, v in self.store.last("a", "ttfb", 100, seconds=4)], [22, 24])
+        self.assertAlmostEqual(self.store.ewma("a", "ttfb", alpha=0.5, n=2), 23)
+
+    def test_oldest_only_once_full(self):
+        self.fill(self.CAPACITY - 1)
+        self.assertIsNone(self.store.oldest())
+        self.store.append("a", "ttfb", 0, ts=self.now)
+        self.assertEqual(self.store.oldest(), self.now - (self.CAPACITY - 1))
+        self.store.append("a", "ttfb", 0, ts=self.now)
+        self.assertEqual(self.store.oldest(), self.now - (self.CAPACITY - 2))
+
+    def test_reopen_keeps_records_and_rebuilds_on_capacity_change(self):
+        self.fill(25)
+        other = proxy.MetricStore(self.path, capacity=self.CAPACITY)
+        try:
+            self.assertEqual([v for _, v in other.last("a", "ttfb", 2)], [22, 24])
+            self.assertEqual(sorted(other.keys()), [("a", "ttfb"), ("b", "ttfb")])
+        finally:
+            other.close()
+        resized = proxy.MetricStore(self.path, capacity=self.CAPACITY * 2)
+        try:
+            self.assertEqual(resized.keys(), [])
+            self.assertIsNone(resized.oldest())
+        finally:
+            resized.close()
+
+    @unittest.skipIf(proxy.fcntl is None, "需要 fcntl 文件锁")
+    def test_open_waits_for_file_lock(self):
+        # 另一进程正在检查或重建文件（持有文件锁）时，打开方须等待，不能并发截断
+        self.store.close()
+        self.path.write_bytes(b"partial")
+        opened = []
+        with open(self.path, "rb") as holder:
+            proxy.fcntl.flock(holder.fileno(), proxy.fcntl.LOCK_EX)
+            thread = threading.Thread(target=lambda: opened.append(proxy.MetricStore(self.path, self.CAPACITY)))
+            thread.start()
+            thread.join(0.3)
+            self.assertTrue(thread.is_alive())
+            self.assertEqual(self.path.read_bytes(), b"partial")
+            proxy.fcntl.flock(holder.fileno(), proxy.fcntl.LOCK_UN)
+        thread.join(5)
+        self.store = opened[0]
+        self.assertEqual(self.store.keys(), [])
+
+    def test_concurrent_open_does_not_truncate(self):
+        # 各实例独立打开文件，只靠文件锁互斥（相当于守护进程与命令行同时启动）
+        self.store.close()
+        self.path.unlink()
+        errors = []
+
+        def worker(n):
+            try:
+                store = proxy.MetricStore(self.path, capacity=1000)
+                try:
+                    for index in range(50):
+                        store.append(f"n{n}", "ttfb", index, ts=self.now)
+                finally:
+                    store.close()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.store = proxy.MetricStore(self.path, capacity=1000)
+        for n in range(4):
+            self.assertEqual([v for _, v in self.store.window(f"n{n}", "ttfb", 3600)], list(range(50)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""模拟链路回归测试：固定随机种子运行 ProbeHarness，测速精度、节点排名与熔断切换退化时构建失败
+
+只使用本机回环上的模拟节点，不访问网络；可用 python -m pytest 或 python -m unittest 运行。
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import github_cf_proxy as proxy  # noqa: E402
+
+
+class ProbeHarnessTest(unittest.TestCase):
+    def setUp(self):
+        self.harness = proxy.ProbeHarness(proxy.SIM_ROUNDS, proxy.SIM_SEED)
+        self._tmp = tempfile.TemporaryDirectory(prefix="cfproxy-test-")
+        self.workdir = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_accuracy_within_gates(self):
+        for row in self.harness.accuracy():
+            if not row["gated"]:
+                continue
+            with self.subTest(link=row["link"]):
+                self.assertIsNotNone(row["ttfb_error_ms"], "首字节测速全部失败")
+                self.assertLessEqual(abs(row["ttfb_error_ms"]), proxy.SIM_MAX_TTFB_ERROR_MS)
+                self.assertIsNotNone(row["bandwidth_error"], "带宽测速全部失败")
+                self.assertLessEqual(abs(row["bandwidth_error"]), proxy.SIM_MAX_BANDWIDTH_ERROR)
+                self.assertGreaterEqual(row["ci_coverage"], proxy.SIM_MIN_CI_COVERAGE)
+                self.assertTrue(row["passed"])
+
+    def test_ranking_picks_best_endpoint(self):
+        result = self.harness.ranking(self.workdir)
+        self.assertTrue(result["top1_correct"], f"首选节点错误: 实测 {result['measured']}，理想 {result['ideal']}")
+        # 六组两两顺序中至多一组与理想排名不一致（错误率高的节点评分受随机失败影响）
+        self.assertGreaterEqual(result["pairwise_agreement"], 5 / 6, result["measured"])
+
+    def test_failover_detects_switches_and_recovers(self):
+        for mode in proxy.ProbeHarness.DEGRADATIONS:
+            with self.subTest(mode=mode):
+                result = self.harness.failover(self.workdir, mode)
+                self.assertIsNotNone(result["detect_cycles"], "熔断器未断开")
+                self.assertLessEqual(result["detect_cycles"], proxy.BREAKER_FAILURE_THRESHOLD)
+                self.assertIsNotNone(result["switch_cycles"], "未切换到备用节点")
+                self.assertLessEqual(result["switch_cycles"], result["detect_cycles"])
+                self.assertIsNotNone(result["recover_cycles"], "节点恢复后未重新启用")
+                self.assertLessEqual(result["recover_cycles"], proxy.BREAKER_RECOVERY_THRESHOLD + 2)
+                self.assertTrue(result["passed"])
+
+
+if __name__ == "__main__":
+    unittest.main()
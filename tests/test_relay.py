@@ -0,0 +1,141 @@
+"""AsyncRelay 回环测试：路径前缀路由、重定向改写与 LFS 批量接口改写
+
+上游是本机回环上的假服务器（按 --upstream HOST=URL 的方式接入），不访问网络；
+可用 python -m pytest 或 python -m unittest 运行。
+"""
+
+import gzip
+import http.client
+import http.server
+import json
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import github_cf_proxy as proxy  # noqa: E402
+
+
+class FakeUpstream:
+    """记录收到的请求 (方法, Host, 路径, 请求体)，按路径返回预设响应 (状态码, 头部, 响应体)"""
+
+    def __init__(self):
+        self.requests = []
+        self.responses = {}
+        upstream = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _reply(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                upstream.requests.append((self.command, self.headers.get("Host"), self.path, body))
+                status, headers, payload = upstream.responses.get(self.path, (200, {}, b"ok:" + self.path.encode()))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = _reply
+
+            def log_message(self, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class AsyncRelayTest(unittest.TestCase):
+    def setUp(self):
+        self.upstream = FakeUpstream()
+        hosts = ("github.com", "raw.githubusercontent.com", "objects.githubusercontent.com")
+        self.relay = proxy.AsyncRelay(upstreams={host: self.upstream.url for host in hosts})
+        host, port = self.relay.start()
+        self.base = f"http://{host}:{port}"
+        self.conn = http.client.HTTPConnection(host, port, timeout=10)
+
+    def tearDown(self):
+        self.conn.close()
+        self.relay.stop()
+        self.upstream.close()
+
+    def request(self, method, path, body=None, headers=None):
+        self.conn.request(method, path, body=body, headers=headers or {})
+        resp = self.conn.getresponse()
+        return resp, resp.read()
+
+    def test_routes_by_longest_prefix(self):
+        resp, body = self.request("GET", "/raw/octocat/Hello-World/master/README")
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(body, b"ok:/octocat/Hello-World/master/README")
+        self.assertEqual(resp.getheader("X-Accelerated-By"), "github-cf-proxy-relay")
+        # 未匹配其他前缀的路径转发 github.com；同一客户端连接可继续复用
+        resp, body = self.request("GET", "/octocat/Hello-World/info/refs?service=git-upload-pack")
+        self.assertEqual(body, b"ok:/octocat/Hello-World/info/refs?service=git-upload-pack")
+        self.assertEqual([(r[1], r[2]) for r in self.upstream.requests], [
+            ("raw.githubusercontent.com", "/octocat/Hello-World/master/README"),
+            ("github.com", "/octocat/Hello-World/info/refs?service=git-upload-pack"),
+        ])
+
+    def test_rewrites_redirects_to_routed_hosts(self):
+        self.upstream.responses["/o/r/releases/download/v1/a.zip"] = (
+            302, {"Location": "https://objects.githubusercontent.com/github-production-release-asset/1?sig=x"}, b"")
+        self.upstream.responses["/o/r/elsewhere"] = (302, {"Location": "https://example.com/file"}, b"")
+        resp, _ = self.request("GET", "/o/r/releases/download/v1/a.zip")
+        self.assertEqual(resp.status, 302)
+        self.assertEqual(resp.getheader("Location"), f"{self.base}/objects/github-production-release-asset/1?sig=x")
+        # 跟随改写后的地址仍经本中转到达对应上游
+        resp, body = self.request("GET", "/objects/github-production-release-asset/1?sig=x")
+        self.assertEqual(body, b"ok:/github-production-release-asset/1?sig=x")
+        self.assertEqual(self.upstream.requests[-1][1], "objects.githubusercontent.com")
+        # 路由表外的主机不改写
+        resp, _ = self.request("GET", "/o/r/elsewhere")
+        self.assertEqual(resp.getheader("Location"), "https://example.com/file")
+
+    def batch_response(self):
+        return {"transfer": "basic", "objects": [{
+            "oid": "a" * 64, "size": 3,
+            "actions": {"download": {"href": "https://objects.githubusercontent.com/lfs/aaa?token=t",
+                                     "header": {"Authorization": "RemoteAuth x"}},
+                        "upload": {"href": "https://objects.githubusercontent.com/upload/aaa"}},
+        }]}
+
+    def test_rewrites_lfs_batch_download_hrefs(self):
+        path = "/o/r.git" + proxy.LFS_BATCH_SUFFIX
+        self.upstream.responses[path] = (200, {"Content-Type": "application/vnd.git-lfs+json"},
+                                         json.dumps(self.batch_response()).encode())
+        request = json.dumps({"operation": "download", "objects": [{"oid": "a" * 64, "size": 3}]}).encode()
+        resp, body = self.request("POST", path, request, {"Content-Type": "application/vnd.git-lfs+json"})
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(int(resp.getheader("Content-Length")), len(body))
+        actions = json.loads(body)["objects"][0]["actions"]
+        self.assertEqual(actions["download"]["href"], f"{self.base}/objects/lfs/aaa?token=t")
+        self.assertEqual(actions["download"]["header"], {"Authorization": "RemoteAuth x"})
+        # 上传地址保持原样，大对象不经中转
+        self.assertEqual(actions["upload"]["href"], "https://objects.githubusercontent.com/upload/aaa")
+        self.assertEqual(self.upstream.requests[-1][::3], ("POST", request))
+
+    def test_rewrites_gzip_lfs_batch(self):
+        path = "/o/r.git" + proxy.LFS_BATCH_SUFFIX
+        self.upstream.responses[path] = (200, {"Content-Encoding": "gzip"},
+                                         gzip.compress(json.dumps(self.batch_response()).encode()))
+        resp, body = self.request("POST", path, b"{}", {"Content-Type": "application/vnd.git-lfs+json"})
+        # 改写后以未压缩的 JSON 返回
+        self.assertIsNone(resp.getheader("Content-Encoding"))
+        self.assertEqual(json.loads(body)["objects"][0]["actions"]["download"]["href"],
+                         f"{self.base}/objects/lfs/aaa?token=t")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Trace2Collector 回归测试：记录文件的追加与裁剪
+
+只读写临时目录中的记录文件；可用 python -m pytest 或 python -m unittest 运行。
+"""
+
+import json
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import github_cf_proxy as proxy  # noqa: E402
+
+
+class Trace2CollectorAppendTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory(prefix="cfproxy-test-")
+        self.store_file = Path(self._tmp.name) / "telemetry.jsonl"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def read(self):
+        return [json.loads(line) for line in self.store_file.read_text(encoding="utf-8").splitlines()]
+
+    def test_trims_only_past_size_threshold(self):
+        collector = proxy.Trace2Collector(self.store_file)
+        with mock.patch.object(proxy, "TELEMETRY_MAX_RECORDS", 10), \
+                mock.patch.object(proxy, "TELEMETRY_TRIM_BYTES", 2000):
+            for index in range(40):
+                collector.append([{"ts": index, "op": "fetch"}])
+                size = self.store_file.stat().st_size
+                self.assertLessEqual(size, 2000 + 100)
+            records = self.read()
+        # 未到阈值时不裁剪，条数可以暂时超过保留条数
+        self.assertGreater(len(records), 10)
+        self.assertEqual(records[-1]["ts"], 39)
+        self.assertEqual([r["ts"] for r in records], list(range(records[0]["ts"], 40)))
+        self.assertFalse(self.store_file.with_name(self.store_file.name + ".tmp").exists())
+
+    def test_concurrent_writers_lose_nothing(self):
+        # 两个实例各有进程内锁，只靠文件锁互斥（相当于守护进程与 git 进程同时写入）；
+        # 阈值很小而保留条数足够，之后每次追加都会替换文件但不应丢掉任何记录
+        writers = [proxy.Trace2Collector(self.store_file) for _ in range(2)]
+        with mock.patch.object(proxy, "TELEMETRY_MAX_RECORDS", 1000), \
+                mock.patch.object(proxy, "TELEMETRY_TRIM_BYTES", 3000):
+            threads = [threading.Thread(target=lambda w=w, n=n: [w.append([{"ts": i, "writer": n}]) for i in range(200)])
+                       for n, w in enumerate(writers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        records = self.read()
+        self.assertEqual(len(records), 400)
+        for n in range(2):
+            self.assertEqual([r["ts"] for r in records if r["writer"] == n], list(range(200)))
+
+
+if __name__ == "__main__":
+    unittest.main()
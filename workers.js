@@ -2,6 +2,23 @@
 const ACCELERATE_DOMAIN = "github.your.workers.domain.com"; // 你的自定义加速域名
 // =======================================
 
+// 路径前缀 → 上游主机（最长前缀优先，未匹配的请求转发到 github.com）
+// ========== 路由表 BEGIN（由 github_cf_proxy.py 按配置生成） ==========
+const ROUTES = [
+  ['/release-assets/', 'release-assets.githubusercontent.com'],
+  ['/lfs-cloud/', 'github-cloud.githubusercontent.com'],
+  ['/gist-web/', 'gist.github.com'],
+  ['/codeload/', 'codeload.github.com'],
+  ['/objects/', 'objects.githubusercontent.com'],
+  ['/lfs-s3/', 'github-cloud.s3.amazonaws.com'],
+  ['/media/', 'media.githubusercontent.com'],
+  ['/gist/', 'gist.githubusercontent.com'],
+  ['/raw/', 'raw.githubusercontent.com'],
+  ['/api/', 'api.github.com'],
+  ['/', 'github.com'],
+]
+// ========== 路由表 END ==========
+
 addEventListener('fetch', event => {
   event.respondWith(handleRequest(event.request))
 })
@@ -10,13 +27,12 @@ async function handleRequest(request) {
   const url = new URL(request.url)
   let targetUrl = url.href.replace(url.origin, 'https://github.com')
 
-  // 适配 Raw/Gist/Git 资源
-  if (url.pathname.startsWith('/raw/')) {
-    targetUrl = url.href.replace(url.origin + '/raw', 'https://raw.githubusercontent.com')
-  } else if (url.pathname.startsWith('/gist/')) {
-    targetUrl = url.href.replace(url.origin + '/gist', 'https://gist.githubusercontent.com')
-  } else if (url.pathname.startsWith('/gist-web/')) {
-    targetUrl = url.href.replace(url.origin + '/gist-web', 'https://gist.github.com')
+  // 按路由表适配 Raw/Gist/Codeload/Objects/API 等资源
+  for (const [prefix, host] of ROUTES) {
+    if (url.pathname.startsWith(prefix)) {
+      targetUrl = 'https://' + host + '/' + url.pathname.slice(prefix.length) + url.search
+      break
+    }
   }
 
   // 修复请求头，模拟正常访问
@@ -36,8 +52,15 @@ async function handleRequest(request) {
 
   try {
     const response = await fetch(newRequest)
+    // Git LFS 批量接口：对象下载地址改写为经 Worker 的地址，使对象下载同样走加速
+    const isLfsBatch = request.method === 'POST' && url.pathname.endsWith('/info/lfs/objects/batch')
+    const body = isLfsBatch && response.ok ? await rewriteLfsBatch(response, url.origin) : response.body
     // 构造新响应，添加自定义加速头
-    const newResponse = new Response(response.body, response)
+    const newResponse = new Response(body, response)
+    if (body !== response.body) {
+      newResponse.headers.delete('Content-Length')
+      newResponse.headers.delete('Content-Encoding')
+    }
     
     // ========== 添加自定义 HTTP 头 ==========
     newResponse.headers.set('X-Accelerated-By', ACCELERATE_DOMAIN)
@@ -49,4 +72,19 @@ async function handleRequest(request) {
   } catch (e) {
     return new Response(`Worker 转发失败: ${e.message}`, { status: 502 })
   }
-}
\ No newline at end of file
+}
+
+// 把 LFS 批量接口响应中的对象下载地址改写为 <Worker>/<前缀>/...（上传/校验地址保持原样，避免大对象受 Worker 请求体大小限制）
+async function rewriteLfsBatch(response, origin) {
+  const data = await response.json()
+  for (const object of data.objects || []) {
+    const download = object.actions && object.actions.download
+    if (!download || !download.href) continue
+    const href = new URL(download.href)
+    const route = ROUTES.find(([prefix, host]) => host === href.host && prefix !== '/')
+    if (route) {
+      download.href = origin + route[0] + href.pathname.slice(1) + href.search
+    }
+  }
+  return JSON.stringify(data)
+}